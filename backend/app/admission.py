@@ -0,0 +1,238 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional, Tuple
+
+from .database import ChatStore, refill_bucket
+
+
+class Rejected(Exception):
+    """A request turned away by admission control (429 or 503 with Retry-After)"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.detail = detail
+
+
+class LocalTokenBuckets:
+    """Token buckets kept in this process.
+
+    Only the least recently used ``max_keys`` buckets are kept; a forgotten
+    bucket comes back full, which at worst lets an idle client burst again.
+    """
+
+    def __init__(self, max_keys: int = 100000, clock: Callable[[], float] = time.time):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Take ``cost`` tokens if the bucket has them; return (allowed, tokens left)"""
+        now = self.clock()
+        state = self._buckets.get(key)
+        tokens = refill_bucket(state, now, rate, burst)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class StoreTokenBuckets:
+    """Token buckets kept in the chat store, shared by every worker using it"""
+
+    def __init__(self, store: ChatStore, clock: Callable[[], float] = time.time):
+        self.store = store
+        self.clock = clock
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        return self.store.take_tokens(key, rate, burst, cost, self.clock())
+
+
+class RateLimit:
+    """``per_minute`` requests per key with bursts of up to ``burst``; 0 disables"""
+
+    def __init__(self, name: str, per_minute: float, burst: float):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = max(1.0, burst)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def retry_after(self, tokens: float, cost: float = 1.0) -> float:
+        return (cost - tokens) / self.rate
+
+
+class LLMGate:
+    """Cap on model calls in flight, with a short bounded queue in front.
+
+    Up to ``limit`` callers hold a slot at once. Up to ``max_waiting`` more
+    wait in arrival order for at most ``timeout`` seconds; anyone beyond
+    that is turned away at once with 503, as is a waiter that times out.
+    Retry-After is estimated from the queue length and how long slots have
+    recently been held.
+    """
+
+    def __init__(self, limit: int = 16, max_waiting: int = 64, timeout: float = 10.0):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: deque = deque()
+        # Moving average of how long a slot is held, for Retry-After
+        self.hold_seconds = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        return (len(self._waiters) + 1) / self.limit * self.hold_seconds
+
+    async def acquire(self) -> float:
+        """Wait for a slot; return the time it was granted. Raises Rejected."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return time.perf_counter()
+        if len(self._waiters) >= self.max_waiting:
+            raise Rejected(503, "queue_full", self.retry_after(), "Too many questions waiting for the model")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Rejected(503, "queue_timeout", self.retry_after(), "Timed out waiting for the model")
+        return time.perf_counter()
+
+    def _release(self):
+        # Hand the slot straight to the next waiter, so nobody can jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def release(self, granted_at: float):
+        self.hold_seconds = 0.9 * self.hold_seconds + 0.1 * (time.perf_counter() - granted_at)
+        self._release()
+
+
+class LLMSlot:
+    """One admitted model call; release it once, however the request ends"""
+
+    __slots__ = ("gate", "granted_at")
+
+    def __init__(self, gate: LLMGate, granted_at: float):
+        self.gate = gate
+        self.granted_at = granted_at
+
+    def release(self):
+        if self.gate is not None:
+            gate, self.gate = self.gate, None
+            gate.release(self.granted_at)
+
+    # A streamed answer whose body never runs would otherwise keep its slot
+    __del__ = release
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """Decide which chat requests get in, and which may call the model.
+
+    ``check()`` applies the per-client and per-chat token buckets to every
+    request (429 when a bucket is empty). Answers that need no model call
+    (fixed queries, cache hits) stop there. Everything else calls
+    ``llm_slot()``, which takes a token from the optional global model-call
+    bucket (the API quota, shared by all workers when the buckets live in
+    the store) and then waits for a slot in the LLM gate (503 when either
+    is exhausted).
+    """
+
+    def __init__(
+        self,
+        buckets,
+        per_client: RateLimit,
+        per_chat: RateLimit,
+        llm_quota: RateLimit,
+        gate: LLMGate,
+    ):
+        self.buckets = buckets
+        self.per_client = per_client
+        self.per_chat = per_chat
+        self.llm_quota = llm_quota
+        self.gate = gate
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    def _reject(self, rejection: Rejected) -> Rejected:
+        self.rejected[rejection.reason] = self.rejected.get(rejection.reason, 0) + 1
+        return rejection
+
+    async def _take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        # Store-backed buckets are a database round trip; keep it off the loop
+        if isinstance(self.buckets, StoreTokenBuckets):
+            return await asyncio.to_thread(self.buckets.take, key, rate, burst)
+        return self.buckets.take(key, rate, burst)
+
+    async def check(self, client: str, chat_id: Optional[str] = None):
+        """Charge one request to its client and chat; raises Rejected (429)"""
+        for limit, key in ((self.per_client, client), (self.per_chat, chat_id)):
+            if not limit.enabled or not key:
+                continue
+            allowed, tokens = await self._take(f"{limit.name}:{key}", limit.rate, limit.burst)
+            if not allowed:
+                raise self._reject(Rejected(
+                    429, limit.name, limit.retry_after(tokens), f"Too many requests for this {limit.name}"
+                ))
+        self.admitted += 1
+
+    async def llm_slot(self) -> LLMSlot:
+        """Admit one model call; raises Rejected (503) when over quota or too busy"""
+        if self.llm_quota.enabled:
+            allowed, tokens = await self._take(self.llm_quota.name, self.llm_quota.rate, self.llm_quota.burst)
+            if not allowed:
+                raise self._reject(Rejected(
+                    503, self.llm_quota.name, self.llm_quota.retry_after(tokens), "Model quota used up for now"
+                ))
+        try:
+            return LLMSlot(self.gate, await self.gate.acquire())
+        except Rejected as rejection:
+            raise self._reject(rejection)
+
+    def stats(self) -> dict:
+        return {
+            "buckets": type(self.buckets).__name__,
+            "limits": {
+                limit.name: {"per_minute": limit.rate * 60, "burst": limit.burst}
+                for limit in (self.per_client, self.per_chat, self.llm_quota)
+            },
+            "llm_active": self.gate.active,
+            "llm_waiting": self.gate.waiting,
+            "llm_limit": self.gate.limit,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
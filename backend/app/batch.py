@@ -0,0 +1,201 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+
+from .database import ChatStore
+
+
+class BatchRunner:
+    """Answer batches of independent questions in the background.
+
+    ``submit()`` stores the questions as a job and starts answering them.
+    Questions ``answer_fixed`` can answer (fixed queries) are completed in
+    one write up front; the rest are grouped by ``key`` so identical
+    questions are answered once, with at most ``concurrency`` answers in
+    flight per job. Every answer is written to the store as it arrives.
+
+    The job's ``updated_at`` doubles as its owner's heartbeat. A job whose
+    owner has not checked in for ``stale_after`` seconds (the worker was
+    restarted or died) is claimed by ``resume_stale()`` on any worker and
+    finished from where it stopped. Finished jobs are deleted
+    ``keep_finished`` seconds after they finish. Store calls run in worker
+    threads so they never hold up the event loop.
+    """
+
+    def __init__(
+        self,
+        store: ChatStore,
+        answer: Callable[[str], Awaitable[Tuple[str, str]]],
+        answer_fixed: Callable[[str], Optional[str]],
+        key: Callable[[str], str],
+        owner: str,
+        concurrency: int = 4,
+        stale_after: float = 60.0,
+        keep_finished: float = 86400.0,
+    ):
+        self.store = store
+        self.answer = answer
+        self.answer_fixed = answer_fixed
+        self.key = key
+        self.owner = owner
+        self.concurrency = concurrency
+        self.stale_after = stale_after
+        self.keep_finished = keep_finished
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # One event per reader of results(), set whenever its job makes progress
+        self._progress: Dict[str, Set[asyncio.Event]] = {}
+        self.started = 0
+        self.resumed = 0
+        self.answered = 0
+        self.deduplicated = 0
+        self.purged = 0
+
+    async def submit(self, messages: List[str]) -> dict:
+        """Store a new job and start answering it"""
+        job = await asyncio.to_thread(self.store.create_job, str(ObjectId()), messages, self.owner, datetime.now())
+        self.started += 1
+        self._start(job["job_id"])
+        return job
+
+    def _start(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+
+    def _notify(self, job_id: str):
+        for event in self._progress.get(job_id, ()):
+            event.set()
+
+    async def _complete(self, job_id: str, results: List[Tuple[int, str, str]]):
+        await asyncio.to_thread(self.store.complete_job_items, job_id, results, datetime.now())
+        self.answered += len(results)
+        self._notify(job_id)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.stale_after / 4)
+            await asyncio.to_thread(self.store.update_job, job_id, updated_at=datetime.now())
+
+    async def _answer_group(self, job_id: str, items: List[dict], semaphore: asyncio.Semaphore):
+        async with semaphore:
+            response, source = await self.answer(items[0]["message"])
+        await self._complete(job_id, [(item["index"], response, source) for item in items])
+
+    async def _run(self, job_id: str):
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            fixed = []
+            groups: Dict[str, List[dict]] = {}
+            # Only what is still unanswered, so a resumed job picks up where it stopped
+            for item in await asyncio.to_thread(self.store.job_items, job_id, pending=True):
+                response = self.answer_fixed(item["message"])
+                if response is not None:
+                    fixed.append((item["index"], response, "fixed_query"))
+                else:
+                    groups.setdefault(self.key(item["message"]), []).append(item)
+            if fixed:
+                await self._complete(job_id, fixed)
+            self.deduplicated += sum(len(items) - 1 for items in groups.values())
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            # Every group settles before the job does, so nothing is written after it is marked failed
+            outcomes = await asyncio.gather(
+                *(self._answer_group(job_id, items, semaphore) for items in groups.values()),
+                return_exceptions=True,
+            )
+            errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+            if errors:
+                raise errors[0]
+            await asyncio.to_thread(self.store.update_job, job_id, status="done", updated_at=datetime.now())
+        except asyncio.CancelledError:
+            # Shutting down: the job stays "running" and is resumed once stale
+            raise
+        except Exception as e:
+            print(f"Batch job {job_id} failed: {e}")
+            await asyncio.to_thread(self.store.update_job, job_id, status="failed", updated_at=datetime.now())
+        finally:
+            heartbeat.cancel()
+            self._notify(job_id)
+
+    async def results(self, job_id: str, after_seq: int = 0, poll_interval: float = 1.0) -> AsyncIterator[dict]:
+        """Yield a job's answers in completion order, after ``after_seq``, until it finishes.
+
+        Jobs run here wake the reader as answers land; jobs another worker
+        runs are polled every ``poll_interval`` seconds.
+        """
+        progress = asyncio.Event()
+        self._progress.setdefault(job_id, set()).add(progress)
+        try:
+            while True:
+                progress.clear()
+                # Read the status first, so answers stored before it finished are not missed
+                job = await asyncio.to_thread(self.store.get_job, job_id)
+                for item in await asyncio.to_thread(self.store.job_items, job_id, after_seq=after_seq):
+                    after_seq = item["seq"]
+                    yield item
+                if job is None or job["status"] != "running":
+                    return
+                try:
+                    await asyncio.wait_for(progress.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            readers = self._progress.get(job_id)
+            if readers is not None:
+                readers.discard(progress)
+                if not readers:
+                    del self._progress[job_id]
+
+    async def resume_stale(self) -> int:
+        """Claim and restart jobs whose owner stopped checking in"""
+        stale_before = datetime.now() - timedelta(seconds=self.stale_after)
+        resumed = 0
+        for job in await asyncio.to_thread(self.store.stale_jobs, stale_before):
+            if job["job_id"] in self.tasks:
+                continue
+            if await asyncio.to_thread(self.store.claim_job, job["job_id"], self.owner, datetime.now(), stale_before):
+                print(f"Resuming batch job {job['job_id']} ({job['completed']}/{job['total']} answered)")
+                self.resumed += 1
+                resumed += 1
+                self._start(job["job_id"])
+        return resumed
+
+    async def purge_finished(self, batch_size: int = 100) -> int:
+        """Delete jobs that finished more than ``keep_finished`` seconds ago"""
+        finished_before = datetime.now() - timedelta(seconds=self.keep_finished)
+        purged = 0
+        while True:
+            count = await asyncio.to_thread(self.store.purge_jobs, finished_before, batch_size)
+            purged += count
+            self.purged += count
+            if count < batch_size:
+                return purged
+
+    async def run_resumer(self):
+        """Background task: look for orphaned jobs and purge old ones until cancelled"""
+        while True:
+            try:
+                await self.resume_stale()
+            except Exception as e:
+                print(f"Could not resume batch jobs: {e}")
+            try:
+                await self.purge_finished()
+            except Exception as e:
+                print(f"Could not purge finished batch jobs: {e}")
+            await asyncio.sleep(self.stale_after / 2)
+
+    def shutdown(self):
+        for task in list(self.tasks.values()):
+            task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self.tasks),
+            "started": self.started,
+            "resumed": self.resumed,
+            "answered": self.answered,
+            "deduplicated": self.deduplicated,
+            "purged": self.purged,
+        }
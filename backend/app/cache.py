@@ -0,0 +1,152 @@
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from .intents import MIN_SUFFIX_LENGTH, SUFFIXES
+
+PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def stem_word(word: str) -> str:
+    """Strip a common English inflection ("plants" -> "plant")"""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_SUFFIX_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def normalize_message(message: str, stem: bool = False) -> str:
+    """Normalize a question so trivially different phrasings share a key.
+
+    Case-folds, drops punctuation and collapses whitespace; with ``stem``
+    each word is also reduced to a crude stem.
+    """
+    text = PUNCTUATION_RE.sub(" ", message.casefold())
+    words = WHITESPACE_RE.split(text.strip())
+    if stem:
+        words = [stem_word(word) for word in words]
+    return " ".join(word for word in words if word)
+
+
+class CacheBackend(ABC):
+    """Storage interface for ResponseCache.
+
+    The in-process backend below is the default; a disk or Redis-style store
+    only needs to implement these methods and count its own evictions.
+    """
+
+    evictions: int = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Bounded in-process LRU store with a per-entry TTL"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at and expires_at < self.clock():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        expires_at = self.clock() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResponseCache:
+    """Cache of model answers keyed by the normalized question"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None, stem: bool = False):
+        self.backend = backend if backend is not None else InMemoryCacheBackend()
+        self.stem = stem
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, message: str) -> str:
+        return normalize_message(message, stem=self.stem)
+
+    def get(self, message: str) -> Optional[str]:
+        value = self.backend.get(self.key(message))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, message: str, response: str):
+        self.backend.set(self.key(message), response)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
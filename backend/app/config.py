@@ -3,8 +3,88 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
 class Settings:
     MONGODB_URI: str = os.getenv("MONGODB_URI")
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_RETRY_BACKOFF_SECONDS: float = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+    LLM_RETRY_BACKOFF_MAX_SECONDS: float = float(os.getenv("LLM_RETRY_BACKOFF_MAX_SECONDS", "4"))
+    LLM_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+    LLM_BREAKER_RESET_SECONDS: float = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+    RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    RESPONSE_CACHE_STEM: bool = os.getenv("RESPONSE_CACHE_STEM", "false").lower() == "true"
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.6"))
+    SEMANTIC_CACHE_PATH: str = os.getenv("SEMANTIC_CACHE_PATH", os.path.join(DATA_DIR, "semantic_cache.npz"))
+    # "sqlite" (default), "mongo" or "memory"
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "sqlite")
+    # The memory store's search index takes several times the memory of the
+    # messages themselves (see benchmarks/bench_message_memory.py), so
+    # /search on that store is opt-in
+    MEMORY_STORE_FULL_TEXT: bool = os.getenv("MEMORY_STORE_FULL_TEXT", "false").lower() == "true"
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "chats.db"))
+    # Taken by each worker at startup so only one imports the legacy JSON chats
+    LEGACY_IMPORT_LOCK_PATH: str = os.getenv(
+        "LEGACY_IMPORT_LOCK_PATH", os.path.join(os.path.dirname(SQLITE_PATH), "legacy_import.lock")
+    )
+    SQLITE_BUSY_TIMEOUT_SECONDS: float = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "10"))
+    # How often each worker picks up cache invalidations from the others; 0 disables
+    INVALIDATION_POLL_SECONDS: float = float(os.getenv("INVALIDATION_POLL_SECONDS", "1"))
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+    CONTEXT_SUMMARY_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_SUMMARY_TOKEN_BUDGET", "400"))
+    CONTEXT_HISTORY_MESSAGES: int = int(os.getenv("CONTEXT_HISTORY_MESSAGES", "40"))
+    MODEL_CACHE_PATH: str = os.getenv("MODEL_CACHE_PATH", os.path.join(DATA_DIR, "models_cache.json"))
+    MODEL_CACHE_TTL_SECONDS: float = float(os.getenv("MODEL_CACHE_TTL_SECONDS", "86400"))
+    MONGODB_MAX_POOL_SIZE: int = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+    # Retention limits; 0 disables a limit. Cold chats move to ARCHIVE_DIR.
+    RETENTION_MAX_SESSIONS: int = int(os.getenv("RETENTION_MAX_SESSIONS", "50000"))
+    RETENTION_MAX_MESSAGES_PER_SESSION: int = int(os.getenv("RETENTION_MAX_MESSAGES_PER_SESSION", "1000"))
+    RETENTION_MAX_IDLE_DAYS: float = float(os.getenv("RETENTION_MAX_IDLE_DAYS", "90"))
+    RETENTION_ACTIVE_SECONDS: float = float(os.getenv("RETENTION_ACTIVE_SECONDS", "900"))
+    RETENTION_INTERVAL_SECONDS: float = float(os.getenv("RETENTION_INTERVAL_SECONDS", "300"))
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", os.path.join(DATA_DIR, "archive"))
+    ARCHIVE_SEGMENT_MAX_MB: int = int(os.getenv("ARCHIVE_SEGMENT_MAX_MB", "64"))
+    # POST /chat/batch: questions per job, answers in flight per job, and how
+    # long a job's worker may stay silent before another worker takes it over
+    BATCH_MAX_MESSAGES: int = int(os.getenv("BATCH_MAX_MESSAGES", "1000"))
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    BATCH_STALE_SECONDS: float = float(os.getenv("BATCH_STALE_SECONDS", "60"))
+    # Finished jobs and their answers are deleted this long after they finish
+    BATCH_JOB_RETENTION_HOURS: float = float(os.getenv("BATCH_JOB_RETENTION_HOURS", "24"))
+    # Admission control for /chat, /chat/stream and /chat/batch. Rates are
+    # per minute and 0 disables a limit. RATE_LIMIT_LLM_PER_MINUTE is meant
+    # to match the Gemini quota; with RATE_LIMIT_BACKEND=store the buckets
+    # live in the chat store and are shared by every worker.
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_CLIENT_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_CLIENT_PER_MINUTE", "60"))
+    RATE_LIMIT_CLIENT_BURST: float = float(os.getenv("RATE_LIMIT_CLIENT_BURST", "20"))
+    RATE_LIMIT_CHAT_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20"))
+    RATE_LIMIT_CHAT_BURST: float = float(os.getenv("RATE_LIMIT_CHAT_BURST", "5"))
+    RATE_LIMIT_LLM_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_LLM_PER_MINUTE", "0"))
+    RATE_LIMIT_LLM_BURST: float = float(os.getenv("RATE_LIMIT_LLM_BURST", "10"))
+    # Use X-Forwarded-For as the client address (only behind a trusted proxy)
+    RATE_LIMIT_TRUST_FORWARDED: bool = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+    # More than LLM_MAX_CONCURRENCY would only queue again inside the client
+    ADMISSION_MAX_LLM_CALLS: int = int(os.getenv("ADMISSION_MAX_LLM_CALLS", str(LLM_MAX_CONCURRENCY)))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+    # GET /search ranks at most this many of the newest matches (0 ranks them all)
+    SEARCH_MAX_CANDIDATES: int = int(os.getenv("SEARCH_MAX_CANDIDATES", "2000"))
+    # Encoded GET /chats/{chat_id} bodies kept per worker; 0 disables
+    HISTORY_CACHE_MAX_MB: float = float(os.getenv("HISTORY_CACHE_MAX_MB", "32"))
+    # History and sidebar bodies this large are gzipped for clients that accept it; 0 disables
+    RESPONSE_GZIP_MIN_BYTES: int = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "2048"))
+    RESPONSE_GZIP_LEVEL: int = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+    METRICS_ACTIVE_SESSION_SECONDS: float = float(os.getenv("METRICS_ACTIVE_SESSION_SECONDS", "900"))
+    # Exposes GET /debug/profile; keep off unless you are investigating a worker
+    PROFILER_ENABLED: bool = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
 
 settings = Settings()
\ No newline at end of file
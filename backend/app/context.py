@@ -0,0 +1,159 @@
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text).
+
+    Counting with the model's tokenizer would cost a network round trip per
+    turn; the budget only needs to be roughly right.
+    """
+    return max(1, (len(text) + 3) // 4)
+
+
+def extractive_summary(messages: List[dict], max_chars: int = 160) -> List[str]:
+    """Summarize turns as one line each: who spoke and their first sentence"""
+    lines = []
+    for message in messages:
+        text = " ".join(message["text"].split())
+        if not text:
+            continue
+        first_sentence = SENTENCE_RE.split(text, 1)[0]
+        if len(first_sentence) > max_chars:
+            first_sentence = first_sentence[:max_chars - 3] + "..."
+        speaker = "Farmer" if message["sender"] == "user" else "Assistant"
+        lines.append(f"{speaker}: {first_sentence}")
+    return lines
+
+
+@dataclass
+class RollingSummary:
+    lines: List[str] = field(default_factory=list)
+    # Id of the newest message folded into the summary
+    covered_until: int = 0
+
+
+@dataclass
+class BuiltContext:
+    contents: List[dict]
+    prompt_tokens: int
+    verbatim_messages: int
+    summarized_messages: int
+
+    @property
+    def standalone(self) -> bool:
+        """Whether the prompt goes out with no history, so any answer to it fits"""
+        return len(self.contents) == 1 and len(self.contents[0]["parts"]) == 1
+
+
+class ContextBuilder:
+    """Turn stored chat history into Gemini ``contents`` within a token budget.
+
+    The newest turns are sent verbatim as ``{"role", "parts"}`` entries (the
+    same shape ``start_chat(history=...)`` takes). Gemini wants the roles to
+    alternate, so consecutive turns from one side, such as a question whose
+    streamed answer was cut off before any text, share one entry. Turns that no longer fit
+    are folded into a per-session rolling summary, which is cached and only
+    extended with the turns that newly fell out of the window, never
+    recomputed from scratch.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 2000,
+        summary_token_budget: int = 400,
+        max_sessions: int = 1024,
+        summarizer: Callable[[List[dict]], List[str]] = extractive_summary,
+    ):
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_sessions = max_sessions
+        self.summarizer = summarizer
+        self._summaries: "OrderedDict[str, RollingSummary]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _summary_for(self, chat_id: str) -> RollingSummary:
+        with self._lock:
+            summary = self._summaries.get(chat_id)
+            if summary is None:
+                summary = RollingSummary()
+                self._summaries[chat_id] = summary
+                while len(self._summaries) > self.max_sessions:
+                    self._summaries.popitem(last=False)
+            else:
+                self._summaries.move_to_end(chat_id)
+            return summary
+
+    def forget(self, chat_id: str):
+        with self._lock:
+            self._summaries.pop(chat_id, None)
+
+    def _extend_summary(self, summary: RollingSummary, messages: List[dict]):
+        if not messages:
+            return
+        summary.lines.extend(self.summarizer(messages))
+        summary.covered_until = messages[-1]["id"]
+        # Keep the summary itself inside its budget by dropping the oldest lines
+        while summary.lines and estimate_tokens("\n".join(summary.lines)) > self.summary_token_budget:
+            summary.lines.pop(0)
+
+    def build(self, chat_id: Optional[str], history: List[dict], prompt: str) -> BuiltContext:
+        """Build contents for ``prompt`` given the stored ``history`` (oldest first)"""
+        summary = self._summary_for(chat_id) if chat_id else RollingSummary()
+        # Anything already summarized is never sent verbatim again
+        history = [message for message in history if message["id"] > summary.covered_until and message["text"]]
+
+        summarized = 0
+        while True:
+            available = self.token_budget - estimate_tokens(prompt)
+            if summary.lines:
+                available -= estimate_tokens("\n".join(summary.lines))
+
+            # Walk back from the newest turn while it still fits
+            start = len(history)
+            while start > 0:
+                cost = estimate_tokens(history[start - 1]["text"])
+                if cost > available:
+                    break
+                available -= cost
+                start -= 1
+
+            # Gemini expects turns to alternate and start with the user
+            while start < len(history) and history[start]["sender"] != "user":
+                start += 1
+
+            if start == 0:
+                break
+            # Folding turns into the summary grows it, so check the fit again
+            self._extend_summary(summary, history[:start])
+            summarized += start
+            history = history[start:]
+
+        verbatim = history
+
+        contents = []
+        if summary.lines:
+            contents.append({
+                "role": "user",
+                "parts": ["Summary of our earlier conversation:\n" + "\n".join(summary.lines)],
+            })
+            contents.append({"role": "model", "parts": ["Understood, I'll keep that in mind."]})
+        turns = [("user" if message["sender"] == "user" else "model", message["text"]) for message in verbatim]
+        for role, text in turns + [("user", prompt)]:
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"].append(text)
+            else:
+                contents.append({"role": role, "parts": [text]})
+
+        prompt_tokens = sum(estimate_tokens(part) for content in contents for part in content["parts"])
+        return BuiltContext(
+            contents=contents,
+            prompt_tokens=prompt_tokens,
+            verbatim_messages=len(verbatim),
+            summarized_messages=summarized,
+        )
@@ -1,62 +1,1548 @@
-from pymongo import MongoClient
-from datetime import datetime
+import bisect
+import json
 import os
-from .models import ChatMessage, ChatSession
-from bson import ObjectId
-from typing import List
-
-# MongoDB connection - using in-memory storage for now to avoid setup issues
-# MONGODB_URI = os.getenv("MONGODB_URI")
-# client = MongoClient(MONGODB_URI)
-# db = client["farmer_chatbot"]
-# chats_collection = db["chats"]
-# sessions_collection = db["sessions"]
-
-# In-memory storage for development
-chats_storage = {}
-sessions_storage = {}
-
-def create_chat_session(title: str) -> ChatSession:
-    """Create a new chat session"""
-    chat_id = str(ObjectId())
-    now = datetime.now()
-    session_data = {
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .cache import stem_word
+from .config import settings
+from .search import (
+    ELLIPSIS,
+    MARK_END,
+    MARK_START,
+    SNIPPET_TOKENS,
+    InvertedIndex,
+    fts_query,
+    make_snippet,
+    query_words,
+    split_highlights,
+)
+
+
+class ChatStore(ABC):
+    """Storage interface shared by every backend.
+
+    Sessions are dicts with ``chat_id``, ``title``, ``created_at``,
+    ``updated_at`` and ``message_count``; messages are dicts with ``id``
+    (monotonic within a chat), ``sender``, ``text`` and ``timestamp``.
+    A backend missing any method fails when it is created, not mid-request.
+    """
+
+    @abstractmethod
+    def create_session(self, chat_id: str, title: str, now: datetime) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_session(self, chat_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_sessions(self, limit: Optional[int] = None, before: Optional[Tuple[datetime, str]] = None) -> List[dict]:
+        """Return sessions most recently updated first.
+
+        ``before`` is an ``(updated_at, chat_id)`` cursor taken from the last
+        session of the previous page; only sessions strictly older than it
+        are returned, at most ``limit`` of them.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_session(self, chat_id: str, **fields) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_session(self, chat_id: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_messages(self, chat_id: str, messages: List[dict]) -> List[int]:
+        """Append messages and bump ``updated_at`` in one batch; return their ids"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_message_text(self, chat_id: str, message_id: int, text: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_messages(
+        self,
+        chat_id: str,
+        limit: Optional[int] = None,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> List[dict]:
+        """Return a window of messages, oldest first.
+
+        With ``after`` the window starts just past that message id and runs
+        forward; otherwise it ends just before ``before`` (or at the newest
+        message) and reaches back ``limit`` messages (all by default).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_sessions(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def coldest_sessions(self, limit: int) -> List[dict]:
+        """Return up to ``limit`` sessions least recently updated first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def import_session(self, session: dict, messages: List[dict]):
+        """Store a session and its messages exactly as given, ids included"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def trim_messages(self, chat_id: str, keep: int) -> List[dict]:
+        """Drop all but the newest ``keep`` messages and return the dropped ones"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def size(self) -> Dict[str, int]:
+        """Return ``sessions``, ``messages`` and ``bytes`` for monitoring.
+
+        ``bytes`` is the backend's own cheap estimate of the data it holds,
+        so values are only comparable within one backend.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def publish_event(self, kind: str, key: str, origin: str):
+        """Record an invalidation event for the other workers sharing this store"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_events(self, cursor: Any = None) -> Tuple[List[dict], Any]:
+        """Return events published after ``cursor`` and the cursor for next time.
+
+        Events are dicts with ``id``, ``kind``, ``key`` and ``origin``. A
+        ``None`` cursor starts at the current end of the log. Backends may
+        hand an event out more than once; consumers skip ids they have seen.
+        """
+        raise NotImplementedError
+
+    # Batch jobs. A job is a dict with ``job_id``, ``status`` ("running",
+    # "done" or "failed"), ``total``, ``completed``, ``owner`` (the worker running it),
+    # ``created_at`` and ``updated_at``; its items are dicts with ``index``,
+    # ``message``, ``response``, ``source`` and ``seq``, the order in which
+    # items completed (``None`` while pending).
+
+    @abstractmethod
+    def create_job(self, job_id: str, messages: List[str], owner: str, now: datetime) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_job(self, job_id: str, **fields) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete_job_items(self, job_id: str, results: List[Tuple[int, str, str]], now: datetime):
+        """Store ``(index, response, source)`` answers and bump the job's progress"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def job_items(self, job_id: str, pending: bool = False, after_seq: Optional[int] = None) -> List[dict]:
+        """Return a job's items in index order.
+
+        With ``pending`` only unanswered items are returned; with ``after_seq``
+        only items answered after that point, in the order they were answered.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stale_jobs(self, stale_before: datetime, limit: int = 10) -> List[dict]:
+        """Return running jobs whose owner has not checked in since ``stale_before``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_job(self, job_id: str, owner: str, now: datetime, stale_before: datetime) -> bool:
+        """Take over a stale running job; only one of several callers succeeds"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def purge_jobs(self, finished_before: datetime, limit: int = 100) -> int:
+        """Delete up to ``limit`` done or failed jobs, and their items, last updated before ``finished_before``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_messages(
+        self, query: str, chat_id: Optional[str] = None, limit: int = 20, offset: int = 0
+    ) -> List[dict]:
+        """Full-text search over every stored message, best match first.
+
+        Every term of ``query`` must appear in a message for it to match;
+        ``chat_id`` restricts the search to one chat. Across all chats only
+        the newest ``SEARCH_MAX_CANDIDATES`` matches are ranked, so a very
+        common word costs the same however large the store grows.
+
+        Hits are dicts with ``chat_id``, ``message_id``, ``sender``,
+        ``timestamp``, ``score`` (higher is better), ``snippet`` and
+        ``highlights``, the ``[start, end)`` offsets of matched terms within
+        the snippet.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def take_tokens(self, key: str, rate: float, burst: float, cost: float, now: float) -> Tuple[bool, float]:
+        """Atomically refill token bucket ``key`` and take ``cost`` tokens if it has them.
+
+        ``rate`` is tokens per second and ``now`` a Unix time. Returns
+        ``(allowed, tokens left)``. Used by rate limiting, so every worker
+        sharing the store draws from the same buckets.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_meta(self, key: str) -> Optional[str]:
+        """Return a store-wide setting or marker, ``None`` if never set"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_meta(self, key: str, value: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# How long workers have to pick up an invalidation event before it is pruned
+EVENT_RETENTION = timedelta(hours=1)
+
+# A bucket untouched this long is full again for any sensible rate, so it is dropped
+BUCKET_RETENTION = timedelta(days=1)
+
+
+def search_hit(chat_id: str, message: dict, score: float, marked_snippet: str) -> dict:
+    snippet, highlights = split_highlights(marked_snippet)
+    return {
         "chat_id": chat_id,
-        "title": title,
-        "created_at": now,
-        "updated_at": now
+        "message_id": message["id"],
+        "sender": message["sender"],
+        "timestamp": message["timestamp"],
+        "score": score,
+        "snippet": snippet,
+        "highlights": highlights,
     }
-    sessions_storage[chat_id] = session_data
-    return ChatSession(**session_data)
-
-def get_chat_session(chat_id: str) -> ChatSession:
-    """Retrieve a chat session by ID"""
-    session_data = sessions_storage.get(chat_id)
-    if session_data:
-        return ChatSession(**session_data)
-    return None
-
-def update_chat_session(chat_id: str):
-    """Update the timestamp of a chat session"""
-    if chat_id in sessions_storage:
-        sessions_storage[chat_id]["updated_at"] = datetime.now()
-
-def save_chat(chat_id: str, message: ChatMessage):
-    """Save a chat message to the database"""
-    if chat_id not in chats_storage:
-        chats_storage[chat_id] = []
-    
-    chat_data = {
-        "sender": message.sender,
-        "text": message.text,
-        "timestamp": message.timestamp
-    }
-    chats_storage[chat_id].append(chat_data)
-
-def get_chats(chat_id: str, limit: int = 50) -> List[ChatMessage]:
-    """Retrieve chat messages for a session"""
-    if chat_id not in chats_storage:
-        return []
-    
-    chats = chats_storage[chat_id][-limit:]  # Get last 'limit' messages
-    return [ChatMessage(**chat) for chat in chats]
\ No newline at end of file
+
+
+def refill_bucket(state: Optional[Tuple[float, float]], now: float, rate: float, burst: float) -> float:
+    """Tokens in a bucket last seen as ``(tokens, updated)``; a new bucket starts full"""
+    if state is None:
+        return burst
+    tokens, updated = state
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class SessionIndex:
+    """``(updated_at, chat_id)`` keys kept sorted for cheap paging.
+
+    A page is a binary search to the cursor plus a walk of ``limit`` keys,
+    so listing never re-sorts the whole session set.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[datetime, str]] = []
+
+    def add(self, updated_at: datetime, chat_id: str):
+        bisect.insort(self._keys, (updated_at, chat_id))
+
+    def remove(self, updated_at: datetime, chat_id: str):
+        index = bisect.bisect_left(self._keys, (updated_at, chat_id))
+        if index < len(self._keys) and self._keys[index] == (updated_at, chat_id):
+            del self._keys[index]
+
+    def page(self, limit: Optional[int] = None, before: Optional[Tuple[datetime, str]] = None) -> List[str]:
+        """Return chat ids newest first, starting just below ``before``"""
+        end = bisect.bisect_left(self._keys, before) if before else len(self._keys)
+        start = 0 if limit is None else max(0, end - limit)
+        return [chat_id for _, chat_id in reversed(self._keys[start:end])]
+
+    def oldest(self, limit: int) -> List[str]:
+        """Return the ``limit`` least recently updated chat ids, oldest first"""
+        return [chat_id for _, chat_id in self._keys[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+# Senders stored as one byte each; codes are positions in this list
+SENDERS = ["user", "assistant"]
+SENDER_CODES = {sender: code for code, sender in enumerate(SENDERS)}
+
+
+def sender_code(sender: str) -> int:
+    code = SENDER_CODES.get(sender)
+    if code is None:
+        code = len(SENDERS)
+        SENDERS.append(sender)
+        SENDER_CODES[sender] = code
+    return code
+
+
+def to_epoch_ms(value: datetime) -> int:
+    return round(value.timestamp() * 1000)
+
+
+def from_epoch_ms(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000)
+
+
+class MessageColumns:
+    """One chat's messages stored column by column.
+
+    Instead of a dict (plus a datetime) per message, ids and epoch-ms
+    timestamps live in packed int64 arrays and the sender is one byte.
+    Texts found in ``shared`` (the canned answers) are stored as that one
+    copy; anything else is kept as given. Message dicts are only built for
+    the window a caller asks for.
+    """
+
+    __slots__ = ("ids", "senders", "timestamps", "texts")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.senders = bytearray()
+        self.timestamps = array("q")
+        self.texts: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, message_id: int, message: dict, shared: Dict[str, str]):
+        self.ids.append(message_id)
+        self.senders.append(sender_code(message["sender"]))
+        self.timestamps.append(to_epoch_ms(message["timestamp"]))
+        self.texts.append(shared.get(message["text"], message["text"]))
+
+    def index_of(self, message_id: int) -> Optional[int]:
+        index = bisect.bisect_left(self.ids, message_id)
+        if index < len(self.ids) and self.ids[index] == message_id:
+            return index
+        return None
+
+    def rows(self, start: int, end: int) -> List[dict]:
+        senders = SENDERS
+        return [
+            {"id": message_id, "sender": senders[code], "text": text, "timestamp": datetime.fromtimestamp(ms / 1000)}
+            for message_id, code, ms, text in zip(
+                self.ids[start:end], self.senders[start:end], self.timestamps[start:end], self.texts[start:end]
+            )
+        ]
+
+    def drop_oldest(self, count: int) -> List[dict]:
+        dropped = self.rows(0, count)
+        del self.ids[:count]
+        del self.senders[:count]
+        del self.timestamps[:count]
+        del self.texts[:count]
+        return dropped
+
+
+class MemoryChatStore(ChatStore):
+    """Process-local store, handy for development and throwaway runs.
+
+    Messages are kept in compact per-session columns (see MessageColumns);
+    ``get_messages`` still returns plain dicts. Timestamps are kept to the
+    millisecond. With ``full_text`` every message is also kept in an
+    InvertedIndex for search_messages(); that index takes several times the
+    memory of the messages, so it is off unless asked for.
+    """
+
+    # Per message: int64 id, one sender byte, int64 timestamp
+    COLUMN_BYTES = 17
+
+    def __init__(self, full_text: bool = False, shared_texts: Iterable[str] = ()):
+        self.sessions: Dict[str, dict] = {}
+        self.messages: Dict[str, MessageColumns] = {}
+        self.search_index = InvertedIndex() if full_text else None
+        # Texts many messages repeat, such as fixed query answers, kept once
+        self.shared_texts: Dict[str, str] = {text: text for text in shared_texts}
+        self.index = SessionIndex()
+        self._lock = threading.Lock()
+        # Running totals so size() never walks every message
+        self._message_total = 0
+        self._text_bytes = 0
+        self._jobs: Dict[str, dict] = {}
+        self._job_items: Dict[str, List[dict]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._meta: Dict[str, str] = {}
+
+    def create_session(self, chat_id, title, now):
+        session = {
+            "chat_id": chat_id,
+            "title": title,
+            "created_at": now,
+            "updated_at": now,
+            "message_count": 0,
+        }
+        with self._lock:
+            self.sessions[chat_id] = session
+            self.messages[chat_id] = MessageColumns()
+            self.index.add(now, chat_id)
+        return dict(session)
+
+    def get_session(self, chat_id):
+        session = self.sessions.get(chat_id)
+        return dict(session) if session else None
+
+    def list_sessions(self, limit=None, before=None):
+        with self._lock:
+            return [dict(self.sessions[chat_id]) for chat_id in self.index.page(limit, before)]
+
+    def _touch(self, session: dict, updated_at: datetime):
+        # Re-key the session in the ordered index when its timestamp moves
+        self.index.remove(session["updated_at"], session["chat_id"])
+        session["updated_at"] = updated_at
+        self.index.add(updated_at, session["chat_id"])
+
+    def update_session(self, chat_id, **fields):
+        with self._lock:
+            session = self.sessions.get(chat_id)
+            if session is None:
+                return False
+            if "updated_at" in fields:
+                self._touch(session, fields.pop("updated_at"))
+            session.update(fields)
+            return True
+
+    def delete_session(self, chat_id):
+        with self._lock:
+            session = self.sessions.pop(chat_id, None)
+            removed = self.messages.pop(chat_id, None)
+            if removed is not None:
+                self._message_total -= len(removed)
+                self._text_bytes -= sum(len(text.encode("utf-8")) for text in removed.texts)
+                if self.search_index is not None:
+                    for message_id, text in zip(removed.ids, removed.texts):
+                        self.search_index.remove(chat_id, message_id, text)
+            if session is None:
+                return False
+            self.index.remove(session["updated_at"], chat_id)
+            return True
+
+    def add_messages(self, chat_id, messages):
+        with self._lock:
+            stored = self.messages[chat_id]
+            next_id = stored.ids[-1] + 1 if len(stored) else 1
+            ids = []
+            for offset, message in enumerate(messages):
+                stored.append(next_id + offset, message, self.shared_texts)
+                ids.append(next_id + offset)
+                self._text_bytes += len(message["text"].encode("utf-8"))
+                if self.search_index is not None:
+                    self.search_index.add(chat_id, next_id + offset, message["text"])
+            self._message_total += len(messages)
+            session = self.sessions[chat_id]
+            session["message_count"] += len(messages)
+            self._touch(session, messages[-1]["timestamp"])
+            return ids
+
+    def update_message_text(self, chat_id, message_id, text):
+        with self._lock:
+            stored = self.messages.get(chat_id)
+            index = stored.index_of(message_id) if stored is not None else None
+            if index is None:
+                return
+            self._text_bytes += len(text.encode("utf-8")) - len(stored.texts[index].encode("utf-8"))
+            if self.search_index is not None:
+                self.search_index.update(chat_id, message_id, stored.texts[index], text)
+            # A streamed canned answer ends up equal to its shared copy
+            stored.texts[index] = self.shared_texts.get(text, text)
+
+    def get_messages(self, chat_id, limit=None, before=None, after=None):
+        stored = self.messages.get(chat_id)
+        if stored is None:
+            return []
+        # Ids are increasing, so both bounds are binary searches
+        if after is not None:
+            start = bisect.bisect_right(stored.ids, after)
+            end = len(stored) if limit is None else min(len(stored), start + limit)
+        else:
+            end = len(stored) if before is None else bisect.bisect_left(stored.ids, before)
+            start = 0 if limit is None else max(0, end - limit)
+        return stored.rows(start, end)
+
+    def count_sessions(self):
+        return len(self.sessions)
+
+    def coldest_sessions(self, limit):
+        with self._lock:
+            return [dict(self.sessions[chat_id]) for chat_id in self.index.oldest(limit)]
+
+    def import_session(self, session, messages):
+        stored = MessageColumns()
+        for message in messages:
+            stored.append(message["id"], message, self.shared_texts)
+        with self._lock:
+            self.sessions[session["chat_id"]] = dict(session, message_count=len(messages))
+            self.messages[session["chat_id"]] = stored
+            self.index.add(session["updated_at"], session["chat_id"])
+            self._message_total += len(messages)
+            self._text_bytes += sum(len(message["text"].encode("utf-8")) for message in messages)
+            if self.search_index is not None:
+                for message in messages:
+                    self.search_index.add(session["chat_id"], message["id"], message["text"])
+
+    def trim_messages(self, chat_id, keep):
+        with self._lock:
+            stored = self.messages.get(chat_id)
+            if stored is None or len(stored) <= keep:
+                return []
+            dropped = stored.drop_oldest(len(stored) - keep)
+            self.sessions[chat_id]["message_count"] = len(stored)
+            self._message_total -= len(dropped)
+            self._text_bytes -= sum(len(message["text"].encode("utf-8")) for message in dropped)
+            if self.search_index is not None:
+                for message in dropped:
+                    self.search_index.remove(chat_id, message["id"], message["text"])
+            return dropped
+
+    def size(self):
+        # Message text plus the packed columns; per-session overhead is not counted
+        return {
+            "sessions": len(self.sessions),
+            "messages": self._message_total,
+            "bytes": self._text_bytes + self.COLUMN_BYTES * self._message_total,
+        }
+
+    def search_messages(self, query, chat_id=None, limit=20, offset=0):
+        if self.search_index is None:
+            raise NotImplementedError("this store was created without full-text search")
+        terms = [stem_word(word) for word in query_words(query)]
+        hits = []
+        with self._lock:
+            found = self.search_index.search(terms, chat_id, limit, offset, settings.SEARCH_MAX_CANDIDATES)
+            for hit_chat_id, message_id, score in found:
+                stored = self.messages[hit_chat_id]
+                index = stored.index_of(message_id)
+                message = stored.rows(index, index + 1)[0]
+                hits.append(search_hit(hit_chat_id, message, score, make_snippet(message["text"], terms)))
+        return hits
+
+    # Nobody else can see this store, so there is nobody to tell
+    def publish_event(self, kind, key, origin):
+        pass
+
+    def read_events(self, cursor=None):
+        return [], cursor
+
+    def create_job(self, job_id, messages, owner, now):
+        job = {
+            "job_id": job_id,
+            "status": "running",
+            "total": len(messages),
+            "completed": 0,
+            "owner": owner,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._job_items[job_id] = [
+                {"index": index, "message": message, "response": None, "source": None, "seq": None}
+                for index, message in enumerate(messages)
+            ]
+        return dict(job)
+
+    def get_job(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def update_job(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.update(fields)
+            return True
+
+    def complete_job_items(self, job_id, results, now):
+        with self._lock:
+            job = self._jobs[job_id]
+            items = self._job_items[job_id]
+            for index, response, source in results:
+                item = items[index]
+                if item["seq"] is not None:
+                    continue
+                job["completed"] += 1
+                item.update(response=response, source=source, seq=job["completed"])
+            job["updated_at"] = now
+
+    def job_items(self, job_id, pending=False, after_seq=None):
+        with self._lock:
+            items = [dict(item) for item in self._job_items.get(job_id, [])]
+        if pending:
+            return [item for item in items if item["seq"] is None]
+        if after_seq is not None:
+            return sorted((item for item in items if (item["seq"] or 0) > after_seq), key=lambda item: item["seq"])
+        return items
+
+    def stale_jobs(self, stale_before, limit=10):
+        with self._lock:
+            stale = [
+                dict(job) for job in self._jobs.values()
+                if job["status"] == "running" and job["updated_at"] < stale_before
+            ]
+        return stale[:limit]
+
+    def claim_job(self, job_id, owner, now, stale_before):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "running" or job["updated_at"] >= stale_before:
+                return False
+            job.update(owner=owner, updated_at=now)
+            return True
+
+    def purge_jobs(self, finished_before, limit=100):
+        with self._lock:
+            finished = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] != "running" and job["updated_at"] < finished_before
+            ][:limit]
+            for job_id in finished:
+                del self._jobs[job_id]
+                self._job_items.pop(job_id, None)
+        return len(finished)
+
+    def take_tokens(self, key, rate, burst, cost, now):
+        with self._lock:
+            tokens = refill_bucket(self._buckets.get(key), now, rate, burst)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens
+
+    def get_meta(self, key):
+        return self._meta.get(key)
+
+    def set_meta(self, key, value):
+        self._meta[key] = value
+
+
+class SQLiteChatStore(ChatStore):
+    """Embedded store in a single SQLite file, running in WAL mode"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        chat_id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at, chat_id);
+    CREATE TABLE IF NOT EXISTS messages (
+        chat_id TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        sender TEXT NOT NULL,
+        text TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        PRIMARY KEY (chat_id, id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        origin TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        completed INTEGER NOT NULL DEFAULT 0,
+        owner TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, updated_at);
+    CREATE TABLE IF NOT EXISTS job_items (
+        job_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        response TEXT,
+        source TEXT,
+        seq INTEGER,
+        PRIMARY KEY (job_id, idx)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_job_items_seq ON job_items (job_id, seq);
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID;
+    """
+
+    # Full-text search. messages has no integer rowid, so message_docs gives
+    # every message one for FTS5; the index reads text back through a view
+    # instead of keeping a second copy. Triggers keep it in step with every
+    # insert, streamed-text update and delete, whichever worker makes them.
+    # chat_id is indexed too (with zero weight in the ranking) so searching
+    # one chat is a cheap AND in the index rather than a scan of every match.
+    SEARCH_SCHEMA = (
+        """
+        CREATE TABLE message_docs (
+            docid INTEGER PRIMARY KEY,
+            chat_id TEXT NOT NULL,
+            message_id INTEGER NOT NULL,
+            UNIQUE (chat_id, message_id)
+        )
+        """,
+        """
+        CREATE VIEW message_search_content AS
+        SELECT d.docid AS docid, m.text AS text, d.chat_id AS chat_id
+        FROM message_docs d JOIN messages m ON m.chat_id = d.chat_id AND m.id = d.message_id
+        """,
+        """
+        CREATE VIRTUAL TABLE messages_fts USING fts5(
+            text, chat_id, content='message_search_content', content_rowid='docid', tokenize='porter unicode61'
+        )
+        """,
+        "INSERT INTO messages_fts (messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+        """
+        CREATE TRIGGER messages_search_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO message_docs (chat_id, message_id) VALUES (NEW.chat_id, NEW.id);
+            INSERT INTO messages_fts (rowid, text, chat_id) VALUES (last_insert_rowid(), NEW.text, NEW.chat_id);
+        END
+        """,
+        """
+        CREATE TRIGGER messages_search_update AFTER UPDATE OF text ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, chat_id)
+                SELECT 'delete', docid, OLD.text, chat_id FROM message_docs WHERE chat_id = OLD.chat_id AND message_id = OLD.id;
+            INSERT INTO messages_fts (rowid, text, chat_id)
+                SELECT docid, NEW.text, chat_id FROM message_docs WHERE chat_id = NEW.chat_id AND message_id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER messages_search_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, chat_id)
+                SELECT 'delete', docid, OLD.text, chat_id FROM message_docs WHERE chat_id = OLD.chat_id AND message_id = OLD.id;
+            DELETE FROM message_docs WHERE chat_id = OLD.chat_id AND message_id = OLD.id;
+        END
+        """,
+    )
+
+    # Drop long-idle rate limit buckets once every this many takes
+    BUCKET_PRUNE_EVERY = 10000
+
+    def __init__(self, path: str, busy_timeout: float = 10.0):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Several workers may share the file; a writer waits up to
+        # busy_timeout for another worker's transaction to finish
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._takes = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+            self._create_search_index()
+
+    def _create_search_index(self):
+        # Checked and created in one write transaction, so only one worker builds it
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+                for statement in self.SEARCH_SCHEMA:
+                    self._conn.execute(statement)
+                # Index the messages stored before search existed
+                self._conn.execute("INSERT INTO message_docs (chat_id, message_id) SELECT chat_id, id FROM messages")
+                self._conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _session(row) -> dict:
+        return {
+            "chat_id": row["chat_id"],
+            "title": row["title"],
+            "created_at": datetime.fromisoformat(row["created_at"]),
+            "updated_at": datetime.fromisoformat(row["updated_at"]),
+            "message_count": row["message_count"],
+        }
+
+    @staticmethod
+    def _message(row) -> dict:
+        return {
+            "id": row["id"],
+            "sender": row["sender"],
+            "text": row["text"],
+            "timestamp": datetime.fromisoformat(row["timestamp"]),
+        }
+
+    def create_session(self, chat_id, title, now):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (chat_id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (chat_id, title, now.isoformat(), now.isoformat()),
+            )
+        return {"chat_id": chat_id, "title": title, "created_at": now, "updated_at": now, "message_count": 0}
+
+    def get_session(self, chat_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sessions WHERE chat_id = ?", (chat_id,)).fetchone()
+        return self._session(row) if row else None
+
+    def list_sessions(self, limit=None, before=None):
+        # Served straight off the (updated_at, chat_id) index
+        query = "SELECT * FROM sessions"
+        params: list = []
+        if before is not None:
+            query += " WHERE (updated_at, chat_id) < (?, ?)"
+            params += [before[0].isoformat(), before[1]]
+        query += " ORDER BY updated_at DESC, chat_id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._session(row) for row in rows]
+
+    def update_session(self, chat_id, **fields):
+        if not fields:
+            return self.get_session(chat_id) is not None
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in fields.values()]
+        with self._lock:
+            cursor = self._conn.execute(f"UPDATE sessions SET {columns} WHERE chat_id = ?", (*values, chat_id))
+            return cursor.rowcount > 0
+
+    def delete_session(self, chat_id):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+                deleted = self._conn.execute("DELETE FROM sessions WHERE chat_id = ?", (chat_id,)).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return deleted > 0
+
+    def add_messages(self, chat_id, messages):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = self._conn.execute(
+                    "UPDATE sessions SET message_count = message_count + ?, updated_at = ? WHERE chat_id = ?",
+                    (len(messages), messages[-1]["timestamp"].isoformat(), chat_id),
+                ).rowcount
+                if not updated:
+                    raise KeyError(chat_id)
+                last_id = self._conn.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM messages WHERE chat_id = ?", (chat_id,)
+                ).fetchone()[0]
+                ids = list(range(last_id + 1, last_id + 1 + len(messages)))
+                self._conn.executemany(
+                    "INSERT INTO messages (chat_id, id, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (chat_id, message_id, message["sender"], message["text"], message["timestamp"].isoformat())
+                        for message_id, message in zip(ids, messages)
+                    ],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def update_message_text(self, chat_id, message_id, text):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE messages SET text = ? WHERE chat_id = ? AND id = ?", (text, chat_id, message_id)
+            )
+
+    def get_messages(self, chat_id, limit=None, before=None, after=None):
+        # Every variant is a range scan on the (chat_id, id) primary key
+        limit = -1 if limit is None else limit
+        with self._lock:
+            if after is not None:
+                rows = self._conn.execute(
+                    "SELECT * FROM messages WHERE chat_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (chat_id, after, limit),
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM messages WHERE chat_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                    (chat_id, before if before is not None else 2 ** 62, limit),
+                ).fetchall()
+                rows.reverse()
+        return [self._message(row) for row in rows]
+
+    def count_sessions(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def coldest_sessions(self, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM sessions ORDER BY updated_at, chat_id LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._session(row) for row in rows]
+
+    def import_session(self, session, messages):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO sessions (chat_id, title, created_at, updated_at, message_count) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        session["chat_id"],
+                        session["title"],
+                        session["created_at"].isoformat(),
+                        session["updated_at"].isoformat(),
+                        len(messages),
+                    ),
+                )
+                self._conn.executemany(
+                    "INSERT INTO messages (chat_id, id, sender, text, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (session["chat_id"], message["id"], message["sender"], message["text"], message["timestamp"].isoformat())
+                        for message in messages
+                    ],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def trim_messages(self, chat_id, keep):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT * FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                    (chat_id, keep),
+                ).fetchall()
+                if rows:
+                    self._conn.execute(
+                        "DELETE FROM messages WHERE chat_id = ? AND id <= ?", (chat_id, rows[0]["id"])
+                    )
+                    self._conn.execute(
+                        "UPDATE sessions SET message_count = message_count - ? WHERE chat_id = ?",
+                        (len(rows), chat_id),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self._message(row) for row in reversed(rows)]
+
+    def size(self):
+        with self._lock:
+            sessions, messages = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(message_count), 0) FROM sessions"
+            ).fetchone()
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return {"sessions": sessions, "messages": messages, "bytes": page_count * page_size}
+
+    def search_messages(self, query, chat_id=None, limit=20, offset=0):
+        match = fts_query(query)
+        if match is None:
+            return []
+        match = f"text : ({match})"
+        where = "messages_fts MATCH :match"
+        if chat_id is not None:
+            match += ' AND chat_id : "{}"'.format(chat_id.replace('"', '""'))
+        elif settings.SEARCH_MAX_CANDIDATES:
+            # Only the newest matches are ranked, found by walking the index backwards
+            where += """ AND rowid >= COALESCE((
+                SELECT rowid FROM messages_fts WHERE messages_fts MATCH :match
+                ORDER BY rowid DESC LIMIT 1 OFFSET :candidates
+            ), 0)"""
+        params = {
+            "match": match,
+            "candidates": settings.SEARCH_MAX_CANDIDATES - 1,
+            "mark_start": MARK_START,
+            "mark_end": MARK_END,
+            "ellipsis": ELLIPSIS,
+            "tokens": SNIPPET_TOKENS,
+            "limit": limit,
+            "offset": offset,
+        }
+        # Ranked and cut inside FTS5, so snippets are only made for the page
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT d.chat_id, m.id, m.sender, m.text, m.timestamp, hits.score, hits.snippet
+                FROM (
+                    SELECT rowid AS docid, -rank AS score,
+                           snippet(messages_fts, 0, :mark_start, :mark_end, :ellipsis, :tokens) AS snippet
+                    FROM messages_fts WHERE {where} ORDER BY rank LIMIT :limit OFFSET :offset
+                ) hits
+                JOIN message_docs d ON d.docid = hits.docid
+                JOIN messages m ON m.chat_id = d.chat_id AND m.id = d.message_id
+                ORDER BY hits.score DESC
+                """,
+                params,
+            ).fetchall()
+        return [search_hit(row["chat_id"], self._message(row), row["score"], row["snippet"]) for row in rows]
+
+    def publish_event(self, kind, key, origin):
+        now = datetime.now()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO events (kind, key, origin, created_at) VALUES (?, ?, ?, ?)",
+                    (kind, key, origin, now.isoformat()),
+                )
+                self._conn.execute(
+                    "DELETE FROM events WHERE created_at < ?", ((now - EVENT_RETENTION).isoformat(),)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _job(row) -> dict:
+        job = dict(row)
+        job["created_at"] = datetime.fromisoformat(job["created_at"])
+        job["updated_at"] = datetime.fromisoformat(job["updated_at"])
+        return job
+
+    @staticmethod
+    def _job_item(row) -> dict:
+        return {
+            "index": row["idx"],
+            "message": row["message"],
+            "response": row["response"],
+            "source": row["source"],
+            "seq": row["seq"],
+        }
+
+    def create_job(self, job_id, messages, owner, now):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, status, total, owner, created_at, updated_at) VALUES (?, 'running', ?, ?, ?, ?)",
+                    (job_id, len(messages), owner, now.isoformat(), now.isoformat()),
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_items (job_id, idx, message) VALUES (?, ?, ?)",
+                    [(job_id, index, message) for index, message in enumerate(messages)],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {
+            "job_id": job_id,
+            "status": "running",
+            "total": len(messages),
+            "completed": 0,
+            "owner": owner,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    def get_job(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def update_job(self, job_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in fields.values()]
+        with self._lock:
+            cursor = self._conn.execute(f"UPDATE jobs SET {columns} WHERE job_id = ?", (*values, job_id))
+            return cursor.rowcount > 0
+
+    def complete_job_items(self, job_id, results, now):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                completed = self._conn.execute(
+                    "SELECT completed FROM jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                for index, response, source in results:
+                    cursor = self._conn.execute(
+                        "UPDATE job_items SET response = ?, source = ?, seq = ? WHERE job_id = ? AND idx = ? AND seq IS NULL",
+                        (response, source, completed + 1, job_id, index),
+                    )
+                    completed += cursor.rowcount
+                self._conn.execute(
+                    "UPDATE jobs SET completed = ?, updated_at = ? WHERE job_id = ?",
+                    (completed, now.isoformat(), job_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def job_items(self, job_id, pending=False, after_seq=None):
+        query = "SELECT * FROM job_items WHERE job_id = ?"
+        params: list = [job_id]
+        if pending:
+            query += " AND seq IS NULL ORDER BY idx"
+        elif after_seq is not None:
+            query += " AND seq > ? ORDER BY seq"
+            params.append(after_seq)
+        else:
+            query += " ORDER BY idx"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._job_item(row) for row in rows]
+
+    def stale_jobs(self, stale_before, limit=10):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND updated_at < ? LIMIT ?",
+                (stale_before.isoformat(), limit),
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def claim_job(self, job_id, owner, now, stale_before):
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET owner = ?, updated_at = ? WHERE job_id = ? AND status = 'running' AND updated_at < ?",
+                (owner, now.isoformat(), job_id, stale_before.isoformat()),
+            )
+            return cursor.rowcount > 0
+
+    def purge_jobs(self, finished_before, limit=100):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                finished = [
+                    (row[0],) for row in self._conn.execute(
+                        "SELECT job_id FROM jobs WHERE status != 'running' AND updated_at < ? LIMIT ?",
+                        (finished_before.isoformat(), limit),
+                    )
+                ]
+                self._conn.executemany("DELETE FROM job_items WHERE job_id = ?", finished)
+                self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", finished)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(finished)
+
+    def take_tokens(self, key, rate, burst, cost, now):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM rate_limits WHERE key = ?", (key,)).fetchone()
+                tokens = refill_bucket(tuple(row) if row else None, now, rate, burst)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now)
+                )
+                self._takes += 1
+                if self._takes % self.BUCKET_PRUNE_EVERY == 0:
+                    self._conn.execute(
+                        "DELETE FROM rate_limits WHERE updated < ?", (now - BUCKET_RETENTION.total_seconds(),)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return allowed, tokens
+
+    def read_events(self, cursor=None):
+        # Writers are serialized, so ids become visible in order
+        with self._lock:
+            if cursor is None:
+                return [], self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT id, kind, key, origin FROM events WHERE id > ? ORDER BY id", (cursor,)
+            ).fetchall()
+        events = [dict(row) for row in rows]
+        return events, events[-1]["id"] if events else cursor
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MongoChatStore(ChatStore):
+    """MongoDB store sharing one pooled MongoClient across requests"""
+
+    def __init__(self, uri: str, database: str = "farmer_chatbot", max_pool_size: int = 50):
+        from pymongo import ASCENDING, DESCENDING, TEXT, MongoClient
+
+        self.client = MongoClient(uri, maxPoolSize=max_pool_size)
+        self.db = self.client[database]
+        self.sessions = self.db["sessions"]
+        self.messages = self.db["chats"]
+        self.sessions.create_index([("chat_id", ASCENDING)], unique=True)
+        self.sessions.create_index([("updated_at", DESCENDING), ("chat_id", DESCENDING)])
+        self.messages.create_index([("chat_id", ASCENDING), ("id", ASCENDING)], unique=True)
+        # Kept up to date by MongoDB on every write; ranks by its own text score rather than BM25
+        self.messages.create_index([("text", TEXT)], default_language="english")
+        self.events = self.db["events"]
+        self.events.create_index("at", expireAfterSeconds=int(EVENT_RETENTION.total_seconds()))
+        self.jobs = self.db["jobs"]
+        self.jobs.create_index([("job_id", ASCENDING)], unique=True)
+        self.jobs.create_index([("status", ASCENDING), ("updated_at", ASCENDING)])
+        self.job_items_collection = self.db["job_items"]
+        self.job_items_collection.create_index([("job_id", ASCENDING), ("index", ASCENDING)], unique=True)
+        self.job_items_collection.create_index([("job_id", ASCENDING), ("seq", ASCENDING)])
+        self.rate_limits = self.db["rate_limits"]
+        self.rate_limits.create_index([("key", ASCENDING)], unique=True)
+        self.rate_limits.create_index("at", expireAfterSeconds=int(BUCKET_RETENTION.total_seconds()))
+        self.meta = self.db["meta"]
+
+    SESSION_FIELDS = {"_id": 0, "chat_id": 1, "title": 1, "created_at": 1, "updated_at": 1, "message_count": 1}
+    JOB_ITEM_FIELDS = {"_id": 0, "index": 1, "message": 1, "response": 1, "source": 1, "seq": 1}
+    MESSAGE_FIELDS = {"_id": 0, "id": 1, "sender": 1, "text": 1, "timestamp": 1}
+
+    def create_session(self, chat_id, title, now):
+        session = {
+            "chat_id": chat_id,
+            "title": title,
+            "created_at": now,
+            "updated_at": now,
+            "message_count": 0,
+            "message_seq": 0,
+        }
+        self.sessions.insert_one(dict(session))
+        session.pop("message_seq")
+        return session
+
+    def get_session(self, chat_id):
+        return self.sessions.find_one({"chat_id": chat_id}, self.SESSION_FIELDS)
+
+    def list_sessions(self, limit=None, before=None):
+        query = {}
+        if before is not None:
+            updated_at, chat_id = before
+            query = {"$or": [
+                {"updated_at": {"$lt": updated_at}},
+                {"updated_at": updated_at, "chat_id": {"$lt": chat_id}},
+            ]}
+        cursor = self.sessions.find(query, self.SESSION_FIELDS).sort([("updated_at", -1), ("chat_id", -1)])
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def update_session(self, chat_id, **fields):
+        result = self.sessions.update_one({"chat_id": chat_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    def delete_session(self, chat_id):
+        self.messages.delete_many({"chat_id": chat_id})
+        return self.sessions.delete_one({"chat_id": chat_id}).deleted_count > 0
+
+    def add_messages(self, chat_id, messages):
+        from pymongo import ReturnDocument
+
+        # Reserve a block of ids and bump the counters in one round trip,
+        # then write every message with a single insert_many.
+        session = self.sessions.find_one_and_update(
+            {"chat_id": chat_id},
+            {
+                "$inc": {"message_seq": len(messages), "message_count": len(messages)},
+                "$set": {"updated_at": messages[-1]["timestamp"]},
+            },
+            projection={"message_seq": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if session is None:
+            raise KeyError(chat_id)
+        first_id = session["message_seq"] - len(messages) + 1
+        ids = list(range(first_id, first_id + len(messages)))
+        self.messages.insert_many(
+            [{"chat_id": chat_id, "id": message_id, **message} for message_id, message in zip(ids, messages)],
+            ordered=False,
+        )
+        return ids
+
+    def update_message_text(self, chat_id, message_id, text):
+        self.messages.update_one({"chat_id": chat_id, "id": message_id}, {"$set": {"text": text}})
+
+    def get_messages(self, chat_id, limit=None, before=None, after=None):
+        query = {"chat_id": chat_id}
+        if after is not None:
+            query["id"] = {"$gt": after}
+            cursor = self.messages.find(query, self.MESSAGE_FIELDS).sort("id", 1)
+        else:
+            if before is not None:
+                query["id"] = {"$lt": before}
+            cursor = self.messages.find(query, self.MESSAGE_FIELDS).sort("id", -1)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        messages = list(cursor)
+        if after is None:
+            messages.reverse()
+        return messages
+
+    def count_sessions(self):
+        return self.sessions.estimated_document_count()
+
+    def coldest_sessions(self, limit):
+        cursor = self.sessions.find({}, self.SESSION_FIELDS).sort([("updated_at", 1), ("chat_id", 1)])
+        return list(cursor.limit(limit))
+
+    def import_session(self, session, messages):
+        self.sessions.insert_one({
+            **session,
+            "message_count": len(messages),
+            # Keep handing out ids after the newest restored message
+            "message_seq": max((message["id"] for message in messages), default=0),
+        })
+        if messages:
+            self.messages.insert_many(
+                [{"chat_id": session["chat_id"], **message} for message in messages],
+                ordered=False,
+            )
+
+    def trim_messages(self, chat_id, keep):
+        dropped = list(
+            self.messages.find({"chat_id": chat_id}, self.MESSAGE_FIELDS).sort("id", -1).skip(keep)
+        )
+        if not dropped:
+            return []
+        self.messages.delete_many({"chat_id": chat_id, "id": {"$lte": dropped[0]["id"]}})
+        self.sessions.update_one({"chat_id": chat_id}, {"$inc": {"message_count": -len(dropped)}})
+        dropped.reverse()
+        return dropped
+
+    def size(self):
+        return {
+            "sessions": self.sessions.estimated_document_count(),
+            "messages": self.messages.estimated_document_count(),
+            "bytes": int(self.db.command("dbstats")["dataSize"]),
+        }
+
+    def search_messages(self, query, chat_id=None, limit=20, offset=0):
+        match = fts_query(query)
+        if match is None:
+            return []
+        # Quoted terms must all appear, as with FTS5
+        criteria = {"$text": {"$search": match}}
+        if chat_id is not None:
+            criteria["chat_id"] = chat_id
+        cursor = self.messages.find(
+            criteria, {**self.MESSAGE_FIELDS, "chat_id": 1, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).skip(offset).limit(limit)
+        terms = [stem_word(word) for word in query_words(query)]
+        return [
+            search_hit(message["chat_id"], message, message["score"], make_snippet(message["text"], terms))
+            for message in cursor
+        ]
+
+    # Workers on different hosts stamp events with their own clocks, so each
+    # read looks back this far and the consumer drops events it already saw
+    EVENT_CLOCK_SKEW = timedelta(seconds=10)
+
+    def publish_event(self, kind, key, origin):
+        self.events.insert_one({"kind": kind, "key": key, "origin": origin, "at": datetime.utcnow()})
+
+    def read_events(self, cursor=None):
+        now = datetime.utcnow()
+        if cursor is None:
+            return [], now
+        rows = self.events.find({"at": {"$gt": cursor - self.EVENT_CLOCK_SKEW}}).sort("at", 1)
+        events = [
+            {"id": str(row["_id"]), "kind": row["kind"], "key": row["key"], "origin": row["origin"]}
+            for row in rows
+        ]
+        return events, now
+
+    def create_job(self, job_id, messages, owner, now):
+        job = {
+            "job_id": job_id,
+            "status": "running",
+            "total": len(messages),
+            "completed": 0,
+            "owner": owner,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.jobs.insert_one(dict(job))
+        if messages:
+            self.job_items_collection.insert_many([
+                {"job_id": job_id, "index": index, "message": message, "response": None, "source": None, "seq": None}
+                for index, message in enumerate(messages)
+            ])
+        return job
+
+    def get_job(self, job_id):
+        return self.jobs.find_one({"job_id": job_id}, {"_id": 0})
+
+    def update_job(self, job_id, **fields):
+        return self.jobs.update_one({"job_id": job_id}, {"$set": fields}).matched_count > 0
+
+    def complete_job_items(self, job_id, results, now):
+        from pymongo import ReturnDocument
+
+        # Reserve a block of completion numbers, then fill the items in;
+        # only the worker that owns the job writes its items
+        job = self.jobs.find_one_and_update(
+            {"job_id": job_id},
+            {"$inc": {"completed": len(results)}, "$set": {"updated_at": now}},
+            projection={"completed": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        first_seq = job["completed"] - len(results) + 1
+        for seq, (index, response, source) in enumerate(results, first_seq):
+            self.job_items_collection.update_one(
+                {"job_id": job_id, "index": index, "seq": None},
+                {"$set": {"response": response, "source": source, "seq": seq}},
+            )
+
+    def job_items(self, job_id, pending=False, after_seq=None):
+        query = {"job_id": job_id}
+        sort = "index"
+        if pending:
+            query["seq"] = None
+        elif after_seq is not None:
+            query["seq"] = {"$gt": after_seq}
+            sort = "seq"
+        return list(self.job_items_collection.find(query, self.JOB_ITEM_FIELDS).sort(sort, 1))
+
+    def stale_jobs(self, stale_before, limit=10):
+        cursor = self.jobs.find({"status": "running", "updated_at": {"$lt": stale_before}}, {"_id": 0})
+        return list(cursor.limit(limit))
+
+    def take_tokens(self, key, rate, burst, cost, now):
+        from pymongo import ReturnDocument
+
+        # Refill and take in one pipeline update, so concurrent workers never
+        # both spend the same token
+        refilled = {"$min": [burst, {"$add": [
+            {"$ifNull": ["$tokens", burst]},
+            {"$multiply": [{"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated", now]}]}]}, rate]},
+        ]}]}
+        bucket = self.rate_limits.find_one_and_update(
+            {"key": key},
+            [
+                {"$set": {"tokens": refilled}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", cost]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", cost]}, {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "updated": now,
+                    "at": "$$NOW",
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return bucket["allowed"], bucket["tokens"]
+
+    def claim_job(self, job_id, owner, now, stale_before):
+        result = self.jobs.update_one(
+            {"job_id": job_id, "status": "running", "updated_at": {"$lt": stale_before}},
+            {"$set": {"owner": owner, "updated_at": now}},
+        )
+        return result.modified_count > 0
+
+    def purge_jobs(self, finished_before, limit=100):
+        cursor = self.jobs.find(
+            {"status": {"$ne": "running"}, "updated_at": {"$lt": finished_before}}, {"_id": 0, "job_id": 1}
+        )
+        finished = [job["job_id"] for job in cursor.limit(limit)]
+        if finished:
+            # Items first: a job left without them is still found next time
+            self.job_items_collection.delete_many({"job_id": {"$in": finished}})
+            self.jobs.delete_many({"job_id": {"$in": finished}})
+        return len(finished)
+
+    def get_meta(self, key):
+        row = self.meta.find_one({"_id": key})
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        self.meta.update_one({"_id": key}, {"$set": {"value": value}}, upsert=True)
+
+    def close(self):
+        self.client.close()
+
+
+def import_legacy_json(store: ChatStore, data_dir: str) -> int:
+    """Load the old sessions.json/chats.json dumps into the store, once.
+
+    A ``legacy_import`` marker is kept in the store afterwards, so chats
+    deleted or archived later never come back. Sessions already in the
+    store are skipped, so an import cut short by a crash can run again.
+    """
+    sessions_path = os.path.join(data_dir, "sessions.json")
+    chats_path = os.path.join(data_dir, "chats.json")
+    if store.get_meta("legacy_import") is not None or not os.path.exists(sessions_path):
+        return 0
+    if store.count_sessions():
+        # Filled before the marker existed, which only happened after an import
+        store.set_meta("legacy_import", datetime.now().isoformat())
+        return 0
+
+    with open(sessions_path) as f:
+        sessions = json.load(f)
+    chats = {}
+    if os.path.exists(chats_path):
+        with open(chats_path) as f:
+            chats = json.load(f)
+
+    imported = 0
+    for chat_id, session in sessions.items():
+        if store.get_session(chat_id) is not None:
+            continue
+        messages = [
+            {
+                "id": message_id,
+                "sender": m["sender"],
+                "text": m["text"],
+                "timestamp": datetime.fromisoformat(m["timestamp"]),
+            }
+            for message_id, m in enumerate(chats.get(chat_id, []), start=1)
+        ]
+        # One call per session, so a session is either fully there or not at all
+        store.import_session(
+            {
+                "chat_id": chat_id,
+                "title": session["title"],
+                "created_at": datetime.fromisoformat(session["created_at"]),
+                "updated_at": datetime.fromisoformat(session["updated_at"]),
+            },
+            messages,
+        )
+        imported += 1
+    store.set_meta("legacy_import", datetime.now().isoformat())
+    return imported
+
+
+def create_store(shared_texts: Iterable[str] = ()) -> ChatStore:
+    """Build the store selected by STORAGE_BACKEND.
+
+    ``shared_texts`` are answers many messages repeat; the memory store keeps
+    one copy of each.
+    """
+    backend = settings.STORAGE_BACKEND.lower()
+    if backend == "mongo":
+        return MongoChatStore(settings.MONGODB_URI, max_pool_size=settings.MONGODB_MAX_POOL_SIZE)
+    if backend == "memory":
+        return MemoryChatStore(full_text=settings.MEMORY_STORE_FULL_TEXT, shared_texts=shared_texts)
+    return SQLiteChatStore(settings.SQLITE_PATH, busy_timeout=settings.SQLITE_BUSY_TIMEOUT_SECONDS)
@@ -0,0 +1,45 @@
+# Enhanced Fixed query responses for better testing
+FIXED_QUERIES = {
+    "weather": {
+        "patterns": [r"weather", r"rain", r"temperature", r"forecast", r"humidity", r"sunny", r"cloudy"],
+        "response": "For accurate weather information, I recommend checking your local weather service. Ideal farming conditions are temperatures between 15-30°C with moderate humidity (40-70%). Rainfall of 1-2 inches per week benefits most crops. Always check your local forecast before planning farming activities."
+    },
+    "soil": {
+        "patterns": [r"soil", r"ph", r"nutrient", r"fertili[sz]er", r"compost", r"manure", r"nitrogen", r"phosphorus", r"potassium"],
+        "response": "Soil health is crucial for farming. Most crops prefer a pH between 6.0-7.0. Regular soil testing every season helps determine nutrient requirements. Organic matter like compost improves soil structure and fertility. For specific recommendations, get your soil tested at a local agricultural extension office."
+    },
+    "crops": {
+        "patterns": [r"crop", r"plant", r"harvest", r"yield", r"season", r"wheat", r"rice", r"corn", r"vegetables", r"fruits"],
+        "response": "Different crops have different growing seasons and requirements. Common crops include wheat, rice, corn, and various vegetables. Crop rotation helps maintain soil health and prevent pest buildup. The best crops for your area depend on climate, soil type, and market demand."
+    },
+    "pests": {
+        "patterns": [r"pest", r"insect", r"disease", r"bug", r"infestation", r"aphid", r"caterpillar", r"fungus", r"mold"],
+        "response": "Integrated Pest Management (IPM) is recommended. This includes cultural practices (crop rotation), biological controls (beneficial insects), and careful use of pesticides. Regular monitoring helps detect issues early. For specific pest problems, consult with your local agricultural extension service."
+    },
+    "irrigation": {
+        "patterns": [r"water", r"irrigation", r"drip", r"sprinkler", r"moisture", r"watering", r"drought"],
+        "response": "Efficient irrigation saves water and improves yields. Drip irrigation can save 30-50% water compared to flood irrigation. Water requirements vary by crop and growth stage. Most crops need about 1 inch of water per week during growing season, either from rainfall or irrigation."
+    },
+    "greeting": {
+        "weight": 0.5,
+        "patterns": [r"hello", r"hi", r"hey", r"greetings", r"good morning", r"good afternoon", r"good evening"],
+        "response": "Hello! I'm your farming assistant. How can I help you with your agricultural questions today? I can assist with crop advice, soil management, pest control, irrigation, and more!"
+    },
+    "thanks": {
+        "weight": 0.5,
+        "patterns": [r"thank", r"thanks", r"appreciate", r"grateful"],
+        "response": "You're welcome! I'm happy to help with your farming questions. Is there anything else you'd like to know about agriculture or farming practices?"
+    },
+    "organic": {
+        "patterns": [r"organic", r"natural", r"chemical free", r"pesticide free"],
+        "response": "Organic farming focuses on using natural methods without synthetic chemicals. This includes using compost, crop rotation, biological pest control, and cover crops. Organic certification requires following specific guidelines and practices over a transition period."
+    },
+    "equipment": {
+        "patterns": [r"tractor", r"equipment", r"tool", r"plow", r"harvester", r"machinery"],
+        "response": "Farm equipment depends on your scale of operation. Basic tools include plows, tillers, and harvesters. For small farms, hand tools may be sufficient, while larger operations benefit from tractors and specialized machinery. Always prioritize safety when operating farm equipment."
+    },
+    "profit": {
+        "patterns": [r"profit", r"income", r"revenue", r"money", r"cost", r"expensive", r"affordable"],
+        "response": "Farm profitability depends on many factors: crop selection, market prices, input costs, and efficiency. Diversifying crops, adding value through processing, and direct marketing can increase profits. Start with a business plan and consider consulting with agricultural economists."
+    }
+}
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+# Fallback tiers in order of preference; names present in the live listing win
+MODEL_CANDIDATES = [
+    "models/gemini-pro",
+    "gemini-pro",
+    "models/gemini-1.0-pro",
+    "gemini-1.0-pro",
+    "models/gemini-1.5-pro",
+    "gemini-1.5-pro"
+]
+
+
+def run_in_daemon_thread(func: Callable[[], Any], name: str = "gemini-resolve") -> "asyncio.Future":
+    """Run a blocking call on a daemon thread and await its result.
+
+    Unlike the default executor, a daemon thread stuck on an unreachable
+    network never holds up interpreter shutdown or a ``--reload`` restart.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result=None, error=None):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target():
+        try:
+            result = func()
+        except Exception as e:
+            loop.call_soon_threadsafe(settle, None, e)
+        else:
+            loop.call_soon_threadsafe(settle, result)
+
+    threading.Thread(target=target, daemon=True, name=name).start()
+    return future
+
+
+class ModelRegistry:
+    """Resolve the Gemini model off the import path.
+
+    ``google.generativeai`` is only imported once resolution starts, and the
+    ``list_models()`` listing is cached on disk for ``cache_ttl`` seconds so
+    restarts and extra workers skip the network round trip entirely.
+    """
+
+    def __init__(self, api_key: Optional[str], cache_path: str, cache_ttl: float = 86400.0):
+        self.api_key = api_key
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.model: Any = None
+        # Every usable model as (name, model), best first; model is models[0]
+        self.models: List[Tuple[str, Any]] = []
+        # "pending" until resolve() finishes, then "ready" or "mock"
+        self.status = "pending" if api_key else "mock"
+        self.error: Optional[str] = None
+        self._listing: Optional[List[dict]] = None
+        self._configured = False
+
+    def _configure(self):
+        import google.generativeai as genai
+
+        if not self._configured:
+            genai.configure(api_key=self.api_key)
+            self._configured = True
+        return genai
+
+    def _read_cache(self) -> Optional[List[dict]]:
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - cached.get("fetched_at", 0) > self.cache_ttl:
+            return None
+        return cached.get("models")
+
+    def _write_cache(self, models: List[dict]):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"fetched_at": time.time(), "models": models}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not cache model listing: {e}")
+
+    def list_models(self, refresh: bool = False) -> List[dict]:
+        """Models supporting generateContent, from memory, disk or the API (blocking)"""
+        if self._listing is not None and not refresh:
+            return self._listing
+
+        models = None if refresh else self._read_cache()
+        if models is None:
+            genai = self._configure()
+            models = [
+                {
+                    "name": m.name,
+                    "display_name": m.display_name,
+                    "supported_methods": list(m.supported_generation_methods)
+                }
+                for m in genai.list_models()
+                if 'generateContent' in m.supported_generation_methods
+            ]
+            self._write_cache(models)
+
+        self._listing = models
+        return models
+
+    def _resolve(self) -> List[Tuple[str, Any]]:
+        genai = self._configure()
+        try:
+            available = {m["name"] for m in self.list_models()}
+        except Exception as e:
+            # Without a listing we can still try the candidates blindly
+            print(f"Error listing models: {e}")
+            available = set()
+
+        names = [name for name in MODEL_CANDIDATES if name in available]
+        if not names:
+            names = MODEL_CANDIDATES
+
+        models = []
+        seen = set()
+        for model_name in names:
+            # "models/gemini-pro" and "gemini-pro" are the same model
+            short_name = model_name.split("/")[-1]
+            if short_name in seen:
+                continue
+            try:
+                models.append((model_name, genai.GenerativeModel(model_name=model_name)))
+                seen.add(short_name)
+                print(f"Successfully loaded model: {model_name}")
+            except Exception as e:
+                print(f"Failed to load model {model_name}: {e}")
+        return models
+
+    async def resolve(self) -> Any:
+        """Pick working models without blocking the event loop"""
+        if not self.api_key:
+            return None
+        try:
+            self.models = await run_in_daemon_thread(self._resolve)
+        except Exception as e:
+            print(f"Error configuring Gemini: {e}")
+            self.error = str(e)
+            self.models = []
+        self.model = self.models[0][1] if self.models else None
+
+        if self.model is None:
+            print("Could not find a working model. Using mock mode.")
+            self.status = "mock"
+        else:
+            self.status = "ready"
+        return self.model
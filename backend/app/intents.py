@@ -0,0 +1,162 @@
+import itertools
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Words are runs of letters/digits; a hyphen separates words, so
+# "drought-resistant" still mentions drought. Hyphenated patterns such as
+# "chemical-free" become two-word phrases and match either spelling.
+WORD_RE = re.compile(r"[a-z0-9]+")
+# Plain words, optionally with single-letter classes such as "fertili[sz]er"
+LITERAL_RE = re.compile(r"(?:[a-z0-9\- ]|\[[a-z0-9]+\])+")
+CHAR_CLASS_RE = re.compile(r"\[([a-z0-9]+)\]")
+
+# Inflections a pattern may carry and still count as a whole-word hit
+# ("crop" -> "crops", "water" -> "watering"). Very short patterns such as
+# "hi" or "ph" only ever match as exact words.
+SUFFIXES = ("ing", "es", "ed", "s")
+MIN_SUFFIX_LENGTH = 3
+
+
+def expand_char_classes(pattern: str) -> List[str]:
+    """Expand "fertili[sz]er" into ["fertiliser", "fertilizer"]"""
+    pieces = CHAR_CLASS_RE.split(pattern)
+    # split() alternates literal text and class contents
+    options = [[piece] if i % 2 == 0 else list(piece) for i, piece in enumerate(pieces)]
+    return ["".join(combo) for combo in itertools.product(*options)]
+
+
+@dataclass
+class IntentMatch:
+    category: str
+    score: float
+    hits: List[str] = field(default_factory=list)
+    first_position: int = 0
+
+
+class IntentMatcher:
+    """Match a message against every fixed query category in a single scan.
+
+    Plain-word patterns (all of the shipped ones) are compiled into a phrase
+    table keyed by whole words, so each message is tokenized once and every
+    token costs a couple of dict lookups no matter how many categories
+    exist. Patterns that use regex syntax are folded into one combined,
+    word-bounded alternation that runs only when such patterns are present.
+    """
+
+    def __init__(self, fixed_queries: Dict[str, dict]):
+        self.fixed_queries = fixed_queries
+        self.weights = {
+            category: float(data.get("weight", 1.0))
+            for category, data in fixed_queries.items()
+        }
+
+        # Single words map straight to their category; multi-word phrases
+        # are indexed by their first word and only checked when it appears.
+        self._words: Dict[str, str] = {}
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        regex_entries = []
+
+        for category, data in fixed_queries.items():
+            for pattern in data["patterns"]:
+                if not LITERAL_RE.fullmatch(pattern):
+                    regex_entries.append((category, pattern))
+                    continue
+                for literal in expand_char_classes(pattern):
+                    words = tuple(WORD_RE.findall(literal))
+                    # First category to claim a word or phrase keeps it
+                    if len(words) == 1:
+                        self._words.setdefault(words[0], category)
+                    else:
+                        self._phrases.setdefault(words[0], []).append((words[1:], category))
+
+        for candidates in self._phrases.values():
+            # Prefer the longest phrase starting at a given word
+            candidates.sort(key=lambda candidate: len(candidate[0]), reverse=True)
+
+        self._group_categories = {}
+        self._regex = None
+        if regex_entries:
+            alternatives = []
+            for index, (category, pattern) in enumerate(regex_entries):
+                group = f"p{index}"
+                self._group_categories[group] = category
+                alternatives.append(f"(?P<{group}>{pattern}(?:{'|'.join(SUFFIXES)})?)")
+            self._regex = re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+    def _lookup_word(self, word: str) -> Optional[str]:
+        category = self._words.get(word)
+        if category is not None:
+            return category
+
+        for suffix in SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= MIN_SUFFIX_LENGTH:
+                category = self._words.get(word[:-len(suffix)])
+                if category is not None:
+                    return category
+        return None
+
+    def _lookup_phrase(self, tokens: List[str], index: int) -> Optional[Tuple[str, int]]:
+        candidates = self._phrases.get(tokens[index])
+        if not candidates:
+            return None
+
+        for rest, category in candidates:
+            end = index + 1 + len(rest)
+            if end <= len(tokens) and tuple(tokens[index + 1:end]) == rest:
+                return category, end
+        return None
+
+    def match(self, message: str) -> List[IntentMatch]:
+        """Return every matching category, best first"""
+        message_lower = message.lower()
+        matches: Dict[str, IntentMatch] = {}
+
+        def record(category: str, hit: str, position: int):
+            intent = matches.get(category)
+            if intent is None:
+                intent = IntentMatch(category=category, score=0.0, first_position=position)
+                matches[category] = intent
+            intent.score += self.weights[category]
+            intent.hits.append(hit)
+
+        tokens = WORD_RE.findall(message_lower)
+        index = 0
+        while index < len(tokens):
+            if self._phrases:
+                phrase = self._lookup_phrase(tokens, index)
+                if phrase is not None:
+                    category, end = phrase
+                    record(category, " ".join(tokens[index:end]), index)
+                    index = end
+                    continue
+
+            category = self._lookup_word(tokens[index])
+            if category is not None:
+                record(category, tokens[index], index)
+            index += 1
+
+        if self._regex is not None:
+            for found in self._regex.finditer(message_lower):
+                # Express the position in words so it compares with the table hits
+                position = len(WORD_RE.findall(message_lower, 0, found.start()))
+                record(self._group_categories[found.lastgroup], found.group(0), position)
+
+        # Highest score wins; ties go to whichever topic the user mentioned
+        # first, then to the category name so the result is deterministic.
+        return sorted(
+            matches.values(),
+            key=lambda intent: (-intent.score, intent.first_position, intent.category),
+        )
+
+    def best(self, message: str) -> Optional[IntentMatch]:
+        """Return the highest scoring category, if any"""
+        matches = self.match(message)
+        return matches[0] if matches else None
+
+    def response_for(self, message: str) -> Optional[str]:
+        """Return the fixed response for the best matching category, if any"""
+        intent = self.best(message)
+        if intent is None:
+            return None
+        return self.fixed_queries[intent.category]["response"]
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import socket
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+from .database import ChatStore
+
+
+class InvalidationBus:
+    """Tell every worker sharing a store to drop process-local state.
+
+    Workers keep some state in process (context summaries, response caches,
+    the active-session set). When one worker changes what that state was
+    derived from, it awaits ``publish(kind, key)``: the handlers subscribed
+    to ``kind`` run here straight away, and the event is written to the
+    store's event log. The other workers ``poll()`` the log every
+    ``interval`` seconds and run their own handlers, so they catch up
+    within about one interval. Handlers must be idempotent.
+    """
+
+    def __init__(self, store: ChatStore, interval: float = 1.0, remember: int = 10000):
+        self.store = store
+        self.interval = interval
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self.published = 0
+        self.received = 0
+        self._cursor = None
+        self._remember = remember
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+
+    def subscribe(self, kind: str, handler: Callable[[str], None]):
+        self.handlers.setdefault(kind, []).append(handler)
+
+    def _dispatch(self, kind: str, key: str):
+        for handler in self.handlers.get(kind, []):
+            try:
+                handler(key)
+            except Exception as e:
+                print(f"Invalidation handler for {kind} failed: {e}")
+
+    async def publish(self, kind: str, key: str = ""):
+        self._dispatch(kind, key)
+        await asyncio.to_thread(self.store.publish_event, kind, key, self.origin)
+        self.published += 1
+
+    def poll(self) -> int:
+        """Apply events other workers published since the last poll"""
+        return self._apply(*self.store.read_events(self._cursor))
+
+    def _apply(self, events: List[dict], cursor) -> int:
+        # Handlers touch process-local state, so this runs on the event loop
+        self._cursor = cursor
+        applied = 0
+        for event in events:
+            event_id = str(event["id"])
+            if event_id in self._seen:
+                continue
+            self._seen[event_id] = None
+            if len(self._seen) > self._remember:
+                self._seen.popitem(last=False)
+            if event["origin"] == self.origin:
+                continue
+            self._dispatch(event["kind"], event["key"])
+            applied += 1
+        self.received += applied
+        return applied
+
+    async def run(self):
+        """Background task: poll the event log until cancelled"""
+        while True:
+            try:
+                self._apply(*await asyncio.to_thread(self.store.read_events, self._cursor))
+            except Exception as e:
+                print(f"Could not read invalidation events: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.origin,
+            "interval_seconds": self.interval,
+            "published": self.published,
+            "received": self.received,
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client went away before the model answered"""
+
+
+async def wait_unless_disconnected(
+    future: "asyncio.Future",
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+) -> Any:
+    """Await ``future`` while polling ``is_disconnected``.
+
+    Raises ClientDisconnected as soon as the client is gone; cancelling the
+    underlying work is left to the caller.
+    """
+    if is_disconnected is None:
+        return await future
+
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return future.result()
+        if await is_disconnected():
+            raise ClientDisconnected()
+
+
+class LLMClient:
+    """Async front for a google.generativeai model.
+
+    Uses the SDK's ``generate_content_async`` when the model provides it and
+    otherwise runs ``generate_content`` on a bounded thread pool, so a slow
+    completion never blocks the event loop. A semaphore caps the number of
+    calls in flight and every call is subject to a timeout.
+    """
+
+    def __init__(self, model: Any = None, max_concurrency: int = 8, timeout: Optional[float] = 60.0):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+
+    async def _call(self, model: Any, prompt: Any, **kwargs) -> Any:
+        async_generate = getattr(model, "generate_content_async", None)
+        if async_generate is not None:
+            return await async_generate(prompt, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: model.generate_content(prompt, **kwargs)
+        )
+
+    async def generate(
+        self,
+        prompt: Any,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        model: Any = None,
+        **kwargs,
+    ) -> Any:
+        """Generate a completion without blocking the event loop.
+
+        ``is_disconnected`` is polled while waiting (pass FastAPI's
+        ``request.is_disconnected``); if it reports True the call is cancelled
+        and ClientDisconnected is raised. Raises asyncio.TimeoutError when the
+        call takes longer than ``timeout`` (defaults to the client timeout).
+        ``model`` overrides the client's model for this call.
+        """
+        model = self.model if model is None else model
+        if model is None:
+            raise RuntimeError("No model configured")
+
+        timeout = self.timeout if timeout is None else timeout
+
+        async with self._semaphore:
+            call = asyncio.ensure_future(asyncio.wait_for(self._call(model, prompt, **kwargs), timeout))
+            try:
+                return await wait_unless_disconnected(call, is_disconnected)
+            finally:
+                if not call.done():
+                    call.cancel()
+
+    async def stream(
+        self, prompt: Any, timeout: Optional[float] = None, model: Any = None, **kwargs
+    ) -> AsyncIterator[str]:
+        """Yield the completion text chunk by chunk as the model produces it.
+
+        ``timeout`` bounds the wait for each chunk, so the time to first byte
+        and every stall after it are capped. Breaking out of the iteration
+        (for example because the client disconnected) stops the upstream call.
+        """
+        model = self.model if model is None else model
+        if model is None:
+            raise RuntimeError("No model configured")
+
+        timeout = self.timeout if timeout is None else timeout
+
+        async with self._semaphore:
+            async_generate = getattr(model, "generate_content_async", None)
+            if async_generate is not None:
+                response = await asyncio.wait_for(async_generate(prompt, stream=True, **kwargs), timeout)
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        return
+                    if chunk.text:
+                        yield chunk.text
+            else:
+                async for text in self._stream_in_thread(model, prompt, timeout, **kwargs):
+                    yield text
+
+    async def _stream_in_thread(self, model: Any, prompt: Any, timeout: Optional[float], **kwargs) -> AsyncIterator[str]:
+        # Drive the blocking streaming iterator on the pool and hand chunks
+        # back to the event loop through a queue.
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for chunk in model.generate_content(prompt, stream=True, **kwargs):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        future = loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                item = await asyncio.wait_for(queue.get(), timeout)
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                if item:
+                    yield item
+        finally:
+            stopped.set()
+            future.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
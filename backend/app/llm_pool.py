@@ -0,0 +1,342 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .llm import ClientDisconnected, LLMClient, wait_unless_disconnected
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Statuses (google.api_core errors carry theirs as ``code``) that another
+# attempt may get past: timeouts, rate limits and server errors
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# The SDK's refusals for a prompt or answer; the same call fails the same way
+PERMANENT_ERRORS = {"BlockedPromptException", "StopCandidateException"}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether the same call could succeed if tried again"""
+    if type(error).__name__ in PERMANENT_ERRORS or isinstance(error, ValueError):
+        return False
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUSES
+    # Timeouts, dropped connections and anything unrecognized
+    return True
+
+
+class AllBackendsFailed(Exception):
+    """Raised when every model tier failed or had its breaker open"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors) or "No model backends available")
+        self.errors = errors
+
+
+class CircuitBreaker:
+    """Per-backend breaker: stop calling a model that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    calls are refused outright for ``reset_timeout`` seconds. It then lets a
+    single probe through (half-open); a success closes it again, a failure
+    re-opens it for another ``reset_timeout``.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open this claims the probe"""
+        if self.state == OPEN:
+            if self.clock() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def is_open(self) -> bool:
+        return self.state == OPEN and self.clock() - self._opened_at < self.reset_timeout
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == OPEN:
+            # A call let through before the breaker opened has failed too
+            return
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self._opened_at = self.clock()
+            self.trips += 1
+
+    def release(self):
+        """Give back a half-open probe whose call was cancelled, not failed"""
+        self._probing = False
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls, for the hedge delay"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Backend:
+    def __init__(self, name: str, model: Any, breaker: CircuitBreaker):
+        self.name = name
+        self.model = model
+        self.breaker = breaker
+        self.latencies = LatencyWindow()
+        self.calls = 0
+        self.errors = 0
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.latencies.percentile(0.95)
+        return {
+            "name": self.name,
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "trips": self.breaker.trips,
+            "calls": self.calls,
+            "errors": self.errors,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class LLMPool:
+    """Dispatch completions over an ordered list of model tiers.
+
+    Each tier is tried in order. A call failing with a retryable error (see
+    ``is_retryable``) is retried on the same tier with exponential backoff
+    (full jitter) up to ``max_retries`` times, unless the tier's circuit
+    breaker opens, in which case the pool moves straight on to the next
+    tier. Other errors go to the next tier at once and, since they say
+    nothing about the tier's health, do not count towards its breaker. With ``hedge`` enabled, a call that is still running
+    after the tier's recent p95 latency gets a second, hedged request on the
+    next healthy tier (or the same one) and whichever answers first wins.
+
+    When every tier fails ``AllBackendsFailed`` is raised and the caller
+    serves its own fallback. Backends are any objects with the
+    ``GenerativeModel`` interface, so fakes can be injected for testing.
+    """
+
+    def __init__(
+        self,
+        client: LLMClient,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 4.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        hedge: bool = False,
+        hedge_min_samples: int = 20,
+    ):
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.backends: List[Backend] = []
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.exhausted = 0
+
+    def set_backends(self, models: Sequence[Tuple[str, Any]]):
+        """Replace the tiers with ``(name, model)`` pairs, best first"""
+        self.backends = [
+            Backend(name, model, CircuitBreaker(self.failure_threshold, self.reset_timeout))
+            for name, model in models
+        ]
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _hedge_delay(self, backend: Backend) -> Optional[float]:
+        if not self.hedge or len(backend.latencies) < self.hedge_min_samples:
+            return None
+        return backend.latencies.percentile(0.95)
+
+    def _hedge_backend(self, index: int) -> Optional[Backend]:
+        for backend in self.backends[index + 1:] + [self.backends[index]]:
+            if backend.breaker.allow():
+                return backend
+        return None
+
+    async def _call(self, backend: Backend, prompt: Any, **kwargs) -> Any:
+        backend.calls += 1
+        start = time.perf_counter()
+        try:
+            response = await self.client.generate(prompt, model=backend.model, **kwargs)
+        except asyncio.CancelledError:
+            backend.breaker.release()
+            raise
+        except Exception as e:
+            backend.errors += 1
+            if is_retryable(e):
+                backend.breaker.record_failure()
+            else:
+                backend.breaker.release()
+            raise
+        backend.latencies.add(time.perf_counter() - start)
+        backend.breaker.record_success()
+        return response
+
+    async def _attempt(self, index: int, prompt: Any, **kwargs) -> Any:
+        backend = self.backends[index]
+        primary = asyncio.ensure_future(self._call(backend, prompt, **kwargs))
+        pending = {primary}
+        try:
+            delay = self._hedge_delay(backend)
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                hedge_backend = None if done else self._hedge_backend(index)
+                if hedge_backend is not None:
+                    self.hedges += 1
+                    pending.add(asyncio.ensure_future(self._call(hedge_backend, prompt, **kwargs)))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _generate(self, prompt: Any, **kwargs) -> Any:
+        errors = []
+        for index, backend in enumerate(self.backends):
+            for attempt in range(self.max_retries + 1):
+                if not backend.breaker.allow():
+                    errors.append(f"{backend.name}: circuit open")
+                    break
+                try:
+                    return await self._attempt(index, prompt, **kwargs)
+                except Exception as e:
+                    errors.append(f"{backend.name}: {e!r}")
+                    retryable = is_retryable(e)
+                if not retryable or attempt == self.max_retries or backend.breaker.is_open():
+                    break
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+        self.exhausted += 1
+        raise AllBackendsFailed(errors)
+
+    async def generate(
+        self,
+        prompt: Any,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        **kwargs,
+    ) -> Any:
+        """Generate a completion from the first tier that answers.
+
+        Raises ClientDisconnected if ``is_disconnected`` reports the client
+        gone (in-flight calls are cancelled) and AllBackendsFailed if no tier
+        produced an answer.
+        """
+        call = asyncio.ensure_future(self._generate(prompt, **kwargs))
+        try:
+            return await wait_unless_disconnected(call, is_disconnected)
+        finally:
+            if not call.done():
+                call.cancel()
+
+    async def stream(self, prompt: Any, **kwargs) -> AsyncIterator[str]:
+        """Stream from the first tier that answers.
+
+        Failures before the first chunk are retried and failed over like
+        ``generate``; once text has been sent a failure is raised, since the
+        client already has part of the answer. Streams are never hedged.
+        """
+        errors = []
+        for backend in self.backends:
+            for attempt in range(self.max_retries + 1):
+                if not backend.breaker.allow():
+                    errors.append(f"{backend.name}: circuit open")
+                    break
+                backend.calls += 1
+                produced = False
+                settled = False
+                try:
+                    async for chunk in self.client.stream(prompt, model=backend.model, **kwargs):
+                        produced = True
+                        yield chunk
+                    backend.breaker.record_success()
+                    settled = True
+                    return
+                except ClientDisconnected:
+                    raise
+                except Exception as e:
+                    backend.errors += 1
+                    retryable = is_retryable(e)
+                    if retryable:
+                        backend.breaker.record_failure()
+                    else:
+                        backend.breaker.release()
+                    settled = True
+                    if produced:
+                        raise
+                    errors.append(f"{backend.name}: {e!r}")
+                finally:
+                    if not settled:
+                        # The consumer stopped reading; that says nothing about the model
+                        backend.breaker.release()
+                if not retryable or attempt == self.max_retries or backend.breaker.is_open():
+                    break
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+        self.exhausted += 1
+        raise AllBackendsFailed(errors)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backends": [backend.stats() for backend in self.backends],
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "exhausted": self.exhausted,
+        }
@@ -0,0 +1,52 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker, so a thread lock is enough
+    fcntl = None
+
+
+class FileLock:
+    """Lock shared by every worker process that opens the same path.
+
+    Uses ``flock`` on POSIX, so the lock is released by the kernel if a
+    worker dies holding it. It is also a thread lock, so one worker's
+    threads exclude each other too. Network filesystems may not honour
+    ``flock``; keep lock files on local disk where possible.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -1,12 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
-import google.generativeai as genai
+from typing import AsyncIterator, List, Optional, Dict
 import os
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from bson import ObjectId
 from dotenv import load_dotenv
 from datetime import datetime
-import re
+from .admission import AdmissionController, LLMGate, LocalTokenBuckets, RateLimit, Rejected, StoreTokenBuckets
+from .batch import BatchRunner
+from .cache import InMemoryCacheBackend, ResponseCache
+from .config import DATA_DIR, settings
+from .context import BuiltContext, ContextBuilder
+from .database import create_store, import_legacy_json
+from .fixed_queries import FIXED_QUERIES
+from .gemini import ModelRegistry, run_in_daemon_thread
+from .intents import IntentMatcher
+from .invalidation import InvalidationBus
+from .llm import ClientDisconnected, LLMClient
+from .llm_pool import LLMPool
+from .locks import FileLock
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, ActiveSet, MetricsRegistry, process_rss_bytes
+from .profiler import SamplingProfiler
+from .retention import RetentionManager, RetentionPolicy, SessionArchive
+from .search import tokenize
+from .semantic_cache import SemanticCache
+from .serialization import HistoryCache, ResponseEncoder, accepts_gzip, dumps
+from .singleflight import SingleFlight
 
 # Load environment variables
 load_dotenv()
@@ -22,105 +50,255 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure Gemini API
+# Configure Gemini API. The model is resolved by a background task at
+# startup; until it is ready requests are served in mock mode.
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-MOCK_MODE = False
+MOCK_MODE = True
 model = None
+model_registry = ModelRegistry(
+    GEMINI_API_KEY,
+    cache_path=settings.MODEL_CACHE_PATH,
+    cache_ttl=settings.MODEL_CACHE_TTL_SECONDS,
+)
+model_resolution = None
 
 if not GEMINI_API_KEY:
     print("Warning: GEMINI_API_KEY environment variable not set. Using mock mode.")
-    MOCK_MODE = True
-else:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        # Try different model names based on API version
-        available_models = []
-        try:
-            # Get available models
-            for m in genai.list_models():
-                if 'generateContent' in m.supported_generation_methods:
-                    available_models.append(m.name)
-                    print(f"Available model: {m.name}")
-            
-            # Try different model names
-            model_candidates = [
-                "models/gemini-pro",
-                "gemini-pro",
-                "models/gemini-1.0-pro",
-                "gemini-1.0-pro",
-                "models/gemini-1.5-pro",
-                "gemini-1.5-pro"
-            ]
-            
-            for model_name in model_candidates:
-                try:
-                    model = genai.GenerativeModel(model_name=model_name)
-                    print(f"Successfully loaded model: {model_name}")
-                    break
-                except Exception as e:
-                    print(f"Failed to load model {model_name}: {e}")
-                    continue
-                    
-            if model is None:
-                print("Could not find a working model. Using mock mode.")
-                MOCK_MODE = True
-                
-        except Exception as e:
-            print(f"Error listing models: {e}")
-            MOCK_MODE = True
-            
-    except Exception as e:
-        print(f"Error configuring Gemini: {e}")
-        MOCK_MODE = True
-
-# In-memory storage for development
-chat_sessions = {}
-chat_messages = {}
-
-# Enhanced Fixed query responses for better testing
-FIXED_QUERIES = {
-    "weather": {
-        "patterns": [r"weather", r"rain", r"temperature", r"forecast", r"humidity", r"sunny", r"cloudy"],
-        "response": "For accurate weather information, I recommend checking your local weather service. Ideal farming conditions are temperatures between 15-30°C with moderate humidity (40-70%). Rainfall of 1-2 inches per week benefits most crops. Always check your local forecast before planning farming activities."
-    },
-    "soil": {
-        "patterns": [r"soil", r"ph", r"nutrient", r"fertili[sz]er", r"compost", r"manure", r"nitrogen", r"phosphorus", r"potassium"],
-        "response": "Soil health is crucial for farming. Most crops prefer a pH between 6.0-7.0. Regular soil testing every season helps determine nutrient requirements. Organic matter like compost improves soil structure and fertility. For specific recommendations, get your soil tested at a local agricultural extension office."
-    },
-    "crops": {
-        "patterns": [r"crop", r"plant", r"harvest", r"yield", r"season", r"wheat", r"rice", r"corn", r"vegetables", r"fruits"],
-        "response": "Different crops have different growing seasons and requirements. Common crops include wheat, rice, corn, and various vegetables. Crop rotation helps maintain soil health and prevent pest buildup. The best crops for your area depend on climate, soil type, and market demand."
-    },
-    "pests": {
-        "patterns": [r"pest", r"insect", r"disease", r"bug", r"infestation", r"aphid", r"caterpillar", r"fungus", r"mold"],
-        "response": "Integrated Pest Management (IPM) is recommended. This includes cultural practices (crop rotation), biological controls (beneficial insects), and careful use of pesticides. Regular monitoring helps detect issues early. For specific pest problems, consult with your local agricultural extension service."
-    },
-    "irrigation": {
-        "patterns": [r"water", r"irrigation", r"drip", r"sprinkler", r"moisture", r"watering", r"drought"],
-        "response": "Efficient irrigation saves water and improves yields. Drip irrigation can save 30-50% water compared to flood irrigation. Water requirements vary by crop and growth stage. Most crops need about 1 inch of water per week during growing season, either from rainfall or irrigation."
-    },
-    "greeting": {
-        "patterns": [r"hello", r"hi", r"hey", r"greetings", r"good morning", r"good afternoon", r"good evening"],
-        "response": "Hello! I'm your farming assistant. How can I help you with your agricultural questions today? I can assist with crop advice, soil management, pest control, irrigation, and more!"
-    },
-    "thanks": {
-        "patterns": [r"thank", r"thanks", r"appreciate", r"grateful"],
-        "response": "You're welcome! I'm happy to help with your farming questions. Is there anything else you'd like to know about agriculture or farming practices?"
+
+# Async front for the model so slow completions don't block the event loop
+llm_client = LLMClient(
+    model,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    timeout=settings.LLM_TIMEOUT_SECONDS,
+)
+
+# Ordered model tiers with retries, circuit breakers and optional hedging
+llm_pool = LLMPool(
+    llm_client,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff_base=settings.LLM_RETRY_BACKOFF_SECONDS,
+    backoff_max=settings.LLM_RETRY_BACKOFF_MAX_SECONDS,
+    failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.LLM_BREAKER_RESET_SECONDS,
+    hedge=settings.LLM_HEDGE_ENABLED,
+    hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+)
+
+# Answers from the model keyed by the normalized question
+response_cache = ResponseCache(
+    InMemoryCacheBackend(
+        max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+    ),
+    stem=settings.RESPONSE_CACHE_STEM,
+)
+
+# Near-duplicate questions ("aphids on my tomatoes" / "tomato aphids")
+semantic_cache = SemanticCache(
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+) if settings.SEMANTIC_CACHE_ENABLED else None
+
+# Identical questions asked at the same time share one model call
+llm_flights = SingleFlight()
+
+# Prior turns sent along with each question, within a token budget
+context_builder = ContextBuilder(
+    token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    summary_token_budget=settings.CONTEXT_SUMMARY_TOKEN_BUDGET,
+)
+
+# Durable chat storage shared by every endpoint (see STORAGE_BACKEND)
+store = create_store(shared_texts=[data["response"] for data in FIXED_QUERIES.values()])
+
+# Token buckets per client and per chat in front of every chat endpoint,
+# and a bounded queue in front of the model (see RATE_LIMIT_* / ADMISSION_*).
+# The gate is the only queue: past the client's own limit a call would wait
+# unseen by its timeout and its 503s.
+if settings.ADMISSION_MAX_LLM_CALLS > settings.LLM_MAX_CONCURRENCY:
+    print(
+        f"Warning: ADMISSION_MAX_LLM_CALLS={settings.ADMISSION_MAX_LLM_CALLS} is above "
+        f"LLM_MAX_CONCURRENCY={settings.LLM_MAX_CONCURRENCY}; using {settings.LLM_MAX_CONCURRENCY}."
+    )
+admission = AdmissionController(
+    StoreTokenBuckets(store) if settings.RATE_LIMIT_BACKEND == "store" else LocalTokenBuckets(),
+    per_client=RateLimit("client", settings.RATE_LIMIT_CLIENT_PER_MINUTE, settings.RATE_LIMIT_CLIENT_BURST),
+    per_chat=RateLimit("chat", settings.RATE_LIMIT_CHAT_PER_MINUTE, settings.RATE_LIMIT_CHAT_BURST),
+    llm_quota=RateLimit("llm_quota", settings.RATE_LIMIT_LLM_PER_MINUTE, settings.RATE_LIMIT_LLM_BURST),
+    gate=LLMGate(
+        limit=min(settings.ADMISSION_MAX_LLM_CALLS, settings.LLM_MAX_CONCURRENCY),
+        max_waiting=settings.ADMISSION_MAX_QUEUE,
+        timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ),
+)
+
+# Workers sharing the store tell each other to drop process-local state:
+# "chat_deleted" (key: chat_id) and "cache_cleared"
+invalidation = InvalidationBus(store, interval=settings.INVALIDATION_POLL_SECONDS)
+invalidation_task = None
+
+# Compiled once at startup; scans each message a single time
+intent_matcher = IntentMatcher(FIXED_QUERIES)
+
+# POST /chat/batch jobs, persisted in the store and resumed after a restart
+batch_runner = BatchRunner(
+    store,
+    answer=lambda message: answer_batch_question(message),
+    answer_fixed=lambda message: check_fixed_queries(message),
+    key=response_cache.key,
+    owner=invalidation.origin,
+    concurrency=settings.BATCH_CONCURRENCY,
+    stale_after=settings.BATCH_STALE_SECONDS,
+    keep_finished=settings.BATCH_JOB_RETENTION_HOURS * 3600,
+)
+batch_resumer = None
+
+# Prometheus-style metrics served on GET /metrics. Callback metrics read
+# counters the components already keep, so they cost nothing per request.
+metrics = MetricsRegistry()
+CHAT_REQUEST_SECONDS = metrics.histogram(
+    "chat_request_seconds", "End-to-end latency of chat requests", ["endpoint"]
+)
+CHAT_STAGE_SECONDS = metrics.histogram(
+    "chat_stage_seconds", "Time spent in each stage of a chat request", ["stage"]
+)
+FIXED_QUERY_HITS = metrics.counter(
+    "fixed_query_hits_total", "Messages answered from FIXED_QUERIES", ["category"]
+)
+MOCK_RESPONSES_SERVED = metrics.counter(
+    "mock_responses_total", "Canned answers served instead of a model answer", ["reason"]
+)
+metrics.counter(
+    "llm_calls_total", "Model calls per tier", ["backend"],
+    callback=lambda: {(b.name,): b.calls for b in llm_pool.backends},
+)
+metrics.counter(
+    "llm_errors_total", "Failed model calls per tier", ["backend"],
+    callback=lambda: {(b.name,): b.errors for b in llm_pool.backends},
+)
+metrics.gauge(
+    "llm_circuit_open", "1 while a tier's circuit breaker is open", ["backend"],
+    callback=lambda: {(b.name,): int(b.breaker.is_open()) for b in llm_pool.backends},
+)
+metrics.counter(
+    "llm_retries_total", "Model calls retried after a failure",
+    callback=lambda: {(): llm_pool.retries},
+)
+metrics.counter(
+    "llm_exhausted_total", "Requests where every model tier failed",
+    callback=lambda: {(): llm_pool.exhausted},
+)
+metrics.counter(
+    "cache_hits_total", "Answers served without a new model call", ["cache"],
+    callback=lambda: {
+        ("exact",): response_cache.hits,
+        ("semantic",): semantic_cache.hits if semantic_cache is not None else 0,
+        ("coalesced",): llm_flights.coalesced,
     },
-    "organic": {
-        "patterns": [r"organic", r"natural", r"chemical-free", r"pesticide-free"],
-        "response": "Organic farming focuses on using natural methods without synthetic chemicals. This includes using compost, crop rotation, biological pest control, and cover crops. Organic certification requires following specific guidelines and practices over a transition period."
+)
+metrics.counter(
+    "cache_misses_total", "Cache lookups that found nothing", ["cache"],
+    callback=lambda: {
+        ("exact",): response_cache.misses,
+        ("semantic",): semantic_cache.misses if semantic_cache is not None else 0,
     },
-    "equipment": {
-        "patterns": [r"tractor", r"equipment", r"tool", r"plow", r"harvester", r"machinery"],
-        "response": "Farm equipment depends on your scale of operation. Basic tools include plows, tillers, and harvesters. For small farms, hand tools may be sufficient, while larger operations benefit from tractors and specialized machinery. Always prioritize safety when operating farm equipment."
+)
+metrics.counter(
+    "batch_answers_total", "Batch questions answered (duplicates share one answer)",
+    callback=lambda: {(): batch_runner.answered},
+)
+metrics.gauge(
+    "batch_jobs_running", "Batch jobs this worker is answering",
+    callback=lambda: {(): len(batch_runner.tasks)},
+)
+metrics.counter(
+    "admission_rejected_total", "Requests turned away by rate limits or a full model queue", ["reason"],
+    callback=lambda: {(reason,): count for reason, count in admission.rejected.items()},
+)
+metrics.gauge(
+    "admission_llm_active", "Model calls holding an admission slot",
+    callback=lambda: {(): admission.gate.active},
+)
+metrics.gauge(
+    "admission_llm_waiting", "Requests queued for an admission slot",
+    callback=lambda: {(): admission.gate.waiting},
+)
+active_sessions = ActiveSet(window=settings.METRICS_ACTIVE_SESSION_SECONDS)
+metrics.gauge(
+    "chat_sessions_active", "Sessions that saw a message within the activity window",
+    callback=lambda: {(): len(active_sessions)},
+)
+STORE_SESSIONS = metrics.gauge("chat_store_sessions", "Chat sessions held by the store")
+STORE_MESSAGES = metrics.gauge("chat_store_messages", "Chat messages held by the store")
+STORE_BYTES = metrics.gauge("chat_store_bytes", "Approximate size of the stored chat data")
+metrics.gauge(
+    "process_resident_memory_bytes", "Resident memory of this worker",
+    callback=lambda: {(): process_rss_bytes()},
+)
+
+# Cold sessions are archived to gzip segments and rehydrated on demand.
+# Sessions in use right now are never archived under a request's feet.
+retention = RetentionManager(
+    store,
+    SessionArchive(settings.ARCHIVE_DIR, segment_max_bytes=settings.ARCHIVE_SEGMENT_MAX_MB * 2 ** 20),
+    RetentionPolicy(
+        max_sessions=settings.RETENTION_MAX_SESSIONS,
+        max_messages_per_session=settings.RETENTION_MAX_MESSAGES_PER_SESSION,
+        max_idle_seconds=settings.RETENTION_MAX_IDLE_DAYS * 86400,
+        active_seconds=settings.RETENTION_ACTIVE_SECONDS,
+    ),
+)
+retention_task = None
+metrics.gauge(
+    "chat_archived_sessions", "Chat sessions held in the on-disk archive",
+    callback=lambda: {(): len(retention.archive)},
+)
+metrics.counter(
+    "chat_retention_total", "Sessions archived, rehydrated and messages trimmed by retention", ["action"],
+    callback=lambda: {
+        ("archived",): retention.archived,
+        ("rehydrated",): retention.rehydrated,
+        ("trimmed_messages",): retention.trimmed_messages,
     },
-    "profit": {
-        "patterns": [r"profit", r"income", r"revenue", r"money", r"cost", r"expensive", r"affordable"],
-        "response": "Farm profitability depends on many factors: crop selection, market prices, input costs, and efficiency. Diversifying crops, adding value through processing, and direct marketing can increase profits. Start with a business plan and consider consulting with agricultural economists."
-    }
-}
+)
+
+# History and sidebar pages are encoded with orjson (byte for byte what
+# JSONResponse produced) and gzipped when large; history windows are kept
+# encoded until the chat changes (see HISTORY_CACHE_MAX_MB / RESPONSE_GZIP_*)
+history_cache = HistoryCache(max_bytes=int(settings.HISTORY_CACHE_MAX_MB * 2 ** 20))
+response_encoder = ResponseEncoder(
+    gzip_min_bytes=settings.RESPONSE_GZIP_MIN_BYTES,
+    gzip_level=settings.RESPONSE_GZIP_LEVEL,
+)
+metrics.counter(
+    "history_cache_hits_total", "Chat history windows served already encoded",
+    callback=lambda: {(): history_cache.hits},
+)
+metrics.counter(
+    "history_cache_misses_total", "Chat history windows encoded on request",
+    callback=lambda: {(): history_cache.misses},
+)
+metrics.gauge(
+    "history_cache_bytes", "Encoded chat history held by this worker",
+    callback=lambda: {(): history_cache.bytes},
+)
+
+# Only one sampling profile runs at a time
+profiler_lock = asyncio.Lock()
+
+def forget_chat(chat_id: str):
+    """Drop what this worker keeps in process about a deleted chat"""
+    context_builder.forget(chat_id)
+    active_sessions.discard(chat_id)
+    history_cache.invalidate(chat_id)
+
+def clear_response_caches(_key: str = ""):
+    response_cache.clear()
+    if semantic_cache is not None:
+        semantic_cache.clear()
+
+invalidation.subscribe("chat_deleted", forget_chat)
+invalidation.subscribe("cache_cleared", clear_response_caches)
 
 class MessageRequest(BaseModel):
     message: str
@@ -130,6 +308,11 @@ class MessageResponse(BaseModel):
     response: str
     chat_id: str
     chat_title: str
+    prompt_tokens: Optional[int] = None
+
+class BatchRequest(BaseModel):
+    messages: List[str]
+    stream: bool = True
 
 class ChatMessage(BaseModel):
     sender: str
@@ -142,16 +325,35 @@ class ChatSession(BaseModel):
     created_at: datetime
     updated_at: datetime
 
+@app.exception_handler(Rejected)
+async def admission_rejected(request: Request, rejection: Rejected):
+    return JSONResponse(
+        {"detail": rejection.detail},
+        status_code=rejection.status_code,
+        headers={"Retry-After": str(rejection.retry_after)}
+    )
+
+def client_address(http_request: Request) -> str:
+    """The address rate limits are charged to"""
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = http_request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return http_request.client.host if http_request.client else "unknown"
+
+async def discard_new_chat(chat_id: str, requested_chat_id: Optional[str]):
+    """Remove a chat created by a request that was then turned away"""
+    if chat_id != requested_chat_id:
+        await asyncio.to_thread(store.delete_session, chat_id)
+        active_sessions.discard(chat_id)
+
 def check_fixed_queries(message: str) -> Optional[str]:
     """Check if the message matches any fixed query patterns"""
-    message_lower = message.lower()
-    
-    for query_type, query_data in FIXED_QUERIES.items():
-        for pattern in query_data["patterns"]:
-            if re.search(pattern, message_lower, re.IGNORECASE):
-                return query_data["response"]
-    
-    return None
+    intent = intent_matcher.best(message)
+    if intent is None:
+        return None
+    FIXED_QUERY_HITS.inc(intent.category)
+    return FIXED_QUERIES[intent.category]["response"]
 
 def generate_chat_title(message: str) -> str:
     """Generate a title for the chat based on the first message"""
@@ -172,38 +374,154 @@ async def root():
         "status": "running", 
         "mock_mode": MOCK_MODE,
         "model_available": model is not None,
+        "model_status": model_registry.status,
         "fixed_queries": list(FIXED_QUERIES.keys())
     }
 
+MOCK_RESPONSES = [
+    "Hello! I'm your farming assistant. How can I help you with your agricultural questions today?",
+    "For better crop yield, consider rotating your crops seasonally. This helps prevent soil nutrient depletion.",
+    "Organic fertilizers like compost can improve soil health significantly. They add nutrients and improve soil structure.",
+    "Proper irrigation scheduling is crucial for water conservation. Drip irrigation can save up to 50% water compared to flood irrigation.",
+    "Integrated Pest Management (IPM) combines biological, cultural, and chemical methods for effective pest control.",
+    "Soil testing every season helps determine nutrient requirements accurately. This prevents over-fertilization.",
+    "Cover crops like legumes can fix nitrogen in the soil naturally, reducing fertilizer needs.",
+    "Proper spacing between plants ensures good air circulation and reduces disease spread.",
+    "Mulching helps retain soil moisture and suppress weeds naturally.",
+    "Crop diversity in your fields can help break pest and disease cycles naturally.",
+    "Monitoring weather patterns helps plan farming activities and protect crops from extreme conditions."
+]
+
+FALLBACK_RESPONSES = [
+    "For better yields, ensure proper soil preparation before planting.",
+    "Regular crop monitoring helps detect pests and diseases early.",
+    "Water management is key - consider rainwater harvesting for irrigation."
+]
+
+# Page size bounds for GET /chats
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+# Deep pages of ranked results are costly and rarely wanted
+MAX_SEARCH_OFFSET = 1000
+
+# Largest window GET /chats/{chat_id} hands out in one response
+MAX_HISTORY_WINDOW = 500
+
+# How often a streamed answer is written back to storage while it grows
+STREAM_FLUSH_INTERVAL = 1.0
+
+def build_farming_prompt(message: str) -> str:
+    """Wrap the farmer's question in the agricultural expert prompt"""
+    return f"""You are an agricultural expert assistant helping farmers. Provide helpful, accurate, practical advice about:
+- Crop cultivation best practices
+- Soil health and fertilization
+- Pest and disease management
+- Irrigation and water management techniques
+- Livestock care and management
+- Sustainable farming methods
+- Organic farming practices
+- Weather impact on farming
+- Government schemes for farmers (if applicable)
+
+Question: {message}
+
+Please provide a concise, practical answer focused on actionable advice:"""
+
+def find_session(chat_id: str) -> Optional[dict]:
+    """Look a session up, bringing it back from the archive if it was retired.
+
+    Store and archive I/O: call it from a worker thread, not the event loop.
+    """
+    session = store.get_session(chat_id)
+    if session is None and chat_id in retention.archive:
+        session = retention.rehydrate(chat_id)
+    return session
+
+def open_session(chat_id: str) -> Optional[dict]:
+    """find_session() for a new turn: bumps updated_at so retention leaves it be (blocking)"""
+    session = find_session(chat_id)
+    if session is not None:
+        store.update_session(chat_id, updated_at=datetime.now())
+    return session
+
+def new_chat_id() -> str:
+    """Id for a new chat, unique across workers and hosts without coordination"""
+    return str(ObjectId())
+
+async def get_or_create_chat(message: str, chat_id: Optional[str]) -> tuple:
+    """Return (chat_id, chat_title), creating a new session if needed"""
+    if chat_id:
+        session = await asyncio.to_thread(open_session, chat_id)
+        if session:
+            active_sessions.touch(chat_id)
+            return chat_id, session["title"]
+
+    chat_id = new_chat_id()
+    chat_title = generate_chat_title(message)
+    await asyncio.to_thread(store.create_session, chat_id, chat_title, datetime.now())
+    active_sessions.touch(chat_id)
+    return chat_id, chat_title
+
+def new_message(sender: str, text: str) -> dict:
+    """Build a message ready to be stored"""
+    return {
+        "sender": sender,
+        "text": text,
+        "timestamp": datetime.now()
+    }
+
+async def build_context(chat_id: str, message: str) -> BuiltContext:
+    """Assemble the model input for a question from the chat's recent history"""
+    history = await asyncio.to_thread(store.get_messages, chat_id, limit=settings.CONTEXT_HISTORY_MESSAGES)
+    return context_builder.build(chat_id, history, build_farming_prompt(message))
+
+def append_turn(chat_id: str, messages: List[dict]) -> List[int]:
+    """Store a turn's messages and trim the chat if it grew past its cap (blocking)"""
+    message_ids = store.add_messages(chat_id, messages)
+    retention.after_append(chat_id, message_ids[-1])
+    history_cache.invalidate(chat_id)
+    return message_ids
+
+def save_streamed_answer(chat_id: str, message_id: int, text: str):
+    """Write a streamed answer so far; bumping updated_at also changes the history ETag (blocking)"""
+    store.update_message_text(chat_id, message_id, text)
+    store.update_session(chat_id, updated_at=datetime.now())
+    history_cache.invalidate(chat_id)
+
+def lookup_cached_answer(message: str) -> Optional[str]:
+    """Return a previous model answer for this or a near-identical question"""
+    cached_response = response_cache.get(message)
+    if cached_response is None and semantic_cache is not None:
+        cached_response = semantic_cache.get(message)
+    return cached_response
+
+def remember_answer(message: str, response_text: str):
+    """Store a fresh model answer in the response caches"""
+    response_cache.set(message, response_text)
+    if semantic_cache is not None:
+        semantic_cache.add(message, response_text)
+
+def split_into_chunks(text: str) -> List[str]:
+    """Split a canned answer into word-sized chunks for streaming"""
+    return re.findall(r"\S+\s*", text) or [text]
+
 @app.post("/chat", response_model=MessageResponse)
-async def chat_with_ai(request: MessageRequest):
+async def chat_with_ai(request: MessageRequest, http_request: Request):
+    await admission.check(client_address(http_request), request.chat_id)
+    start = time.perf_counter()
     try:
         # Check for fixed queries first
-        fixed_response = check_fixed_queries(request.message)
+        with CHAT_STAGE_SECONDS.time("fixed_query"):
+            fixed_response = check_fixed_queries(request.message)
         
         # Get or create chat session
-        if request.chat_id and request.chat_id in chat_sessions:
-            chat_id = request.chat_id
-            chat_title = chat_sessions[chat_id]["title"]
-        else:
-            # Create a new chat session
-            chat_id = str(datetime.now().timestamp())
-            chat_title = generate_chat_title(request.message)
-            chat_sessions[chat_id] = {
-                "chat_id": chat_id,
-                "title": chat_title,
-                "created_at": datetime.now(),
-                "updated_at": datetime.now()
-            }
-            chat_messages[chat_id] = []
+        with CHAT_STAGE_SECONDS.time("session"):
+            chat_id, chat_title = await get_or_create_chat(request.message, request.chat_id)
         
-        # Save user message
-        user_message = {
-            "sender": "user",
-            "text": request.message,
-            "timestamp": datetime.now()
-        }
-        chat_messages[chat_id].append(user_message)
+        user_message = new_message("user", request.message)
+        prompt_tokens = None
         
         # Generate AI response
         if fixed_response:
@@ -211,130 +529,650 @@ async def chat_with_ai(request: MessageRequest):
             response_text = fixed_response
         elif MOCK_MODE or model is None:
             # Mock response for testing without API key or model
-            farming_responses = [
-                "Hello! I'm your farming assistant. How can I help you with your agricultural questions today?",
-                "For better crop yield, consider rotating your crops seasonally. This helps prevent soil nutrient depletion.",
-                "Organic fertilizers like compost can improve soil health significantly. They add nutrients and improve soil structure.",
-                "Proper irrigation scheduling is crucial for water conservation. Drip irrigation can save up to 50% water compared to flood irrigation.",
-                "Integrated Pest Management (IPM) combines biological, cultural, and chemical methods for effective pest control.",
-                "Soil testing every season helps determine nutrient requirements accurately. This prevents over-fertilization.",
-                "Cover crops like legumes can fix nitrogen in the soil naturally, reducing fertilizer needs.",
-                "Proper spacing between plants ensures good air circulation and reduces disease spread.",
-                "Mulching helps retain soil moisture and suppress weeds naturally.",
-                "Crop diversity in your fields can help break pest and disease cycles naturally.",
-                "Monitoring weather patterns helps plan farming activities and protect crops from extreme conditions."
-            ]
-            import random
-            response_text = random.choice(farming_responses)
+            MOCK_RESPONSES_SERVED.inc("mock_mode")
+            response_text = random.choice(MOCK_RESPONSES)
         else:
-            try:
-                # Create farming-specific prompt
-                farming_prompt = f"""You are an agricultural expert assistant helping farmers. Provide helpful, accurate, practical advice about:
-- Crop cultivation best practices
-- Soil health and fertilization
-- Pest and disease management
-- Irrigation and water management techniques
-- Livestock care and management
-- Sustainable farming methods
-- Organic farming practices
-- Weather impact on farming
-- Government schemes for farmers (if applicable)
-
-Question: {request.message}
-
-Please provide a concise, practical answer focused on actionable advice:"""
-                
-                response = model.generate_content(farming_prompt)
-                response_text = response.text
-            except Exception as e:
-                response_text = f"Error calling AI API: {str(e)}. Using mock response."
-                # Fallback to mock response
-                farming_responses = [
-                    "For better yields, ensure proper soil preparation before planting.",
-                    "Regular crop monitoring helps detect pests and diseases early.",
-                    "Water management is key - consider rainwater harvesting for irrigation."
-                ]
-                import random
-                response_text = random.choice(farming_responses)
-        
-        # Save AI response
-        ai_message = {
-            "sender": "assistant",
-            "text": response_text,
-            "timestamp": datetime.now()
-        }
-        chat_messages[chat_id].append(ai_message)
+            with CHAT_STAGE_SECONDS.time("context"):
+                context = await build_context(chat_id, request.message)
+            # Cached answers are only safe for questions asked without history
+            cacheable = context.standalone
+            with CHAT_STAGE_SECONDS.time("cache"):
+                cached_response = lookup_cached_answer(request.message) if cacheable else None
+            if cached_response is not None:
+                response_text = cached_response
+            else:
+                prompt_tokens = context.prompt_tokens
+                with CHAT_STAGE_SECONDS.time("llm"):
+                    response_text = await generate_answer(
+                        request.message, context, cacheable, http_request.is_disconnected
+                    )
         
-        # Update chat session timestamp
-        chat_sessions[chat_id]["updated_at"] = datetime.now()
+        # Save both messages (and bump the session timestamp) in one batch
+        with CHAT_STAGE_SECONDS.time("persist"):
+            try:
+                await asyncio.to_thread(append_turn, chat_id, [user_message, new_message("assistant", response_text)])
+            except KeyError:
+                # Deleted while the answer was being generated
+                raise HTTPException(status_code=404, detail="Chat session not found")
         
         return MessageResponse(
             response=response_text, 
             chat_id=chat_id,
-            chat_title=chat_title
+            chat_title=chat_title,
+            prompt_tokens=prompt_tokens
         )
     
+    except Rejected:
+        await discard_new_chat(chat_id, request.chat_id)
+        raise
+    except ClientDisconnected:
+        # Nobody is listening any more; the answer is simply dropped
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+    finally:
+        CHAT_REQUEST_SECONDS.observe(time.perf_counter() - start, "/chat")
+
+def fallback_answer(message: str) -> str:
+    """Answer to serve when every model tier failed"""
+    MOCK_RESPONSES_SERVED.inc("fallback")
+    return random.choice(FALLBACK_RESPONSES)
+
+async def admitted_generate(contents, is_disconnected=None):
+    """One model call, made once admission control grants it a slot"""
+    with CHAT_STAGE_SECONDS.time("queue"):
+        slot = await admission.llm_slot()
+    async with slot:
+        return await llm_pool.generate(contents, is_disconnected=is_disconnected)
+
+async def generate_answer(message: str, context: BuiltContext, cacheable: bool, is_disconnected=None) -> str:
+    """Ask the model pool, falling back to a canned answer if every tier fails.
+
+    Raises Rejected when admission control turns the model call away.
+    """
+    try:
+        if cacheable:
+            # Context-free questions are coalesced on their normalized text;
+            # every caller still stores the answer in its own chat. Only the
+            # shared call waits for a slot, so followers never queue for one.
+            response = await llm_flights.do(
+                response_cache.key(message),
+                lambda: admitted_generate(context.contents),
+                is_disconnected=is_disconnected
+            )
+            remember_answer(message, response.text)
+        else:
+            response = await admitted_generate(context.contents, is_disconnected=is_disconnected)
+        return response.text
+    except (ClientDisconnected, Rejected):
+        raise
+    except Exception as e:
+        print(f"Error calling AI API: {e}. Using fallback response.")
+        return fallback_answer(message)
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format a Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+async def stream_answer_chunks(
+    message: str,
+    ready_response: Optional[str],
+    context: Optional[BuiltContext]
+) -> AsyncIterator[str]:
+    """Yield the answer for a message chunk by chunk, whatever its source.
+
+    ``ready_response`` is a fixed-query or cached answer found up front.
+    """
+    if ready_response is not None:
+        for chunk in split_into_chunks(ready_response):
+            yield chunk
+        return
+
+    if context is None:
+        MOCK_RESPONSES_SERVED.inc("mock_mode")
+        for chunk in split_into_chunks(random.choice(MOCK_RESPONSES)):
+            yield chunk
+        return
+
+    cacheable = context.standalone
+    produced = []
+    try:
+        async for chunk in llm_pool.stream(context.contents):
+            produced.append(chunk)
+            yield chunk
+        if cacheable:
+            remember_answer(message, "".join(produced))
+    except Exception as e:
+        print(f"Error streaming from AI API: {e}. Using fallback response.")
+        if produced:
+            return
+        for chunk in split_into_chunks(fallback_answer(message)):
+            yield chunk
+
+@app.post("/chat/stream")
+async def chat_with_ai_stream(request: MessageRequest, http_request: Request):
+    """Same as /chat but streams the answer as Server-Sent Events.
+
+    Emits a ``meta`` event with the chat id/title, one unnamed event per text
+    chunk (``{"delta": ...}``) and a final ``done`` event with the full text.
+    The assistant message is stored up front and grows as chunks arrive.
+    """
+    await admission.check(client_address(http_request), request.chat_id)
+    start = time.perf_counter()
+    with CHAT_STAGE_SECONDS.time("session"):
+        chat_id, chat_title = await get_or_create_chat(request.message, request.chat_id)
+    with CHAT_STAGE_SECONDS.time("fixed_query"):
+        ready_response = check_fixed_queries(request.message)
+    context = None
+    slot = None
+    if not ready_response and not (MOCK_MODE or model is None):
+        # Built before this turn is stored so it only sees earlier messages
+        with CHAT_STAGE_SECONDS.time("context"):
+            context = await build_context(chat_id, request.message)
+        if context.standalone:
+            with CHAT_STAGE_SECONDS.time("cache"):
+                ready_response = lookup_cached_answer(request.message)
+        if ready_response is None:
+            # Admitted before the stream starts, so a busy model gets a real 503;
+            # the slot is held until the last chunk is out
+            try:
+                with CHAT_STAGE_SECONDS.time("queue"):
+                    slot = await admission.llm_slot()
+            except Rejected:
+                await discard_new_chat(chat_id, request.chat_id)
+                raise
+            # The same question may have been answered while this one queued
+            if context.standalone:
+                ready_response = lookup_cached_answer(request.message)
+                if ready_response is not None:
+                    slot.release()
+                    slot = None
+    with CHAT_STAGE_SECONDS.time("persist"):
+        try:
+            _, ai_message_id = await asyncio.to_thread(
+                append_turn, chat_id, [new_message("user", request.message), new_message("assistant", "")]
+            )
+        except KeyError:
+            if slot is not None:
+                slot.release()
+            raise HTTPException(status_code=404, detail="Chat session not found")
+
+    async def event_stream():
+        yield sse_event({"chat_id": chat_id, "chat_title": chat_title}, event="meta")
+
+        chunks = []
+        last_flush = time.monotonic()
+        try:
+            async for chunk in stream_answer_chunks(request.message, ready_response, context):
+                chunks.append(chunk)
+                yield sse_event({"delta": chunk})
+                # Persist the partial answer now and then rather than per chunk
+                if time.monotonic() - last_flush >= STREAM_FLUSH_INTERVAL:
+                    await asyncio.to_thread(save_streamed_answer, chat_id, ai_message_id, "".join(chunks))
+                    last_flush = time.monotonic()
+        finally:
+            if slot is not None:
+                slot.release()
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - start, "/chat/stream")
+            # Shielded so a client going away can't cut the last write short
+            await asyncio.shield(asyncio.to_thread(save_streamed_answer, chat_id, ai_message_id, "".join(chunks)))
+
+        yield sse_event({
+            "response": "".join(chunks),
+            "chat_id": chat_id,
+            "chat_title": chat_title,
+            "prompt_tokens": context.prompt_tokens if context else None
+        }, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def answer_batch_question(message: str) -> tuple:
+    """Answer one batch question without chat history; return (text, source).
+
+    Model calls go through admission control like /chat ones; when the model
+    is busy or over quota the job waits its turn instead of failing.
+    """
+    if MOCK_MODE or model is None:
+        MOCK_RESPONSES_SERVED.inc("mock_mode")
+        return random.choice(MOCK_RESPONSES), "mock"
+    context = context_builder.build(None, [], build_farming_prompt(message))
+    while True:
+        cached_response = lookup_cached_answer(message)
+        if cached_response is not None:
+            return cached_response, "cache"
+        try:
+            return await generate_answer(message, context, cacheable=True), "model"
+        except Rejected as rejection:
+            await asyncio.sleep(rejection.retry_after)
+
+def batch_job_line(job: dict) -> dict:
+    return {
+        "type": "job",
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "total": job["total"],
+        "completed": job["completed"],
+    }
+
+async def batch_ndjson(job_id: str, after: int = 0) -> AsyncIterator[str]:
+    """A job's progress as NDJSON: a status line, answers as they land, a final status line"""
+    yield json.dumps(batch_job_line(await asyncio.to_thread(store.get_job, job_id))) + "\n"
+    async for item in batch_runner.results(job_id, after_seq=after):
+        yield json.dumps({"type": "result", **item}) + "\n"
+    yield json.dumps(batch_job_line(await asyncio.to_thread(store.get_job, job_id))) + "\n"
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchRequest, http_request: Request):
+    """Answer many independent questions (e.g. a co-op's spreadsheet) as one job.
+
+    Each question is answered without chat history and nothing is added to
+    the sidebar. Fixed-query hits are resolved at once, identical questions
+    are answered once, and the rest go to the model a few at a time.
+    Answers stream back as NDJSON in the order they complete, each with its
+    ``index`` in ``messages``; with ``stream: false`` the job id comes back
+    straight away (202) for polling. The job carries on if the client goes
+    away, and is picked up by another worker if this one restarts.
+    """
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="No messages to answer")
+    if len(request.messages) > settings.BATCH_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=413, detail=f"At most {settings.BATCH_MAX_MESSAGES} messages per batch"
+        )
+
+    # One request token per batch; each model call it makes takes a slot
+    # and a quota token of its own (see answer_batch_question)
+    await admission.check(client_address(http_request))
+    job = await batch_runner.submit(request.messages)
+    if not request.stream:
+        return JSONResponse(batch_job_line(job), status_code=202)
+    return StreamingResponse(
+        batch_ndjson(job["job_id"]),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/chat/batch/{job_id}")
+async def get_batch_job(job_id: str):
+    """Status of a batch job and every answer so far, in question order"""
+    job = await asyncio.to_thread(store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    items = await asyncio.to_thread(store.job_items, job_id)
+    return {
+        **batch_job_line(job),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "results": [
+            {name: item[name] for name in ("index", "message", "response", "source")}
+            for item in items
+            if item["seq"] is not None
+        ]
+    }
+
+@app.get("/chat/batch/{job_id}/stream")
+async def stream_batch_job(job_id: str, after: int = Query(0, ge=0, description="Last seq already received")):
+    """Follow a batch job as NDJSON, e.g. to pick a dropped stream up again"""
+    if await asyncio.to_thread(store.get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return StreamingResponse(
+        batch_ndjson(job_id, after),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def history_etag(session: dict, limit: Optional[int], before: Optional[int], after: Optional[int]) -> str:
+    """Weak validator for one window of a chat's history"""
+    version = f"{session['chat_id']}|{session['title']}|{session['updated_at'].isoformat()}|{session['message_count']}"
+    window = f"{limit}|{before}|{after}"
+    digest = hashlib.sha1(f"{version}|{window}".encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
 
 @app.get("/chats/{chat_id}")
-async def get_chat_history(chat_id: str):
-    if chat_id not in chat_messages:
+async def get_chat_history(
+    chat_id: str,
+    http_request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_WINDOW),
+    before: Optional[int] = Query(None, description="Only messages with a smaller id"),
+    after: Optional[int] = Query(None, description="Only messages with a larger id (poll for new ones)")
+):
+    session = await asyncio.to_thread(find_session, chat_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Chat session not found")
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
     
-    return {
+    etag = history_etag(session, limit, before, after)
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    accept_encoding = http_request.headers.get("accept-encoding")
+    encoded = history_cache.get(chat_id, etag)
+    if encoded is not None:
+        return response_encoder.response(encoded, accept_encoding, headers={"ETag": etag})
+    
+    # Fetch one extra message to know whether the window is complete
+    messages = await asyncio.to_thread(
+        retention.get_messages,
+        chat_id,
+        limit=limit + 1 if limit is not None else None,
+        before=before,
+        after=after
+    )
+    has_more = limit is not None and len(messages) > limit
+    if has_more:
+        messages = messages[:limit] if after is not None else messages[1:]
+    
+    payload = {
         "chat_id": chat_id,
-        "title": chat_sessions.get(chat_id, {}).get("title", "Unknown"),
-        "messages": chat_messages[chat_id],
-        "created_at": chat_sessions.get(chat_id, {}).get("created_at", datetime.now()),
-        "updated_at": chat_sessions.get(chat_id, {}).get("updated_at", datetime.now())
+        "title": session["title"],
+        "messages": [
+            {
+                "id": message["id"],
+                "sender": message["sender"],
+                "text": message["text"],
+                "timestamp": message["timestamp"]
+            }
+            for message in messages
+        ],
+        "created_at": session["created_at"],
+        "updated_at": session["updated_at"],
+        "message_count": session["message_count"],
+        "has_more": has_more
     }
+    encoded = response_encoder.encode(dumps(payload))
+    history_cache.put(chat_id, etag, encoded)
+    return response_encoder.response(encoded, accept_encoding, headers={"ETag": etag})
+
+def encode_cursor(session: dict) -> str:
+    """Opaque cursor pointing just below a session in updated_at order"""
+    raw = f"{session['updated_at'].isoformat()}|{session['chat_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        updated_at, chat_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(updated_at), chat_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.get("/chats")
-async def get_all_chat_sessions():
-    # Sort chats by updated_at in descending order
-    sorted_sessions = sorted(
-        chat_sessions.values(),
-        key=lambda x: x["updated_at"],
-        reverse=True
+async def get_all_chat_sessions(
+    http_request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None
+):
+    # Sessions come back sorted by updated_at in descending order, one page
+    # at a time; pass next_cursor as ``before`` to fetch the following page.
+    # Archived sessions are listed too and come back when opened.
+    sessions = await asyncio.to_thread(
+        retention.list_sessions,
+        limit=limit + 1,
+        before=decode_cursor(before) if before else None
     )
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
     
-    return {
+    payload = {
         "sessions": [
             {
                 "chat_id": session["chat_id"],
                 "title": session["title"],
                 "created_at": session["created_at"],
                 "updated_at": session["updated_at"],
-                "message_count": len(chat_messages.get(session["chat_id"], []))
+                "message_count": session["message_count"]
             }
-            for session in sorted_sessions
-        ]
+            for session in sessions
+        ],
+        "next_cursor": encode_cursor(sessions[-1]) if has_more else None
     }
+    accept_encoding = http_request.headers.get("accept-encoding")
+    encoded = response_encoder.encode(dumps(payload), compressed=accepts_gzip(accept_encoding))
+    return response_encoder.response(encoded, accept_encoding)
 
 @app.delete("/chats/{chat_id}")
 async def delete_chat_session(chat_id: str):
-    if chat_id in chat_sessions:
-        del chat_sessions[chat_id]
-    
-    if chat_id in chat_messages:
-        del chat_messages[chat_id]
+    await asyncio.to_thread(store.delete_session, chat_id)
+    await asyncio.to_thread(retention.forget, chat_id)
+    await invalidation.publish("chat_deleted", chat_id)
     
     return {"message": "Chat session deleted successfully"}
 
 @app.put("/chats/{chat_id}/title")
 async def update_chat_title(chat_id: str, title: str):
-    if chat_id not in chat_sessions:
+    if await asyncio.to_thread(find_session, chat_id) is None:
         raise HTTPException(status_code=404, detail="Chat session not found")
     
     if not title.strip():
         raise HTTPException(status_code=400, detail="Title cannot be empty")
     
-    chat_sessions[chat_id]["title"] = title.strip()
-    chat_sessions[chat_id]["updated_at"] = datetime.now()
+    await asyncio.to_thread(store.update_session, chat_id, title=title.strip(), updated_at=datetime.now())
+    history_cache.invalidate(chat_id)
     
     return {"message": "Chat title updated successfully"}
 
+def search_with_titles(q: str, chat_id: Optional[str], limit: int, offset: int) -> List[dict]:
+    """Search hits, each with its chat's title (blocking)"""
+    hits = store.search_messages(q, chat_id=chat_id, limit=limit, offset=offset)
+    titles: Dict[str, Optional[str]] = {}
+    for hit in hits:
+        if hit["chat_id"] not in titles:
+            session = store.get_session(hit["chat_id"])
+            titles[hit["chat_id"]] = session["title"] if session else None
+        hit["chat_title"] = titles[hit["chat_id"]]
+    return hits
+
+@app.get("/search")
+async def search_chats(
+    q: str,
+    chat_id: Optional[str] = None,
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET)
+):
+    """Full-text search over every stored message, best match first (BM25).
+
+    Every word of ``q`` must appear; ``chat_id`` searches one chat only.
+    Each result carries its chat's title, a ``snippet`` around the match and
+    ``highlights``, the ``[start, end)`` offsets of matched words within it.
+    Pass ``next_offset`` as ``offset`` for the following page. Archived chats
+    are only searched once reopened, or when named in ``chat_id``; messages
+    trimmed off long chats are not searched.
+    """
+    if not tokenize(q):
+        raise HTTPException(status_code=400, detail="Search query has no words")
+    # Searching one archived chat brings it back first
+    if chat_id is not None and await asyncio.to_thread(find_session, chat_id) is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+
+    start = time.perf_counter()
+    try:
+        hits = await asyncio.to_thread(search_with_titles, q, chat_id, limit + 1, offset)
+    except NotImplementedError:
+        # The memory store without MEMORY_STORE_FULL_TEXT
+        raise HTTPException(status_code=501, detail="Search is not enabled for this store")
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    CHAT_REQUEST_SECONDS.observe(time.perf_counter() - start, "/search")
+
+    return {
+        "query": q,
+        "results": hits,
+        "next_offset": offset + limit if has_more else None
+    }
+
+async def resolve_model():
+    """Background task: swap the real model in once it is available"""
+    global model, MOCK_MODE
+    resolved = await model_registry.resolve()
+    if resolved is not None:
+        llm_pool.set_backends(model_registry.models)
+        llm_client.model = resolved
+        model = resolved
+        MOCK_MODE = False
+
+@app.on_event("startup")
+async def start_model_resolution():
+    global model_resolution
+    if GEMINI_API_KEY:
+        model_resolution = asyncio.create_task(resolve_model())
+
+def import_legacy_chats_once() -> int:
+    """Import the legacy JSON dumps unless some worker already has (blocking)"""
+    # Every worker runs this; only the first one to get here imports
+    with FileLock(settings.LEGACY_IMPORT_LOCK_PATH):
+        return import_legacy_json(store, DATA_DIR)
+
+@app.on_event("startup")
+async def import_legacy_chats():
+    try:
+        imported = await asyncio.to_thread(import_legacy_chats_once)
+        if imported:
+            print(f"Imported {imported} chat sessions from legacy JSON files")
+    except Exception as e:
+        print(f"Could not import legacy chats: {e}")
+
+@app.on_event("startup")
+async def load_semantic_cache():
+    if semantic_cache is not None:
+        try:
+            semantic_cache.load(settings.SEMANTIC_CACHE_PATH)
+        except Exception as e:
+            print(f"Could not load semantic cache: {e}")
+
+async def run_retention():
+    """Background task: apply the retention policy every few minutes"""
+    while True:
+        try:
+            await retention.enforce()
+        except Exception as e:
+            print(f"Retention run failed: {e}")
+        await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def start_retention():
+    global retention_task
+    policy = retention.policy
+    if policy.max_sessions or policy.max_idle_seconds:
+        retention_task = asyncio.create_task(run_retention())
+
+@app.on_event("startup")
+async def start_invalidation():
+    global invalidation_task
+    # Start reading the event log from its current end
+    invalidation.poll()
+    if settings.INVALIDATION_POLL_SECONDS > 0:
+        invalidation_task = asyncio.create_task(invalidation.run())
+
+@app.on_event("startup")
+async def start_batch_resumer():
+    global batch_resumer
+    batch_resumer = asyncio.create_task(batch_runner.run_resumer())
+
+@app.on_event("shutdown")
+async def shutdown_llm_client():
+    if model_resolution is not None:
+        model_resolution.cancel()
+    if retention_task is not None:
+        retention_task.cancel()
+    if invalidation_task is not None:
+        invalidation_task.cancel()
+    if batch_resumer is not None:
+        batch_resumer.cancel()
+    batch_runner.shutdown()
+    llm_client.shutdown()
+    store.close()
+    if semantic_cache is not None:
+        try:
+            semantic_cache.save(settings.SEMANTIC_CACHE_PATH)
+        except Exception as e:
+            print(f"Could not save semantic cache: {e}")
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Endpoint to inspect the LLM response caches"""
+    stats = response_cache.stats()
+    if semantic_cache is not None:
+        stats["semantic"] = semantic_cache.stats()
+    stats["coalescing"] = llm_flights.stats()
+    return stats
+
+@app.delete("/cache")
+async def clear_cache():
+    """Drop every cached model answer, on all workers"""
+    await invalidation.publish("cache_cleared")
+    return {"message": "Response caches cleared"}
+
+@app.get("/worker")
+async def get_worker():
+    """Endpoint to see which worker answered and the invalidations it exchanged"""
+    return invalidation.stats()
+
+@app.get("/llm/stats")
+async def get_llm_stats():
+    """Endpoint to inspect the model tiers: breaker state, errors, latency"""
+    return llm_pool.stats()
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    """Endpoint to inspect admission control: limits, model queue, rejections by reason"""
+    return admission.stats()
+
+@app.get("/retention/stats")
+async def get_retention_stats():
+    """Endpoint to inspect retention: policy, archive size, last run's memory report"""
+    return await asyncio.to_thread(retention.stats)
+
+@app.post("/retention/run")
+async def run_retention_now():
+    """Apply the retention policy now and return the before/after memory report"""
+    return await retention.enforce()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    size = await asyncio.to_thread(store.size)
+    STORE_SESSIONS.set(size["sessions"])
+    STORE_MESSAGES.set(size["messages"])
+    STORE_BYTES.set(size["bytes"])
+    return Response(metrics.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+@app.get("/debug/profile")
+async def profile_worker(
+    seconds: float = Query(10.0, gt=0, le=120),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    all_threads: bool = False
+):
+    """Sample this worker's stacks for a while and return collapsed stacks.
+
+    Only available with PROFILER_ENABLED=true. Requests keep being served
+    while sampling; feed the output to flamegraph.pl or speedscope.
+    """
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if profiler_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with profiler_lock:
+        # This handler runs on the event loop thread, which is the hot path
+        profiler = SamplingProfiler(
+            interval=interval_ms / 1000,
+            thread_id=threading.get_ident(),
+            all_threads=all_threads
+        )
+        await run_in_daemon_thread(lambda: profiler.run(seconds), name="profiler")
+
+    return Response(
+        profiler.collapsed(),
+        media_type="text/plain",
+        headers={"X-Profile-Samples": str(profiler.samples)}
+    )
+
 @app.get("/test-queries")
 async def get_test_queries():
     """Endpoint to get sample test queries for testing fixed responses"""
@@ -378,21 +1216,13 @@ async def get_test_queries():
     return {"test_queries": test_queries}
 
 @app.get("/models")
-async def get_available_models():
-    """Endpoint to check available models"""
+async def get_available_models(refresh: bool = False):
+    """Endpoint to check available models (served from the cached listing)"""
     if not GEMINI_API_KEY:
         return {"error": "GEMINI_API_KEY not set"}
     
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        models = []
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                models.append({
-                    "name": m.name,
-                    "display_name": m.display_name,
-                    "supported_methods": m.supported_generation_methods
-                })
+        models = await run_in_daemon_thread(lambda: model_registry.list_models(refresh))
         return {"available_models": models}
     except Exception as e:
         return {"error": str(e)}
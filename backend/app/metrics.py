@@ -0,0 +1,235 @@
+import bisect
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a cached answer (sub-millisecond) up to a slow completion
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def process_rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base for one metric family in the Prometheus text format.
+
+    Values are kept per tuple of label values. Metrics are only updated
+    from the event loop, so plain dict updates need no lock.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    """Monotonic counter; ``callback`` reads the value from elsewhere at scrape time"""
+
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _collect(self) -> Dict[Tuple[str, ...], float]:
+        return self.callback() if self.callback is not None else self._values
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in sorted(self._collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that goes up and down; usually computed by ``callback`` at scrape time"""
+
+    type = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observations (latencies in seconds)"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label tuple: [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        state = self._values.get(labels)
+        if state is None:
+            state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self._values[labels] = state
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class _Timer:
+    # A plain class rather than @contextmanager: this sits on every request
+    # and is several times cheaper than a generator-based context manager.
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class MetricsRegistry:
+    """Named metric families rendered together for ``GET /metrics``"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback must not take the whole scrape down
+                print(f"Could not collect metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+class ActiveSet:
+    """Keys seen within the last ``window`` seconds, e.g. active chat sessions.
+
+    Keys are kept in last-seen order, so expiring stale ones only ever
+    looks at the oldest entries.
+    """
+
+    def __init__(self, window: float = 900.0, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def touch(self, key: str):
+        now = self.clock()
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+        self._expire(now)
+
+    def discard(self, key: str):
+        self._seen.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        seen = self._seen.get(key)
+        return seen is not None and self.clock() - seen <= self.window
+
+    def _expire(self, now: float):
+        while self._seen:
+            key, seen = next(iter(self._seen.items()))
+            if now - seen <= self.window:
+                break
+            del self._seen[key]
+
+    def __len__(self) -> int:
+        self._expire(self.clock())
+        return len(self._seen)
@@ -0,0 +1,551 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .database import ChatStore, SessionIndex
+from .locks import FileLock
+from .metrics import process_rss_bytes
+
+SEGMENT_RE = re.compile(r"segment-(\d+)\.jsonl\.gz$")
+
+
+def _encode(record: dict) -> dict:
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in record.items()}
+
+
+def _decode(record: dict, *fields: str) -> dict:
+    decoded = dict(record)
+    for name in fields:
+        decoded[name] = datetime.fromisoformat(decoded[name])
+    return decoded
+
+
+class SessionArchive:
+    """Cold chat sessions kept on disk as gzip-compressed JSONL segments.
+
+    Every archived session is appended to the current segment as its own
+    gzip member (concatenated members are still one valid .gz file, so
+    ``zcat segment-*.jsonl.gz`` shows everything). The index remembers each
+    member's byte range, so rehydrating a session decompresses only that
+    member. The index is an append-only JSONL log replayed at startup; its
+    session metadata also lets archived chats stay listed in the sidebar.
+    Messages trimmed off a live chat are archived the same way, one member
+    per trim, indexed by the range of message ids they cover.
+
+    Several workers may share one directory: writes take a file lock, and
+    every lookup first replays whatever other workers appended to the log.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 64 * 2 ** 20):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self.entries: Dict[str, dict] = {}
+        # Per chat, the trimmed members oldest first
+        self.trimmed: Dict[str, List[dict]] = {}
+        self.index = SessionIndex()
+        self._segment = 1
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._file_lock = FileLock(os.path.join(directory, "archive.lock"))
+        # How far into which index file this worker has replayed
+        self._index_inode = None
+        self._index_offset = 0
+        self._index_lines = 0
+        self._load()
+
+    def __contains__(self, chat_id: str) -> bool:
+        self.refresh()
+        return chat_id in self.entries
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self.entries)
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"segment-{number:06d}.jsonl.gz")
+
+    def _load(self):
+        numbers = [int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(self.directory)) if m]
+        self._segment = max(numbers, default=1)
+        with self._lock:
+            lines = self._replay()
+
+        # Rewrite the log once removals make up most of it. Other workers
+        # notice the new file and replay it from the start.
+        live = len(self.entries) + sum(len(parts) for parts in self.trimmed.values())
+        if lines > 2 * live + 100 and self._file_lock.acquire(blocking=False):
+            try:
+                with self._lock:
+                    self._replay()
+                    tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "w") as f:
+                        for entry in self.entries.values():
+                            f.write(json.dumps(_encode(entry)) + "\n")
+                        for parts in self.trimmed.values():
+                            for part in parts:
+                                f.write(json.dumps(part) + "\n")
+                    os.replace(tmp_path, self.index_path)
+                    self._replay()
+            finally:
+                self._file_lock.release()
+
+    def _replay(self) -> int:
+        """Apply index records not seen yet; return how many lines the log has"""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_offset:
+            # First load, or the log was compacted: start over
+            self.entries.clear()
+            self.trimmed.clear()
+            self.index = SessionIndex()
+            self._index_inode = stat.st_ino
+            self._index_offset = 0
+            self._index_lines = 0
+        if stat.st_size == self._index_offset:
+            return self._index_lines
+
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # A record another worker is still writing is picked up next time
+        complete = data[:data.rfind(b"\n") + 1]
+        self._index_offset += len(complete)
+        for line in complete.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            self._index_lines += 1
+            record = json.loads(line)
+            if record["op"] == "trim":
+                self.trimmed.setdefault(record["chat_id"], []).append(record)
+                continue
+            if record["op"] == "forget_trimmed":
+                self.trimmed.pop(record["chat_id"], None)
+                continue
+            previous = self.entries.pop(record["chat_id"], None)
+            if previous is not None:
+                self.index.remove(previous["updated_at"], record["chat_id"])
+            if record["op"] == "add":
+                entry = _decode(record, "created_at", "updated_at")
+                self.entries[entry["chat_id"]] = entry
+                self.index.add(entry["updated_at"], entry["chat_id"])
+        return self._index_lines
+
+    def refresh(self):
+        """Pick up sessions other workers archived or rehydrated meanwhile"""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino == self._index_inode and stat.st_size == self._index_offset:
+            return
+        with self._lock:
+            self._replay()
+
+    def _log(self, record: dict):
+        # Called with both locks held: catch up first, then skip past our own line
+        self._replay()
+        with open(self.index_path, "ab") as f:
+            f.write((json.dumps(_encode(record)) + "\n").encode("utf-8"))
+            end = f.tell()
+        if self._index_inode is None:
+            self._index_inode = os.stat(self.index_path).st_ino
+        self._index_offset = end
+        self._index_lines += 1
+
+    def _append(self, record: dict) -> Tuple[int, int, int]:
+        # Another worker may have started a newer segment
+        while os.path.exists(self._segment_path(self._segment + 1)):
+            self._segment += 1
+        path = self._segment_path(self._segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+            self._segment += 1
+            path = self._segment_path(self._segment)
+        member = gzip.compress((json.dumps(record) + "\n").encode("utf-8"))
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(member)
+        return self._segment, offset, len(member)
+
+    def add(self, session: dict, messages: List[dict]):
+        """Archive a session with all of its messages"""
+        record = {
+            "session": _encode(session),
+            "messages": [_encode(message) for message in messages],
+        }
+        with self._lock, self._file_lock:
+            segment, offset, length = self._append(record)
+            entry = {
+                "op": "add",
+                "chat_id": session["chat_id"],
+                "title": session["title"],
+                "created_at": session["created_at"],
+                "updated_at": session["updated_at"],
+                "message_count": len(messages),
+                "segment": segment,
+                "offset": offset,
+                "length": length,
+            }
+            self._log(entry)
+            previous = self.entries.get(session["chat_id"])
+            if previous is not None:
+                self.index.remove(previous["updated_at"], session["chat_id"])
+            self.entries[session["chat_id"]] = entry
+            self.index.add(session["updated_at"], session["chat_id"])
+
+    def add_trimmed(self, chat_id: str, messages: List[dict]) -> int:
+        """Keep messages cut from a live session, oldest first, for read_trimmed().
+
+        Messages already kept are skipped; returns how many were added.
+        """
+        with self._lock, self._file_lock:
+            self._replay()
+            parts = self.trimmed.get(chat_id)
+            if parts:
+                messages = [message for message in messages if message["id"] > parts[-1]["last_id"]]
+            if not messages:
+                return 0
+            segment, offset, length = self._append(
+                {"chat_id": chat_id, "trimmed": [_encode(message) for message in messages]}
+            )
+            part = {
+                "op": "trim",
+                "chat_id": chat_id,
+                "first_id": messages[0]["id"],
+                "last_id": messages[-1]["id"],
+                "segment": segment,
+                "offset": offset,
+                "length": length,
+            }
+            self._log(part)
+            self.trimmed.setdefault(chat_id, []).append(part)
+        return len(messages)
+
+    def has_trimmed(self, chat_id: str) -> bool:
+        self.refresh()
+        return chat_id in self.trimmed
+
+    def read_trimmed(
+        self,
+        chat_id: str,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[dict]:
+        """Trimmed messages with ids between ``after`` and ``before``, oldest first.
+
+        With ``limit`` only the newest ``limit`` of them are returned, and
+        only the members holding those are decompressed.
+        """
+        if limit == 0:
+            return []
+        self.refresh()
+        with self._lock:
+            parts = [
+                part for part in self.trimmed.get(chat_id, ())
+                if (after is None or part["last_id"] > after) and (before is None or part["first_id"] < before)
+            ]
+        messages: List[dict] = []
+        for part in reversed(parts):
+            if limit is not None and len(messages) >= limit:
+                break
+            found = [
+                _decode(message, "timestamp") for message in self._read_member(part)["trimmed"]
+                if (after is None or message["id"] > after) and (before is None or message["id"] < before)
+            ]
+            messages = found + messages
+        return messages if limit is None else messages[-limit:]
+
+    def remove_trimmed(self, chat_id: str) -> bool:
+        """Forget a chat's trimmed messages (their bytes stay in the segments)"""
+        with self._lock, self._file_lock:
+            self._replay()
+            if self.trimmed.pop(chat_id, None) is None:
+                return False
+            self._log({"op": "forget_trimmed", "chat_id": chat_id})
+            return True
+
+    def _read_member(self, entry: dict) -> dict:
+        with open(self._segment_path(entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            return json.loads(gzip.decompress(f.read(entry["length"])))
+
+    def read(self, chat_id: str) -> Optional[Tuple[dict, List[dict]]]:
+        """Return ``(session, messages)`` for an archived session"""
+        self.refresh()
+        entry = self.entries.get(chat_id)
+        if entry is None:
+            return None
+        record = self._read_member(entry)
+        session = _decode(record["session"], "created_at", "updated_at")
+        messages = [_decode(message, "timestamp") for message in record["messages"]]
+        return session, messages
+
+    def remove(self, chat_id: str) -> bool:
+        """Drop a session from the index (its bytes stay in the segment)"""
+        with self._lock, self._file_lock:
+            self._replay()
+            entry = self.entries.pop(chat_id, None)
+            if entry is None:
+                return False
+            self.index.remove(entry["updated_at"], chat_id)
+            self._log({"op": "remove", "chat_id": chat_id})
+            return True
+
+    def list_sessions(self, limit: Optional[int] = None, before: Optional[Tuple[datetime, str]] = None) -> List[dict]:
+        """Archived sessions newest first, paged like ChatStore.list_sessions"""
+        self.refresh()
+        with self._lock:
+            return [
+                {name: self.entries[chat_id][name] for name in ("chat_id", "title", "created_at", "updated_at", "message_count")}
+                for chat_id in self.index.page(limit, before)
+            ]
+
+    def disk_bytes(self) -> int:
+        return sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory)
+        )
+
+
+@dataclass
+class RetentionPolicy:
+    # 0 disables the corresponding limit
+    max_sessions: int = 0
+    max_messages_per_session: int = 0
+    max_idle_seconds: float = 0
+    # Sessions updated more recently than this are in use and never archived
+    active_seconds: float = 0
+
+
+class RetentionManager:
+    """Keep the live store bounded by moving cold sessions to the archive.
+
+    ``enforce()`` archives sessions idle for longer than ``max_idle_seconds``
+    and then the least recently updated sessions until at most
+    ``max_sessions`` remain. ``after_append()`` trims a chat that grew past
+    ``max_messages_per_session`` back to 90% of the cap; the dropped
+    messages go to the archive, where ``get_messages()`` still finds them.
+    Archived sessions come back through ``rehydrate()`` as soon as somebody
+    asks for them. Sessions updated in the last ``active_seconds`` are never
+    archived, whichever worker is serving them. With several workers only one of them enforces the policy at
+    a time. Store and archive I/O in ``enforce()`` runs in worker threads;
+    the other methods block and are meant to be called from one.
+    """
+
+    def __init__(
+        self,
+        store: ChatStore,
+        archive: SessionArchive,
+        policy: RetentionPolicy,
+        batch_size: int = 100,
+    ):
+        self.store = store
+        self.archive = archive
+        self.policy = policy
+        self.batch_size = batch_size
+        self.archived = 0
+        self.rehydrated = 0
+        self.trimmed_messages = 0
+        self.last_run: Optional[dict] = None
+        # The scheduled run and POST /retention/run must not both count the
+        # same excess and archive it twice
+        self._enforcing = asyncio.Lock()
+        # Same for other workers sharing the store and archive
+        self._leader = FileLock(os.path.join(archive.directory, "retention.lock"))
+
+    def memory_report(self) -> dict:
+        size = self.store.size()
+        return {
+            "rss_bytes": process_rss_bytes(),
+            "store_sessions": size["sessions"],
+            "store_messages": size["messages"],
+            "store_bytes": size["bytes"],
+            "archived_sessions": len(self.archive),
+        }
+
+    def archive_session(self, session: dict) -> bool:
+        """Move one session from the store to the archive unless it is in use"""
+        # Read again: the session may have been used since it was listed
+        session = self.store.get_session(session["chat_id"])
+        if session is None or self.is_active(session):
+            return False
+        messages = self.store.get_messages(session["chat_id"])
+        # Written to disk before it leaves the store, so a crash can only
+        # leave a duplicate behind, never lose the chat
+        self.archive.add(session, messages)
+        self.store.delete_session(session["chat_id"])
+        self.archived += 1
+        return True
+
+    def is_active(self, session: dict) -> bool:
+        active_seconds = self.policy.active_seconds
+        return bool(active_seconds) and session["updated_at"] > datetime.now() - timedelta(seconds=active_seconds)
+
+    async def _archive_coldest(self, should_archive: Callable[[dict], bool], limit: Optional[int] = None) -> int:
+        archived = 0
+        while limit is None or archived < limit:
+            batch = await asyncio.to_thread(self.store.coldest_sessions, self.batch_size)
+            moved = 0
+            for session in batch:
+                if limit is not None and archived >= limit:
+                    break
+                if not should_archive(session):
+                    # Coldest first: once one is too fresh, the rest are too
+                    return archived
+                if not await asyncio.to_thread(self.archive_session, session):
+                    continue
+                archived += 1
+                moved += 1
+            if not moved:
+                break
+        return archived
+
+    async def enforce(self) -> dict:
+        """Apply the idle and session-count limits once and report the effect"""
+        async with self._enforcing:
+            if not self._leader.acquire(blocking=False):
+                return {"skipped": "another worker is enforcing retention"}
+            try:
+                return await self._enforce()
+            finally:
+                self._leader.release()
+
+    async def _enforce(self) -> dict:
+        start = time.perf_counter()
+        before = await asyncio.to_thread(self.memory_report)
+
+        idle = 0
+        if self.policy.max_idle_seconds:
+            cutoff = datetime.now() - timedelta(seconds=self.policy.max_idle_seconds)
+            idle = await self._archive_coldest(lambda session: session["updated_at"] < cutoff)
+
+        over_cap = 0
+        if self.policy.max_sessions:
+            excess = await asyncio.to_thread(self.store.count_sessions) - self.policy.max_sessions
+            if excess > 0:
+                over_cap = await self._archive_coldest(lambda session: True, limit=excess)
+
+        after = await asyncio.to_thread(self.memory_report)
+        self.last_run = {
+            "finished_at": datetime.now().isoformat(),
+            "duration_seconds": round(time.perf_counter() - start, 3),
+            "archived_idle": idle,
+            "archived_over_cap": over_cap,
+            "before": before,
+            "after": after,
+        }
+        if idle or over_cap:
+            print(
+                f"Retention: archived {idle + over_cap} sessions ({idle} idle, {over_cap} over cap); "
+                f"store {before['store_messages']} -> {after['store_messages']} messages, "
+                f"{before['store_bytes'] / 2 ** 20:.1f} -> {after['store_bytes'] / 2 ** 20:.1f} MB; "
+                f"RSS {before['rss_bytes'] / 2 ** 20:.1f} -> {after['rss_bytes'] / 2 ** 20:.1f} MB"
+            )
+        return self.last_run
+
+    def after_append(self, chat_id: str, last_message_id: int):
+        """Trim a chat that grew past the per-session message cap"""
+        cap = self.policy.max_messages_per_session
+        # Ids only grow, so a chat can't be over the cap before its ids are
+        if not cap or last_message_id <= cap:
+            return
+        session = self.store.get_session(chat_id)
+        if session is None or session["message_count"] <= cap:
+            return
+        # Trim with some headroom so a busy chat isn't trimmed on every turn
+        keep = cap - cap // 10
+        # Archived before they leave the store, so a failed write loses nothing:
+        # the messages stay live and the next turn tries again
+        overflow = self.store.get_messages(chat_id, after=0, limit=session["message_count"] - keep)
+        try:
+            self.trimmed_messages += self.archive.add_trimmed(chat_id, overflow)
+        except Exception as e:
+            print(f"Could not archive trimmed messages of chat {chat_id}: {e}")
+            return
+        dropped = self.store.trim_messages(chat_id, keep)
+        # Turns appended meanwhile can push a few more out than were archived
+        try:
+            self.trimmed_messages += self.archive.add_trimmed(chat_id, dropped)
+        except Exception as e:
+            print(f"Could not archive trimmed messages of chat {chat_id}: {e}")
+
+    def rehydrate(self, chat_id: str) -> Optional[dict]:
+        """Bring an archived session back into the store and return it"""
+        found = self.archive.read(chat_id)
+        if found is None:
+            return None
+        session, messages = found
+        if self.store.get_session(chat_id) is None:
+            try:
+                self.store.import_session(session, messages)
+            except Exception:
+                # Another worker rehydrated it first
+                if self.store.get_session(chat_id) is None:
+                    raise
+        self.archive.remove(chat_id)
+        self.rehydrated += 1
+        return self.store.get_session(chat_id)
+
+    def get_messages(
+        self,
+        chat_id: str,
+        limit: Optional[int] = None,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> List[dict]:
+        """Like ChatStore.get_messages, reaching back into trimmed messages"""
+        messages = self.store.get_messages(chat_id, limit=limit, before=before, after=after)
+        if not self.archive.has_trimmed(chat_id):
+            return messages
+        if after is not None:
+            # Every trimmed message is older than every live one
+            earlier = self.archive.read_trimmed(chat_id, after=after, before=messages[0]["id"] if messages else None)
+            merged = earlier + messages
+            return merged if limit is None else merged[:limit]
+        if limit is not None and len(messages) >= limit:
+            return messages
+        older = self.archive.read_trimmed(
+            chat_id,
+            before=messages[0]["id"] if messages else before,
+            limit=None if limit is None else limit - len(messages),
+        )
+        return older + messages
+
+    def forget(self, chat_id: str) -> bool:
+        """Delete an archived session, and any messages trimmed off it, for good"""
+        removed = self.archive.remove(chat_id)
+        return self.archive.remove_trimmed(chat_id) or removed
+
+    def list_sessions(self, limit: Optional[int] = None, before: Optional[Tuple[datetime, str]] = None) -> List[dict]:
+        """Live and archived sessions merged, newest first"""
+        live = self.store.list_sessions(limit=limit, before=before)
+        if not len(self.archive):
+            return live
+        archived = self.archive.list_sessions(limit=limit, before=before)
+        merged = sorted(live + archived, key=lambda s: (s["updated_at"], s["chat_id"]), reverse=True)
+        return merged if limit is None else merged[:limit]
+
+    def stats(self) -> dict:
+        return {
+            "policy": {
+                "max_sessions": self.policy.max_sessions,
+                "max_messages_per_session": self.policy.max_messages_per_session,
+                "max_idle_seconds": self.policy.max_idle_seconds,
+            },
+            "archived_sessions": len(self.archive),
+            "archive_disk_bytes": self.archive.disk_bytes(),
+            "archived_total": self.archived,
+            "rehydrated_total": self.rehydrated,
+            "trimmed_messages_total": self.trimmed_messages,
+            "last_run": self.last_run,
+        }
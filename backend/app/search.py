@@ -0,0 +1,191 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from .cache import stem_word
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Left out of queries: they match nearly every message, and ranking has to
+# visit every message a query word appears in
+STOPWORDS = frozenset(
+    "a about an and are as at be but by can could do does for from has have how i if in is it its me my "
+    "not of on or our should so that the their there they this to was we what when where which who why "
+    "will with would you your".split()
+)
+
+# Placed around matched terms while a snippet is built, then turned into offsets
+MARK_START = "\x02"
+MARK_END = "\x03"
+ELLIPSIS = "…"
+SNIPPET_TOKENS = 12
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def search_terms(text: str) -> List[str]:
+    """Stemmed lowercase words, as kept in InvertedIndex.
+
+    The crude stemming is enough for "blighted" to find "blight" without
+    SQLite's porter stemmer.
+    """
+    return [stem_word(word) for word in tokenize(text)]
+
+
+def query_words(query: str) -> List[str]:
+    """The words of a search query, without stopwords unless that leaves none"""
+    words = tokenize(query)
+    return [word for word in words if word not in STOPWORDS] or words
+
+
+def fts_query(query: str) -> Optional[str]:
+    """A user query as an FTS5 MATCH expression: every term must match"""
+    terms = query_words(query)
+    # Quoting each term keeps FTS5 operators in the input from being parsed
+    return " ".join(f'"{term}"' for term in terms) if terms else None
+
+
+def split_highlights(marked: str) -> Tuple[str, List[List[int]]]:
+    """Strip the match marks from a snippet; return the text and ``[start, end)`` offsets"""
+    parts = []
+    highlights = []
+    length = 0
+    start = None
+    for piece in re.split(f"([{MARK_START}{MARK_END}])", marked):
+        if piece == MARK_START:
+            start = length
+        elif piece == MARK_END:
+            if start is not None:
+                highlights.append([start, length])
+            start = None
+        else:
+            parts.append(piece)
+            length += len(piece)
+    return "".join(parts), highlights
+
+
+def make_snippet(text: str, terms: List[str], tokens: int = SNIPPET_TOKENS) -> str:
+    """A window of about ``tokens`` words around the first match, matches marked.
+
+    ``terms`` are stemmed (see search_terms). Same shape as FTS5's
+    snippet(): an ellipsis where the text was cut.
+    """
+    words = list(TOKEN_RE.finditer(text))
+    if not words:
+        return text
+    wanted = set(terms)
+    first = next((i for i, word in enumerate(words) if stem_word(word.group().lower()) in wanted), 0)
+    start = max(0, min(first - tokens // 4, len(words) - tokens))
+    end = min(len(words), start + tokens)
+
+    out = [ELLIPSIS] if start > 0 else []
+    position = words[start].start() if start > 0 else 0
+    for word in words[start:end]:
+        out.append(text[position:word.start()])
+        if stem_word(word.group().lower()) in wanted:
+            out.append(MARK_START + word.group() + MARK_END)
+        else:
+            out.append(word.group())
+        position = word.end()
+    if end < len(words):
+        out.append(ELLIPSIS)
+    else:
+        out.append(text[position:])
+    return "".join(out)
+
+
+class InvertedIndex:
+    """In-memory full-text index over chat messages, ranked with BM25.
+
+    Documents are ``(chat_id, message_id)`` pairs. Postings map each term
+    to ``{docid: term frequency}``; a query matches documents containing
+    every term. Callers pass the old text back to ``remove()`` so no
+    per-document term list has to be kept.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.docids: Dict[Tuple[str, int], int] = {}
+        self.documents: Dict[int, Tuple[str, int, int]] = {}
+        self.total_length = 0
+        self._next_docid = 0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, chat_id: str, message_id: int, text: str):
+        terms = Counter(search_terms(text))
+        docid = self._next_docid
+        self._next_docid += 1
+        length = sum(terms.values())
+        self.docids[(chat_id, message_id)] = docid
+        self.documents[docid] = (chat_id, message_id, length)
+        self.total_length += length
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[docid] = frequency
+
+    def remove(self, chat_id: str, message_id: int, text: str):
+        docid = self.docids.pop((chat_id, message_id), None)
+        if docid is None:
+            return
+        self.total_length -= self.documents.pop(docid)[2]
+        for term in set(search_terms(text)):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(docid, None)
+                if not postings:
+                    del self.postings[term]
+
+    def update(self, chat_id: str, message_id: int, old_text: str, text: str):
+        self.remove(chat_id, message_id, old_text)
+        self.add(chat_id, message_id, text)
+
+    def search(
+        self,
+        terms: List[str],
+        chat_id: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+        max_candidates: int = 0,
+    ) -> List[Tuple[str, int, float]]:
+        """Return ``(chat_id, message_id, score)`` for the best matches, best first.
+
+        Without ``chat_id``, only the ``max_candidates`` most recently
+        indexed matches are ranked (0 ranks them all).
+        """
+        lists = [self.postings.get(term) for term in set(terms)]
+        if not lists or any(postings is None for postings in lists):
+            return []
+        lists.sort(key=len)
+        candidates = lists[0].keys()
+        if chat_id is not None:
+            candidates = [docid for docid in candidates if self.documents[docid][0] == chat_id]
+        for postings in lists[1:]:
+            candidates = [docid for docid in candidates if docid in postings]
+        if chat_id is None and max_candidates and len(candidates) > max_candidates:
+            # Docids grow with every add, so the largest are the newest
+            candidates = heapq.nlargest(max_candidates, candidates)
+
+        count = len(self.documents)
+        average = self.total_length / count
+        weights = [
+            (postings, math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)))
+            for postings in lists
+        ]
+        scored = []
+        for docid in candidates:
+            length = self.documents[docid][2]
+            norm = self.k1 * (1 - self.b + self.b * length / average)
+            score = 0.0
+            for postings, idf in weights:
+                frequency = postings[docid]
+                score += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            scored.append((score, docid))
+        best = heapq.nlargest(offset + limit, scored)[offset:]
+        return [(*self.documents[docid][:2], score) for score, docid in best]
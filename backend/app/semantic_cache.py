@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import zlib
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import normalize_message, stem_word
+
+# Words that carry no topic on their own; dropping them keeps
+# "how do I stop aphids" and "aphids attacking my plants" close together.
+STOPWORDS = frozenset("""
+a an and are as at be but by can could do does for from had has have how i
+if in into is it its me my of on or our should so than that the their them
+then there these they this to was we what when where which who why will
+with would you your about any some get got up out
+best stop use need way tell know please help want like
+""".split())
+
+# The things a farming question is about: crops, animals, pests, diseases and
+# inputs. A cached answer is only served for a question about the same ones,
+# however close the rest of the wording is ("fertilizer for maize per acre"
+# must not get the answer about rice).
+ENTITY_WORDS = """
+maize rice wheat sorghum millet barley oats cassava potato potatoes yam tomato tomatoes
+cabbage kale spinach onion onions garlic carrot carrots bean beans pea peas groundnut
+groundnuts soybean soybeans coffee tea cocoa mango mangoes orange oranges banana bananas
+avocado avocados pineapple sugarcane cotton sunflower tobacco pepper peppers chilli
+watermelon pumpkin cucumber lettuce
+goat goats sheep cow cows cattle calf calves chicken chickens broiler broilers layer layers
+pig pigs rabbit rabbits fish duck ducks turkey turkeys bee bees camel camels donkey horse dog dogs
+aphid aphids whitefly whiteflies armyworm armyworms weevil weevils termite termites tick ticks
+flea fleas mite mites locust locusts borer borers bird birds rat rats mole moles fly flies
+thrips nematode nematodes caterpillar caterpillars worm worms
+blight rust wilt mastitis newcastle pox smut mildew rot mosaic anthrax
+fertilizer fertilizers manure compost urea dap npk herbicide herbicides pesticide pesticides
+fungicide fungicides insecticide insecticides lime silage hay
+"""
+# Different words for the same thing
+ENTITY_SYNONYMS = {"corn": "maize", "paddy": "rice", "cattle": "cow", "calf": "cow", "calves": "cow"}
+# What the farmer wants to do, one line per action with the forms it takes.
+# When both questions name an action it must be the same one ("when to plant
+# beans" is not "when to harvest beans"); a question naming none matches any.
+# Matched before stemming, leaving out forms that are mostly nouns or
+# adjectives ("tomato plants", "water", "dry season").
+ACTION_WORDS = """
+plant planting planted grow growing sow sowing
+harvest harvesting harvested
+store storing stored storage
+sell selling sold market price prices buy buying
+feed feeding fed
+spray spraying sprayed
+weed weeding weeded
+prune pruning pruned
+stake staking staked
+watering watered irrigate irrigating irrigation
+vaccinate vaccinating vaccinated vaccination
+deworm deworming dewormed
+slaughter slaughtering
+drying dried
+treat treating treated treatment
+yield yields
+"""
+# Stemmed word -> the entity it names; word -> the action it names
+ENTITIES = {
+    stem_word(word): stem_word(ENTITY_SYNONYMS.get(word, word))
+    for word in ENTITY_WORDS.split() + list(ENTITY_SYNONYMS)
+}
+ACTIONS = {word: line.split()[0] for line in ACTION_WORDS.strip().splitlines() for word in line.split()}
+# Only the closest few entries above the threshold are checked for key terms
+MATCH_CANDIDATES = 16
+
+KeyTerms = Tuple[FrozenSet[str], FrozenSet[str]]
+
+
+def key_terms(text: str) -> KeyTerms:
+    """The entities and actions a question is about"""
+    stems = normalize_message(text, stem=True).split()
+    words = normalize_message(text).split()
+    return (
+        frozenset(ENTITIES[word] for word in stems if word in ENTITIES),
+        frozenset(ACTIONS[word] for word in words if word in ACTIONS),
+    )
+
+
+def same_subject(a: KeyTerms, b: KeyTerms) -> bool:
+    """Same entities, and the same actions unless one names none"""
+    return a[0] == b[0] and (a[1] == b[1] or not a[1] or not b[1])
+
+
+class HashingVectorizer:
+    """Hashed bag-of-words embedding that needs no model and no fitting.
+
+    Words are normalized and stemmed, stopwords dropped, then unigrams and
+    adjacent bigrams are hashed (crc32, so vectors are stable across
+    processes and can be persisted) into a fixed number of signed buckets
+    and L2-normalized. Cosine similarity is then a plain dot product.
+    """
+
+    def __init__(self, dim: int = 256, bigram_weight: float = 0.3):
+        self.dim = dim
+        self.bigram_weight = bigram_weight
+
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        words = [word for word in normalize_message(text, stem=True).split() if word not in STOPWORDS]
+        features = [(word, 1.0) for word in words]
+        features += [(f"{a} {b}", self.bigram_weight) for a, b in zip(words, words[1:])]
+        return features
+
+    def transform(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dim] += sign * weight
+
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of previous answers.
+
+    Embeddings live in one preallocated NumPy matrix used as a ring buffer:
+    inserts are O(1) and once ``max_entries`` is reached the oldest entry is
+    overwritten. Lookup is a single matrix-vector product over the filled
+    rows. An answer is served for the closest entry about the same entities
+    and actions (see key_terms), and only when its cosine similarity reaches
+    ``threshold``; the default is tuned on tests/data/semantic_pairs.json
+    (benchmarks/tune_semantic_threshold.py).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        threshold: float = 0.6,
+        vectorizer: Optional[HashingVectorizer] = None,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.vectorizer = vectorizer if vectorizer is not None else HashingVectorizer()
+        self._vectors = np.zeros((max_entries, self.vectorizer.dim), dtype=np.float32)
+        self._questions: List[Optional[str]] = [None] * max_entries
+        self._answers: List[Optional[str]] = [None] * max_entries
+        self._keys: List[Optional[KeyTerms]] = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _insert_vector(self, vector: np.ndarray, question: str, answer: str):
+        with self._lock:
+            slot = self._next
+            if self._size == self.max_entries:
+                self.evictions += 1
+            else:
+                self._size += 1
+            self._vectors[slot] = vector
+            self._questions[slot] = question
+            self._answers[slot] = answer
+            self._keys[slot] = key_terms(question)
+            self._next = (slot + 1) % self.max_entries
+
+    def add(self, question: str, answer: str):
+        """Remember the answer given to a question"""
+        vector = self.vectorizer.transform(question)
+        if not vector.any():
+            # Nothing but stopwords; it would never be a meaningful match
+            return
+        self._insert_vector(vector, question, answer)
+
+    def search(self, question: str, threshold: float = -1.0) -> Optional[Tuple[float, str, str]]:
+        """Return (similarity, cached question, answer) of the nearest entry about the same things.
+
+        Only entries at least ``threshold`` similar are considered.
+        """
+        if not self._size:
+            return None
+
+        vector = self.vectorizer.transform(question)
+        if not vector.any():
+            return None
+
+        scores = self._vectors[:self._size] @ vector
+        candidates = np.flatnonzero(scores >= threshold)
+        if len(candidates) > MATCH_CANDIDATES:
+            candidates = candidates[np.argpartition(scores[candidates], -MATCH_CANDIDATES)[-MATCH_CANDIDATES:]]
+        keys = key_terms(question)
+        for index in candidates[np.argsort(-scores[candidates])]:
+            if same_subject(keys, self._keys[index]):
+                return float(scores[index]), self._questions[index], self._answers[index]
+        return None
+
+    def get(self, question: str) -> Optional[str]:
+        """Return a cached answer if a similar enough question was seen"""
+        found = self.search(question, self.threshold)
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return found[2]
+
+    def clear(self):
+        """Forget every cached answer"""
+        with self._lock:
+            self._questions = [None] * self.max_entries
+            self._answers = [None] * self.max_entries
+            self._keys = [None] * self.max_entries
+            self._size = 0
+            self._next = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self, path: str):
+        """Persist the index next to the chat data"""
+        with self._lock:
+            # Store oldest first so the ring order survives a reload
+            order = [(self._next + i) % self.max_entries for i in range(self.max_entries)]
+            order = [slot for slot in order if self._questions[slot] is not None]
+            texts = json.dumps({
+                "questions": [self._questions[slot] for slot in order],
+                "answers": [self._answers[slot] for slot in order],
+            })
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, vectors=self._vectors[order], texts=np.array(texts))
+            os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        """Reload a previously saved index, keeping the newest entries"""
+        if not os.path.exists(path):
+            return
+
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            texts = json.loads(str(data["texts"]))
+
+        if vectors.shape[1:] != (self.vectorizer.dim,):
+            print(f"Ignoring semantic cache at {path}: dimension changed")
+            return
+
+        with self._lock:
+            self._size = 0
+            self._next = 0
+        for vector, question, answer in zip(vectors, texts["questions"], texts["answers"]):
+            self._insert_vector(vector, question, answer)
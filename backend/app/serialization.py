@@ -0,0 +1,154 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+import orjson
+from fastapi.responses import Response
+
+
+def dumps(content) -> bytes:
+    """Encode a payload of dicts, lists, str, int, bool, None and datetime.
+
+    The bytes are identical to ``JSONResponse(jsonable_encoder(content))``
+    for those types: compact separators, UTF-8 rather than \\u escapes,
+    datetimes as ``isoformat()``. Floats are not: orjson writes ``1e-06``
+    as ``1e-6``, so payloads with floats keep the default response.
+    """
+    return orjson.dumps(content)
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or "").lower().split(","):
+        name, _, params = coding.partition(";")
+        if name.strip() in ("gzip", "*"):
+            params = params.replace(" ", "")
+            if not params.startswith("q="):
+                return True
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def compress(body: bytes, level: int) -> bytes:
+    # mtime=0 keeps the output the same for the same body
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class EncodedBody:
+    """A response body encoded once, with its gzipped form when it has one"""
+
+    __slots__ = ("body", "gzipped")
+
+    def __init__(self, body: bytes, gzipped: Optional[bytes] = None):
+        self.body = body
+        self.gzipped = gzipped
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + len(self.gzipped or b"")
+
+
+class ResponseEncoder:
+    """Turn encoded bodies into responses, gzipped when worth it.
+
+    Bodies of at least ``gzip_min_bytes`` are gzipped by ``encode()`` and
+    sent compressed to clients that accept gzip; smaller ones always go out
+    as they are (0 disables gzip).
+    """
+
+    def __init__(self, gzip_min_bytes: int = 2048, gzip_level: int = 6):
+        self.gzip_min_bytes = gzip_min_bytes
+        self.gzip_level = gzip_level
+
+    def large(self, body: bytes) -> bool:
+        return 0 < self.gzip_min_bytes <= len(body)
+
+    def encode(self, body: bytes, compressed: bool = True) -> EncodedBody:
+        """Wrap a body, gzipping it now if it is large enough and ``compressed``"""
+        if compressed and self.large(body):
+            return EncodedBody(body, compress(body, self.gzip_level))
+        return EncodedBody(body)
+
+    def response(
+        self,
+        encoded: EncodedBody,
+        accept_encoding: Optional[str],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        headers = dict(headers or {})
+        body = encoded.body
+        if self.large(body):
+            headers["Vary"] = "Accept-Encoding"
+            if encoded.gzipped is not None and accepts_gzip(accept_encoding):
+                body = encoded.gzipped
+                headers["Content-Encoding"] = "gzip"
+        return Response(body, media_type="application/json", headers=headers)
+
+
+class HistoryCache:
+    """Encoded chat history windows, least recently used first out.
+
+    Entries are keyed by chat and by the window's ETag, which changes with
+    every append, rename or trim, so an entry can never be served stale;
+    ``invalidate()`` frees a chat's entries as soon as it changes instead of
+    waiting for them to age out. Holds at most ``max_bytes`` of bodies
+    (0 disables the cache).
+    """
+
+    def __init__(self, max_bytes: int = 32 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], EncodedBody]" = OrderedDict()
+        self._by_chat: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, chat_id: str, etag: str) -> Optional[EncodedBody]:
+        with self._lock:
+            encoded = self._entries.get((chat_id, etag))
+            if encoded is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((chat_id, etag))
+            self.hits += 1
+            return encoded
+
+    def put(self, chat_id: str, etag: str, encoded: EncodedBody):
+        if not self.max_bytes or encoded.size > self.max_bytes // 4:
+            return
+        with self._lock:
+            self._drop((chat_id, etag))
+            self._entries[(chat_id, etag)] = encoded
+            self._by_chat.setdefault(chat_id, set()).add(etag)
+            self.bytes += encoded.size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, chat_id: str):
+        with self._lock:
+            for etag in list(self._by_chat.get(chat_id, ())):
+                self._drop((chat_id, etag))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_chat.clear()
+            self.bytes = 0
+
+    def _drop(self, key: Tuple[str, str]):
+        encoded = self._entries.pop(key, None)
+        if encoded is None:
+            return
+        self.bytes -= encoded.size
+        etags = self._by_chat.get(key[0])
+        if etags is not None:
+            etags.discard(key[1])
+            if not etags:
+                del self._by_chat[key[0]]
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .llm import wait_unless_disconnected
+
+
+class _Flight:
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one upstream call.
+
+    The first caller for a key starts the work; everyone arriving while it
+    is still running awaits the same future. The shared call is only
+    cancelled once every caller waiting on it has gone away, so one
+    impatient client cannot cancel an answer others are still waiting for.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    async def do(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> Any:
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            self.upstream_calls += 1
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await wait_unless_disconnected(asyncio.shield(flight.task), is_disconnected)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "dedup_ratio": self.coalesced / self.calls if self.calls else 0.0,
+            "in_flight": len(self._flights),
+            "waiters": sum(flight.waiters for flight in self._flights.values()),
+        }
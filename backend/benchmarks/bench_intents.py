@@ -0,0 +1,54 @@
+# Micro-benchmark: compiled IntentMatcher vs the original nested re.search loop
+#
+#   cd backend && python -m benchmarks.bench_intents
+import re
+import time
+
+from app.fixed_queries import FIXED_QUERIES
+from app.intents import IntentMatcher
+
+MESSAGES = [
+    "Hello!",
+    "What's the weather forecast for farming?",
+    "How can I improve my soil quality and ph?",
+    "Which crops are best for my region this season?",
+    "aphids attacking my tomato plants, what should I spray",
+    "What's the best drip irrigation method for a small plot?",
+    "Thanks for your help!",
+    "How do I start organic farming without chemicals?",
+    "What equipment do I need for a small farm?",
+    "How can I increase farm profits next year?",
+    "Tell me about livestock vaccination schedules for goats",
+    "this is a question about something else entirely",
+]
+
+
+def legacy_check_fixed_queries(message):
+    message_lower = message.lower()
+    for query_type, query_data in FIXED_QUERIES.items():
+        for pattern in query_data["patterns"]:
+            if re.search(pattern, message_lower, re.IGNORECASE):
+                return query_data["response"]
+    return None
+
+
+def run(label, func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in MESSAGES:
+            func(message)
+    elapsed = time.perf_counter() - start
+    total = rounds * len(MESSAGES)
+    print(f"{label:<10} {total / elapsed:>12,.0f} msg/s  ({elapsed * 1e6 / total:.2f} us/msg)")
+    return total / elapsed
+
+
+def main(rounds=20000):
+    matcher = IntentMatcher(FIXED_QUERIES)
+    legacy = run("legacy", legacy_check_fixed_queries, rounds)
+    compiled = run("compiled", matcher.response_for, rounds)
+    print(f"speedup    {compiled / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# JSON encoding of chat history and sidebar pages: before and after
+#
+#   cd backend && python -m benchmarks.bench_json
+#   cd backend && python -m benchmarks.bench_json --windows 50 500 --repeat 500
+#
+# For history windows of --windows messages and a full sidebar page, reports:
+#
+#   before   jsonable_encoder() + JSONResponse, what the endpoints used to do
+#   orjson   serialization.dumps()
+#   cached   a HistoryCache hit: no encoding at all
+#   gzip     compressing the body once, and the bytes it saves on the wire
+#
+# then times GET /chats/{chat_id} and GET /chats end to end with the history
+# cache off and on, with and without Accept-Encoding: gzip.
+#
+# Every payload (including texts full of non-ASCII, quotes, backslashes and
+# control characters) is checked to encode to exactly the bytes the old path
+# produced, and every endpoint body to match the old encoding of the same
+# data; exits non-zero on the first difference.
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.serialization import EncodedBody, HistoryCache, compress, dumps
+
+ANSWER = (
+    "For {crop} hit by {pest}, remove the worst affected leaves first.\n\n"
+    "1. Spray neem oil (5 ml per litre) in the evening.\n"
+    "2. Repeat after a week; check the undersides of the leaves.\n"
+    "3. Keep the field weeded so the \"bugs\" have nowhere to hide.\n\n"
+    "If more than a third of the plants show damage, ask your extension officer."
+)
+QUESTIONS = [
+    "How do I get rid of {pest} on my {crop}?",
+    "Mahindi yangu yana {pest}, nifanye nini?",
+    "मेरी {crop} की फसल में {pest} लग गए हैं, क्या करूँ?",
+    "When should I plant {crop} after the rains? 🌧️🌱",
+]
+CROPS = ["maize", "beans", "tomatoes", "cassava", "coffee"]
+PESTS = ["aphids", "armyworm", "blight", "weevils", "rust"]
+# Texts the encoders are most likely to disagree on
+AWKWARD = [
+    "tab\there, newline\nthere, nul\x00 and bell\x07 and \x1f",
+    "quote \" backslash \\ slash / and a \\u0041 that is not an escape",
+    "line separator \u2028 paragraph separator \u2029 and del \x7f",
+    "\u00e9\u00df\u4e2d\u6587 \U0001f33e \ud7ff \ue000 \ufeff \uffff",
+    "",
+]
+
+
+def make_text(rng, turn):
+    fill = {"crop": rng.choice(CROPS), "pest": rng.choice(PESTS)}
+    if turn % 2:
+        return ANSWER.format(**fill)
+    return rng.choice(QUESTIONS).format(**fill)
+
+
+def make_messages(rng, count, start, awkward=False):
+    messages = []
+    for turn in range(count):
+        text = make_text(rng, turn)
+        if awkward:
+            text = AWKWARD[turn % len(AWKWARD)] + " " + text
+        messages.append({
+            "id": turn + 1,
+            "sender": "user" if turn % 2 == 0 else "assistant",
+            "text": text,
+            "timestamp": start + timedelta(seconds=turn * 37, microseconds=rng.choice([0, 1, 999999])),
+        })
+    return messages
+
+
+def history_payload(chat_id, messages, start):
+    # The shape GET /chats/{chat_id} returns
+    return {
+        "chat_id": chat_id,
+        "title": "Aphids on maize — what now?",
+        "messages": messages,
+        "created_at": start,
+        "updated_at": start + timedelta(hours=1),
+        "message_count": len(messages),
+        "has_more": False,
+    }
+
+
+def sidebar_payload(rng, count, start):
+    # The shape GET /chats returns
+    return {
+        "sessions": [
+            {
+                "chat_id": f"chat-{index:06d}",
+                "title": make_text(rng, 0)[:40],
+                "created_at": start + timedelta(minutes=index),
+                "updated_at": start + timedelta(minutes=index, seconds=rng.randint(0, 600)),
+                "message_count": rng.randint(2, 200),
+            }
+            for index in range(count)
+        ],
+        "next_cursor": "MjAyNi0xMC0xN1QwNjo1ODo1NS44OTIwMDB8Y2hhdC0wMDAxOTk=",
+    }
+
+
+def old_encoding(payload):
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def check(condition, message):
+    if not condition:
+        print(f"FAIL  {message}")
+        sys.exit(1)
+
+
+def median_us(call, repeat):
+    # Median of per-call times, in microseconds
+    samples = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - began)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6
+
+
+def compare(name, payload, repeat):
+    before = old_encoding(payload)
+    check(dumps(payload) == before, f"{name}: orjson bytes differ from JSONResponse")
+
+    cache = HistoryCache()
+    cache.put("bench", "etag", EncodedBody(before))
+    old_us = median_us(lambda: old_encoding(payload), repeat)
+    new_us = median_us(lambda: dumps(payload), repeat)
+    cached_us = median_us(lambda: cache.get("bench", "etag"), repeat)
+    gzip_us = median_us(lambda: compress(before, 6), max(1, repeat // 5))
+    gzipped = compress(before, 6)
+    print(
+        f"{name:<22} {old_us:9.1f} {new_us:9.1f} {cached_us:8.2f} {old_us / new_us:7.1f}x "
+        f"{len(before) / 1024:9.1f} {len(gzipped) / 1024:8.1f} {gzip_us:9.1f}"
+    )
+
+
+def run_encoders(args, rng):
+    start = datetime(2026, 3, 1, 6, 30)
+    print(f"{'payload':<22} {'before us':>9} {'orjson':>9} {'cached':>8} {'speedup':>8} "
+          f"{'raw KiB':>9} {'gzip KiB':>8} {'gzip us':>9}")
+    for window in args.windows:
+        payload = history_payload("chat-bench", make_messages(rng, window, start), start)
+        compare(f"history, {window} msgs", payload, args.repeat)
+    compare(f"sidebar, {args.sidebar} chats", sidebar_payload(rng, args.sidebar, start), args.repeat)
+
+    # Byte identity on the awkward texts, every code point class included
+    awkward = history_payload("chat-awkward", make_messages(rng, 200, start, awkward=True), start)
+    check(dumps(awkward) == old_encoding(awkward), "awkward texts: orjson bytes differ from JSONResponse")
+    print("\nok    orjson output is byte-identical to JSONResponse for every payload above")
+
+
+async def time_endpoint(client, path, headers, repeat):
+    samples = []
+    wire = 0
+    for _ in range(repeat):
+        began = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        samples.append(time.perf_counter() - began)
+        check(response.status_code == 200, f"{path}: {response.status_code}")
+        wire = response.num_bytes_downloaded
+    samples.sort()
+    return samples[len(samples) // 2] * 1000, wire, response
+
+
+async def run_endpoints(main, args, rng):
+    import httpx
+
+    start = datetime.now() - timedelta(days=2)
+    window = max(args.windows)
+    for index in range(args.sidebar):
+        when = start + timedelta(minutes=index)
+        main.store.import_session(
+            {"chat_id": f"chat-{index:06d}", "title": f"Chat {index}", "created_at": when, "updated_at": when},
+            make_messages(rng, window if index == 0 else 4, when, awkward=index == 0),
+        )
+    chat_id = "chat-000000"
+    history_path = f"/chats/{chat_id}?limit={window}"
+    identity = {"Accept-Encoding": "identity"}
+    gzip = {"Accept-Encoding": "gzip"}
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://bench") as client:
+        # What the old endpoint would have sent for the same data
+        session = main.find_session(chat_id)
+        messages = main.store.get_messages(chat_id, limit=window + 1)
+        expected = old_encoding({
+            "chat_id": chat_id,
+            "title": session["title"],
+            "messages": [
+                {key: message[key] for key in ("id", "sender", "text", "timestamp")} for message in messages
+            ],
+            "created_at": session["created_at"],
+            "updated_at": session["updated_at"],
+            "message_count": session["message_count"],
+            "has_more": False,
+        })
+
+        max_bytes = main.history_cache.max_bytes
+        rows = []
+        for label, cache_bytes, headers in (
+            ("history, no cache", 0, identity),
+            ("history, cached", max_bytes, identity),
+            ("history, cached+gzip", max_bytes, gzip),
+        ):
+            main.history_cache.clear()
+            main.history_cache.max_bytes = cache_bytes
+            ms, wire, response = await time_endpoint(client, history_path, headers, args.requests)
+            check(response.content == expected, f"{label}: body differs from the old encoding")
+            rows.append((f"GET /chats/{{id}} ({label})", ms, wire))
+
+        sessions = main.retention.list_sessions(limit=args.sidebar + 1)
+        expected = old_encoding({
+            "sessions": [
+                {key: session[key] for key in ("chat_id", "title", "created_at", "updated_at", "message_count")}
+                for session in sessions[:args.sidebar]
+            ],
+            "next_cursor": None,
+        })
+        for label, headers in (("identity", identity), ("gzip", gzip)):
+            ms, wire, response = await time_endpoint(client, f"/chats?limit={args.sidebar}", headers, args.requests)
+            check(response.content == expected, f"GET /chats ({label}): body differs from the old encoding")
+            rows.append((f"GET /chats ({label})", ms, wire))
+
+    print(f"\n{'endpoint (' + str(window) + ' msgs / ' + str(args.sidebar) + ' chats)':<40} {'p50 ms':>8} {'wire KiB':>9}")
+    for label, ms, wire in rows:
+        print(f"{label:<40} {ms:8.2f} {wire / 1024:9.1f}")
+    print("\nok    endpoint bodies match the old encoding of the same data")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--windows", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--sidebar", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory(prefix="chat-json-") as workdir:
+        os.environ["GEMINI_API_KEY"] = ""
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "chats.db")
+        os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(workdir, "semantic_cache.npz")
+        os.environ["MODEL_CACHE_PATH"] = os.path.join(workdir, "models_cache.json")
+        os.environ["ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+        from app import main as app_main
+
+        run_encoders(args, rng)
+        asyncio.run(run_endpoints(app_main, args, rng))
+        app_main.store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Memory per stored message: plain dicts vs MemoryChatStore's columns
+#
+#   cd backend && python -m benchmarks.bench_message_memory
+#   cd backend && python -m benchmarks.bench_message_memory --sessions 5000
+#
+# Builds the same --sessions x --messages-per-session chats three times,
+# measured with tracemalloc:
+#
+#   dicts    a list of {"id", "sender", "text", "timestamp": datetime} per
+#            chat, the layout MemoryChatStore used before
+#   columns  MemoryChatStore as configured by default (packed
+#            id/sender/timestamp arrays, canned answers shared, no search index)
+#   indexed  MemoryChatStore(full_text=True), which also keeps every message
+#            in the InvertedIndex behind /search (MEMORY_STORE_FULL_TEXT)
+#
+# User turns are unique strings; assistant turns repeat a few canned answers,
+# each built fresh (as a decoded response would be), so sharing them can show.
+# Also times appending and reading back a 50-message window.
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app.database import MemoryChatStore
+
+ANSWERS = [
+    "Use a balanced NPK fertilizer and test your soil pH first.",
+    "Check the weather forecast for your district before irrigating.",
+    "Spray neem oil in the evening and repeat after a week.",
+    "Harvest wheat when the grains are hard and the straw turns golden.",
+]
+
+
+def make_messages(index, count, start):
+    return [
+        {
+            "sender": "user" if turn % 2 == 0 else "assistant",
+            "text": f"Question {turn} from farmer {index}: how do I look after my crop?"
+            if turn % 2 == 0
+            else "".join(list(ANSWERS[(index + turn) % len(ANSWERS)])),
+            "timestamp": start + timedelta(seconds=turn),
+        }
+        for turn in range(count)
+    ]
+
+
+def fill_dicts(sessions, per_session, start):
+    chats = {}
+    for index in range(sessions):
+        chats[f"chat-{index}"] = [
+            dict(message, id=turn + 1)
+            for turn, message in enumerate(make_messages(index, per_session, start))
+        ]
+    return chats
+
+
+def fill_columns(sessions, per_session, start, full_text=False):
+    store = MemoryChatStore(full_text=full_text, shared_texts=ANSWERS)
+    for index in range(sessions):
+        chat_id = f"chat-{index}"
+        store.create_session(chat_id, "Benchmark chat", start)
+        store.add_messages(chat_id, make_messages(index, per_session, start))
+    return store
+
+
+def measure(fill, *args):
+    gc.collect()
+    tracemalloc.start()
+    began = time.perf_counter()
+    result = fill(*args)
+    seconds = time.perf_counter() - began
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, seconds
+
+
+def time_reads(read, sessions, rounds=20000):
+    began = time.perf_counter()
+    for i in range(rounds):
+        read(f"chat-{i * 7919 % sessions}")
+    return (time.perf_counter() - began) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--messages-per-session", type=int, default=20)
+    args = parser.parse_args()
+
+    total = args.sessions * args.messages_per_session
+    start = datetime.now()
+    print(f"{args.sessions} sessions x {args.messages_per_session} messages = {total} messages\n")
+
+    chats, dict_bytes, dict_seconds = measure(fill_dicts, args.sessions, args.messages_per_session, start)
+    dict_read = time_reads(lambda chat_id: [dict(m) for m in chats[chat_id][-50:]], args.sessions)
+    del chats
+
+    store, column_bytes, column_seconds = measure(fill_columns, args.sessions, args.messages_per_session, start)
+    column_read = time_reads(lambda chat_id: store.get_messages(chat_id, limit=50), args.sessions)
+    del store
+
+    store, indexed_bytes, indexed_seconds = measure(
+        fill_columns, args.sessions, args.messages_per_session, start, True
+    )
+    indexed_read = time_reads(lambda chat_id: store.get_messages(chat_id, limit=50), args.sessions)
+    del store
+
+    print(f"{'layout':<8} {'total MB':>9} {'bytes/msg':>10} {'build s':>8} {'read 50 us':>11}")
+    for name, used, seconds, read in (
+        ("dicts", dict_bytes, dict_seconds, dict_read),
+        ("columns", column_bytes, column_seconds, column_read),
+        ("indexed", indexed_bytes, indexed_seconds, indexed_read),
+    ):
+        print(f"{name:<8} {used / 2 ** 20:>9.1f} {used / total:>10.1f} {seconds:>8.2f} {read * 1e6:>11.1f}")
+    print(f"\ncolumns use {column_bytes / dict_bytes:.0%} of the memory of dicts")
+    print(f"the search index adds {(indexed_bytes - column_bytes) / total:.0f} bytes/msg, "
+          f"{indexed_bytes / column_bytes:.1f}x the columns alone")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# Full-text search latency at scale
+#
+#   cd backend && python -m benchmarks.bench_search
+#   cd backend && python -m benchmarks.bench_search --messages 200000 --store memory
+#
+# Fills a throwaway store with --messages synthetic farming messages (user
+# questions and longer assistant answers, word frequencies roughly Zipfian
+# so there are both rare and very common terms), then reports:
+#
+#   - fill rate with the index maintained incrementally by every write
+#   - latency of the /chat write path (two messages per turn) with and
+#     without the search index, on the full store (SQLite only)
+#   - search_messages() latency per query type: a rare word, a common word,
+#     two words, a typed question, a word within one chat, and page 6 of a
+#     common word
+#   - GET /search latency end to end, for one query mix
+#   - on SQLite, how much of the file the index takes
+#
+# The corpus is deliberately dense: each crop and topic word appears in
+# 5-15% of all messages. On SQLite a query's cost is dominated by FTS5's
+# bm25(), which counts every message each query word appears in; rare words
+# stay around a millisecond however large the store grows.
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+CROPS = ["maize", "sorghum", "cassava", "beans", "tomatoes", "potatoes", "millet", "groundnuts", "coffee", "bananas"]
+TOPICS = [
+    "blight", "aphids", "rust", "wilt", "armyworm", "weevils", "fertilizer", "manure", "compost", "irrigation",
+    "drought", "rain", "harvest", "storage", "seedlings", "spacing", "mulch", "pruning", "weeding", "market",
+]
+FILLER = [
+    "the", "and", "your", "with", "every", "before", "after", "when", "should", "plant", "soil", "leaves",
+    "water", "field", "season", "week", "spray", "early", "dry", "wet", "apply", "check", "roots", "yield",
+]
+
+
+def make_vocabulary(rng, size):
+    # Made-up words standing in for the long tail of a real vocabulary
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(5, 9))) for _ in range(size)]
+
+
+class Corpus:
+    def __init__(self, seed=3, tail=20000):
+        self.rng = random.Random(seed)
+        self.tail = make_vocabulary(self.rng, tail)
+        # Zipf-like weights: word k is picked about 1/k as often as word 1
+        self.tail_weights = list(itertools.accumulate(1 / (k + 1) for k in range(tail)))
+
+    def sentence(self, words):
+        picked = []
+        for _ in range(words):
+            roll = self.rng.random()
+            if roll < 0.5:
+                picked.append(self.rng.choice(FILLER))
+            elif roll < 0.6:
+                picked.append(self.rng.choice(CROPS))
+            elif roll < 0.7:
+                picked.append(self.rng.choice(TOPICS))
+            else:
+                picked.append(self.rng.choices(self.tail, cum_weights=self.tail_weights)[0])
+        return " ".join(picked).capitalize() + "."
+
+    def messages(self, count, start):
+        for turn in range(count):
+            user = turn % 2 == 0
+            yield {
+                "id": turn + 1,
+                "sender": "user" if user else "assistant",
+                "text": self.sentence(self.rng.randint(6, 16) if user else self.rng.randint(30, 80)),
+                "timestamp": start + timedelta(seconds=turn),
+            }
+
+
+def fill(store, corpus, messages, per_session):
+    start = datetime.now() - timedelta(days=30)
+    chat_ids = []
+    for index in range(messages // per_session):
+        chat_id = f"bench-{index:07d}"
+        when = start + timedelta(seconds=index)
+        store.import_session(
+            {"chat_id": chat_id, "title": f"Chat {index}", "created_at": when, "updated_at": when},
+            list(corpus.messages(per_session, when)),
+        )
+        chat_ids.append(chat_id)
+    return chat_ids
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+    return pick(0.5), pick(0.95), pick(0.99)
+
+
+def time_calls(call, arguments):
+    samples = []
+    for args in arguments:
+        began = time.perf_counter()
+        call(*args)
+        samples.append(time.perf_counter() - began)
+    return samples
+
+
+def print_row(name, samples, extra=""):
+    p50, p95, p99 = percentiles(samples)
+    print(f"{name:<26} p50 {p50:8.2f}  p95 {p95:8.2f}  p99 {p99:8.2f} ms{extra}")
+
+
+def time_writes(store, chat_ids, corpus, count, rng):
+    def write(chat_id):
+        now = datetime.now()
+        store.add_messages(chat_id, [
+            {"sender": "user", "text": corpus.sentence(10), "timestamp": now},
+            {"sender": "assistant", "text": corpus.sentence(50), "timestamp": now},
+        ])
+    return time_calls(write, [(rng.choice(chat_ids),) for _ in range(count)])
+
+
+def run_queries(store, chat_ids, corpus, args, rng):
+    rare = corpus.tail[len(corpus.tail) // 2:]
+    mixes = {
+        "rare word": lambda: (rng.choice(rare),),
+        "common word": lambda: (rng.choice(TOPICS),),
+        "two words": lambda: (f"{rng.choice(CROPS)} {rng.choice(TOPICS)}",),
+        "question": lambda: (f"What should I do about {rng.choice(TOPICS)} on my {rng.choice(CROPS)}?",),
+        "one chat": lambda: (rng.choice(TOPICS), rng.choice(chat_ids)),
+        "common word, page 6": lambda: (rng.choice(TOPICS), None, 20, 100),
+    }
+    for name, make in mixes.items():
+        queries = [make() for _ in range(args.queries)]
+        hits = [len(store.search_messages(*query)) for query in queries[:20]]
+        print_row(name, time_calls(store.search_messages, queries), f"  ({statistics.mean(hits):.0f} hits/page)")
+
+
+async def run_endpoint(main, chat_ids, args, rng):
+    import httpx
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://bench") as client:
+        samples = []
+        for _ in range(args.queries):
+            params = {"q": f"{rng.choice(CROPS)} {rng.choice(TOPICS)}"}
+            began = time.perf_counter()
+            response = await client.get("/search", params=params)
+            samples.append(time.perf_counter() - began)
+            assert response.status_code == 200, response.text
+    print_row("GET /search (two words)", samples)
+
+
+def index_bytes(store):
+    with store._lock:
+        rows = store._conn.execute(
+            "SELECT name LIKE 'messages_fts%' OR name LIKE 'message_docs%' OR name LIKE 'sqlite_autoindex_message_docs%', "
+            "SUM(pgsize) FROM dbstat GROUP BY 1"
+        ).fetchall()
+    sizes = {bool(flag): size for flag, size in rows}
+    return sizes.get(True, 0), sizes.get(False, 0)
+
+
+def drop_search_triggers(store):
+    with store._lock:
+        for name in ("messages_search_insert", "messages_search_update", "messages_search_delete"):
+            store._conn.execute(f"DROP TRIGGER {name}")
+
+
+def run(args, main, rng):
+    store = main.store
+    corpus = Corpus()
+    began = time.perf_counter()
+    chat_ids = fill(store, corpus, args.messages, args.per_session)
+    seconds = time.perf_counter() - began
+    print(f"filled {len(chat_ids)} chats, {args.messages} messages in {seconds:.1f}s "
+          f"({args.messages / seconds:,.0f} messages/s, index maintained on every write)\n")
+
+    run_queries(store, chat_ids, corpus, args, rng)
+    asyncio.run(run_endpoint(main, chat_ids, args, rng))
+
+    if args.store == "sqlite":
+        indexed, rest = index_bytes(store)
+        print(f"\nindex size            {indexed / 2 ** 20:8.1f} MB  (messages and the rest: {rest / 2 ** 20:.1f} MB)")
+        print_row("/chat write, indexed", time_writes(store, chat_ids, corpus, args.writes, rng))
+        drop_search_triggers(store)
+        print_row("/chat write, no index", time_writes(store, chat_ids, corpus, args.writes, rng))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--per-session", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=2000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="chat-search-") as workdir:
+        os.environ["GEMINI_API_KEY"] = ""
+        os.environ["STORAGE_BACKEND"] = args.store
+        os.environ["MEMORY_STORE_FULL_TEXT"] = "true"
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "chats.db")
+        os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(workdir, "semantic_cache.npz")
+        os.environ["MODEL_CACHE_PATH"] = os.path.join(workdir, "models_cache.json")
+        os.environ["ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+        from app import main as app_main
+
+        run(args, app_main, random.Random(11))
+        app_main.store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Lookup latency of SemanticCache at 10k / 100k / 1M cached entries
+#
+#   cd backend && python -m benchmarks.bench_semantic_cache
+#
+# The index is filled with random sparse unit vectors shaped like hashed
+# question embeddings (a handful of non-zero buckets), which is what the
+# brute-force matrix-vector product actually sees.
+import statistics
+import time
+
+import numpy as np
+
+from app.semantic_cache import SemanticCache, key_terms
+
+SIZES = [10_000, 100_000, 1_000_000]
+QUERIES = [
+    "how do I stop aphids on tomatoes",
+    "best fertilizer for rice paddy",
+    "goat vaccination schedule",
+    "why are my tomato leaves turning yellow",
+]
+LOOKUPS = 200
+
+
+def fill(cache, size, rng):
+    dim = cache.vectorizer.dim
+    for start in range(0, size, 100_000):
+        count = min(100_000, size - start)
+        block = np.zeros((count, dim), dtype=np.float32)
+        rows = np.repeat(np.arange(count), 6)
+        cols = rng.integers(0, dim, size=count * 6)
+        block[rows, cols] = rng.choice([-1.0, 1.0], size=count * 6)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        cache._vectors[start:start + count] = block
+    cache._questions[:size] = ["q"] * size
+    cache._answers[:size] = ["a"] * size
+    cache._keys[:size] = [key_terms("q")] * size
+    cache._size = size
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'entries':>10} {'p50 ms':>8} {'p95 ms':>8} {'matrix MB':>10}")
+    for size in SIZES:
+        cache = SemanticCache(max_entries=size)
+        fill(cache, size, rng)
+
+        timings = []
+        for i in range(LOOKUPS):
+            start = time.perf_counter()
+            cache.get(QUERIES[i % len(QUERIES)])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{size:>10,} {statistics.median(timings):>8.2f} {p95:>8.2f} {cache._vectors.nbytes / 1e6:>10.0f}")
+        del cache
+
+
+if __name__ == "__main__":
+    main()
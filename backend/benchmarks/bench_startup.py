@@ -0,0 +1,53 @@
+# Import-time and startup-latency benchmark for app.main
+#
+#   cd backend && python -m benchmarks.bench_startup
+#
+# Each measurement runs in a fresh interpreter with a (fake) API key set, so
+# it includes whatever Gemini work happens at import and during startup.
+# "first response" is the time from process start until GET / answers.
+import os
+import statistics
+import subprocess
+import sys
+
+RUNS = 5
+
+PROBE = """
+import time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter() - start
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    client.get("/")
+    ready = time.perf_counter() - start
+print(f"{imported:.4f} {ready:.4f}")
+"""
+
+
+def measure(env):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        env=env, capture_output=True, text=True, timeout=300, check=True,
+    ).stdout.strip().splitlines()[-1]
+    imported, ready = output.split()
+    return float(imported), float(ready)
+
+
+def main():
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark-key")
+    env.setdefault("STORAGE_BACKEND", "memory")
+
+    imports, readies = [], []
+    for _ in range(RUNS):
+        imported, ready = measure(env)
+        imports.append(imported)
+        readies.append(ready)
+
+    print(f"import app.main    median {statistics.median(imports) * 1000:8.1f} ms")
+    print(f"first response     median {statistics.median(readies) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Offline stand-in for google.generativeai.GenerativeModel
+import random
+import time
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModelError(Exception):
+    """Simulated upstream failure (think 503 / quota exceeded)"""
+
+
+class FakeModel:
+    """Blocking fake model that sleeps like a slow Gemini completion.
+
+    ``error_rate`` makes that share of calls fail after ``latency`` and
+    ``slow_rate`` makes that share take ``slow_latency`` instead, so brownouts
+    and latency tails can be simulated. Both can be changed between calls.
+
+    With ``tokens_per_second`` set, ``latency`` is the time to the first
+    token and every word of ``text`` then takes ``1 / tokens_per_second``,
+    like a real completion whose duration grows with the answer length.
+    """
+
+    def __init__(
+        self,
+        latency=0.5,
+        text="Rotate your crops and test your soil every season.",
+        error_rate=0.0,
+        slow_rate=0.0,
+        slow_latency=5.0,
+        seed=None,
+        tokens_per_second=None,
+    ):
+        self.latency = latency
+        self.text = text
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.tokens_per_second = tokens_per_second
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        failing = self._random.random() < self.error_rate
+        latency = self.slow_latency if self._random.random() < self.slow_rate else self.latency
+        if stream:
+            return self._stream(latency, failing)
+        time.sleep(latency + self._generation_time())
+        if failing:
+            self.errors += 1
+            raise FakeModelError("503 The model is overloaded")
+        return FakeResponse(self.text)
+
+    def _stream(self, latency, failing):
+        if failing:
+            time.sleep(latency)
+            self.errors += 1
+            raise FakeModelError("503 The model is overloaded")
+        words = self.text.split(" ")
+        if self.tokens_per_second:
+            time.sleep(latency)
+        for index, word in enumerate(words):
+            # Either one token's worth of time per word, or the latency
+            # spread over the words like a token stream would
+            time.sleep(1 / self.tokens_per_second if self.tokens_per_second else latency / len(words))
+            yield FakeResponse(word if index == len(words) - 1 else word + " ")
+
+    def _generation_time(self):
+        if not self.tokens_per_second:
+            return 0.0
+        return len(self.text.split(" ")) / self.tokens_per_second
+
+
+def install_fake_model(main, fake):
+    """Plug ``fake`` into app.main the way resolve_model() installs a real model"""
+    main.model_registry.models = [("fake", fake)]
+    main.model_registry.model = fake
+    main.model_registry.status = "ready"
+    main.llm_pool.set_backends(main.model_registry.models)
+    main.llm_client.model = fake
+    main.model = fake
+    main.MOCK_MODE = False
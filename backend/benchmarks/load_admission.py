@@ -0,0 +1,189 @@
+# Admission control check: rate limits, the model queue and the fast lane
+#
+#   cd backend && python -m benchmarks.load_admission
+#   cd backend && python -m benchmarks.load_admission --llm-calls 8 --queue 16 --flood 200
+#
+# Runs in process against a slow fake model with a throwaway SQLite store
+# and small limits, then checks that:
+#
+#   flood        one client sending far more than its burst gets 429s with
+#                Retry-After, while another client is still served
+#   one chat     follow-ups to one chat beyond its burst get 429, whoever sends them
+#   overload     more model questions than slots + queue: the excess gets 503
+#                at once instead of piling up, and rejected new chats are not
+#                left behind in the sidebar
+#   fast lane    fixed-query and cached answers stay fast while the model
+#                queue is full
+#   shared       two controllers on the same store share one bucket, as two
+#                workers with RATE_LIMIT_BACKEND=store do
+#
+# Exits non-zero on the first failed check.
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def check(condition, message):
+    print(f"{'ok' if condition else 'FAIL':<5} {message}")
+    if not condition:
+        sys.exit(1)
+
+
+def client_headers(client):
+    return {"X-Forwarded-For": f"10.0.{client // 256}.{client % 256}"}
+
+
+async def timed_post(client, path, payload, headers):
+    start = time.perf_counter()
+    response = await client.post(path, json=payload, headers=headers)
+    return response, time.perf_counter() - start
+
+
+async def run_flood(client, args):
+    responses = await asyncio.gather(*(
+        client.post("/chat", json={"message": "Will it rain tomorrow?"}, headers=client_headers(1))
+        for _ in range(args.flood)
+    ))
+    statuses = [response.status_code for response in responses]
+    allowed = statuses.count(200)
+    check(allowed <= args.client_burst + 1, f"flood of {args.flood}: {allowed} answered, {statuses.count(429)} got 429")
+    retry_after = [int(r.headers["Retry-After"]) for r in responses if r.status_code == 429]
+    check(retry_after and min(retry_after) >= 1, f"every 429 carries Retry-After (max {max(retry_after)}s)")
+    other = await client.post("/chat", json={"message": "Will it rain tomorrow?"}, headers=client_headers(2))
+    check(other.status_code == 200, "another client is still served during the flood")
+
+
+async def run_one_chat(client, args):
+    first = await client.post("/chat", json={"message": "Will it rain tomorrow?"}, headers=client_headers(3))
+    chat_id = first.json()["chat_id"]
+    statuses = []
+    for turn in range(args.chat_burst * 2):
+        response = await client.post(
+            "/chat", json={"message": "Will it rain the day after?", "chat_id": chat_id},
+            headers=client_headers(100 + turn)
+        )
+        statuses.append(response.status_code)
+    check(statuses.index(429) == args.chat_burst,
+          f"one chat from many clients: {statuses.index(429)} follow-ups answered, then 429")
+
+
+async def run_overload(client, main, args):
+    sessions_before = main.store.size()["sessions"]
+    questions = args.llm_calls + args.queue + args.excess
+    tasks = [
+        asyncio.create_task(timed_post(
+            client, "/chat", {"message": f"Question {i} about goat fodder"}, client_headers(1000 + i)
+        ))
+        for i in range(questions)
+    ]
+    await asyncio.sleep(args.llm_latency / 4)
+    stats = main.admission.stats()
+    check(stats["llm_active"] == args.llm_calls and stats["llm_waiting"] == args.queue,
+          f"{stats['llm_active']} model calls running, {stats['llm_waiting']} queued")
+
+    # The fast lane: answered while every model slot is taken and the queue is full
+    fast = await asyncio.gather(*(
+        timed_post(client, "/chat", {"message": "How do I get rid of aphids?"}, client_headers(2000 + i))
+        for i in range(20)
+    ))
+    cached = await timed_post(client, "/chat", {"message": "Cached question about goat fodder"}, client_headers(3000))
+    stream = await client.post("/chat/stream", json={"message": "Streamed question"}, headers=client_headers(3001))
+
+    results = await asyncio.gather(*tasks)
+    statuses = [response.status_code for response, _ in results]
+    rejected = [elapsed for response, elapsed in results if response.status_code == 503]
+    answered = [elapsed for response, elapsed in results if response.status_code == 200]
+    check(statuses.count(503) == args.excess,
+          f"{questions} model questions: {len(answered)} answered, {len(rejected)} turned away with 503")
+    check(max(rejected) < args.llm_latency / 2, f"503s come back at once (slowest {max(rejected) * 1000:.1f} ms)")
+    check(all("Retry-After" in r.headers for r, _ in results if r.status_code == 503), "every 503 carries Retry-After")
+    check(stream.status_code == 503, "/chat/stream is turned away with 503 before it starts streaming")
+
+    fast_ms = [elapsed * 1000 for _, elapsed in fast]
+    check(all(response.status_code == 200 for response, _ in fast),
+          f"fixed queries answered during overload, median {statistics.median(fast_ms):.1f} ms, "
+          f"max {max(fast_ms):.1f} ms")
+    check(cached[0].status_code == 200 and cached[1] < args.llm_latency / 2,
+          f"cached answer served during overload in {cached[1] * 1000:.1f} ms")
+
+    created = main.store.size()["sessions"] - sessions_before
+    check(created == len(answered) + len(fast) + 1, f"rejected questions left no empty chats ({created} new chats)")
+
+
+async def run_shared_buckets(main):
+    from app.admission import AdmissionController, LLMGate, RateLimit, Rejected, StoreTokenBuckets
+
+    def controller():
+        return AdmissionController(
+            StoreTokenBuckets(main.store),
+            per_client=RateLimit("shared-client", 60, 5),
+            per_chat=RateLimit("shared-chat", 0, 0),
+            llm_quota=RateLimit("shared-llm", 0, 0),
+            gate=LLMGate(),
+        )
+
+    workers = [controller(), controller()]
+    allowed = 0
+    for attempt in range(20):
+        try:
+            await workers[attempt % 2].check("10.9.9.9")
+            allowed += 1
+        except Rejected:
+            pass
+    check(allowed == 5, f"two store-backed controllers let one client through {allowed} times (burst 5)")
+
+
+async def main_async(args):
+    from app import main
+    from benchmarks.fake_model import FakeModel, install_fake_model
+
+    import httpx
+
+    install_fake_model(main, FakeModel(latency=args.llm_latency))
+    main.response_cache.set("Cached question about goat fodder", "Dried cassava leaves keep well.")
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://bench", timeout=None) as client:
+        await run_flood(client, args)
+        await run_one_chat(client, args)
+        await run_overload(client, main, args)
+        stats = (await client.get("/admission/stats")).json()
+        print(f"      rejected by reason: {stats['rejected']}")
+    await run_shared_buckets(main)
+
+    main.llm_client.shutdown()
+    main.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-calls", type=int, default=4)
+    parser.add_argument("--queue", type=int, default=8)
+    parser.add_argument("--excess", type=int, default=20, help="model questions beyond slots + queue")
+    parser.add_argument("--flood", type=int, default=100)
+    parser.add_argument("--client-burst", type=int, default=20)
+    parser.add_argument("--chat-burst", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="chat-admission-") as workdir:
+        os.environ["GEMINI_API_KEY"] = ""
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "chats.db")
+        os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(workdir, "semantic_cache.npz")
+        os.environ["MODEL_CACHE_PATH"] = os.path.join(workdir, "models_cache.json")
+        os.environ["ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+        os.environ["RATE_LIMIT_TRUST_FORWARDED"] = "true"
+        os.environ["RATE_LIMIT_CLIENT_BURST"] = str(args.client_burst)
+        os.environ["RATE_LIMIT_CHAT_BURST"] = str(args.chat_burst)
+        os.environ["ADMISSION_MAX_LLM_CALLS"] = str(args.llm_calls)
+        os.environ["ADMISSION_MAX_QUEUE"] = str(args.queue)
+        os.environ["ADMISSION_QUEUE_TIMEOUT_SECONDS"] = str(args.llm_latency * 10)
+        os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_calls)
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# Batch endpoint check: one POST /chat/batch vs the same questions one /chat at a time
+#
+#   cd backend && python -m benchmarks.load_batch
+#   cd backend && python -m benchmarks.load_batch --questions 500 --llm-latency 0.2
+#
+# The batch mixes fixed-query questions, repeated questions and unique ones,
+# like a co-op's spreadsheet. Runs in process against a fake model with a
+# throwaway SQLite store, then:
+#
+#   sequential  every question sent to /chat in turn, as partners do today
+#   batch       the whole sheet in one POST /chat/batch, read back as NDJSON
+#   restart     a job whose worker "dies" half way (its tasks are cancelled)
+#               is claimed by a second runner standing in for another
+#               worker, which only answers what was still missing
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+
+def make_questions(count, seed=7):
+    rng = random.Random(seed)
+    fixed = ["Will it rain this week?", "How do I get rid of aphids?", "What fertilizer should I use?"]
+    repeated = [f"How much water does {crop} need in the dry season?" for crop in ("maize", "sorghum", "cassava")]
+    questions = []
+    for index in range(count):
+        roll = rng.random()
+        if roll < 0.2:
+            questions.append(rng.choice(fixed))
+        elif roll < 0.5:
+            questions.append(rng.choice(repeated))
+        else:
+            questions.append(f"Farmer {index} asks about goats {rng.getrandbits(64):x} {rng.getrandbits(64):x}")
+    return questions
+
+
+async def run_sequential(client, questions):
+    start = time.perf_counter()
+    for question in questions:
+        response = await client.post("/chat", json={"message": question})
+        assert response.status_code == 200, response.text
+    return time.perf_counter() - start
+
+
+async def run_batch(client, questions):
+    start = time.perf_counter()
+    lines = []
+    async with client.stream("POST", "/chat/batch", json={"messages": questions}) as response:
+        async for line in response.aiter_lines():
+            if line:
+                lines.append(json.loads(line))
+    elapsed = time.perf_counter() - start
+    results = [line for line in lines if line["type"] == "result"]
+    assert lines[-1]["status"] == "done", lines[-1]
+    assert sorted(result["index"] for result in results) == list(range(len(questions)))
+    return elapsed, results
+
+
+async def run_restart(main, fake, questions, args):
+    from app.batch import BatchRunner
+
+    job = await main.batch_runner.submit(questions)
+    job_id = job["job_id"]
+    while main.store.get_job(job_id)["completed"] < len(questions) // 2:
+        await asyncio.sleep(0.01)
+    # The worker goes away mid-job: its tasks stop and it never checks in again
+    main.batch_runner.shutdown()
+    await asyncio.sleep(0)
+    answered_before = main.store.get_job(job_id)["completed"]
+    calls_before = fake.calls
+
+    successor = BatchRunner(
+        main.store,
+        answer=main.answer_batch_question,
+        answer_fixed=main.check_fixed_queries,
+        key=main.response_cache.key,
+        owner="another-worker",
+        concurrency=args.concurrency,
+        stale_after=0.2,
+    )
+    await asyncio.sleep(0.3)
+    resumed = await successor.resume_stale()
+    await asyncio.gather(*list(successor.tasks.values()))
+    job = main.store.get_job(job_id)
+    return {
+        "resumed": resumed,
+        "answered_before": answered_before,
+        "status": job["status"],
+        "completed": job["completed"],
+        "model_calls_after": fake.calls - calls_before,
+    }
+
+
+async def main_async(args):
+    from app import main
+    from benchmarks.fake_model import FakeModel, install_fake_model
+
+    import httpx
+
+    fake = FakeModel(latency=args.llm_latency)
+    install_fake_model(main, fake)
+    main.batch_runner.concurrency = args.concurrency
+    questions = make_questions(args.questions)
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://bench", timeout=None) as client:
+        main.response_cache.clear()
+        if main.semantic_cache is not None:
+            main.semantic_cache.clear()
+        calls = fake.calls
+        sequential = await run_sequential(client, questions)
+        sequential_calls = fake.calls - calls
+
+        main.response_cache.clear()
+        if main.semantic_cache is not None:
+            main.semantic_cache.clear()
+        calls = fake.calls
+        batch, results = await run_batch(client, questions)
+        batch_calls = fake.calls - calls
+
+    sources = {}
+    for result in results:
+        sources[result["source"]] = sources.get(result["source"], 0) + 1
+    print(f"{len(questions)} questions, fake model latency {args.llm_latency * 1000:.0f} ms\n")
+    print(f"sequential /chat   {sequential:7.2f}s  {sequential_calls:4d} model calls")
+    print(f"POST /chat/batch   {batch:7.2f}s  {batch_calls:4d} model calls")
+    print(f"answer sources     {sources}")
+
+    main.response_cache.clear()
+    if main.semantic_cache is not None:
+        main.semantic_cache.clear()
+    restart = await run_restart(main, fake, make_questions(args.questions, seed=8), args)
+    print(
+        f"restart            {restart['answered_before']} answered before the worker died, "
+        f"resumed {restart['resumed']} job, {restart['model_calls_after']} model calls after, "
+        f"finished {restart['status']} with {restart['completed']}/{args.questions}"
+    )
+    assert restart["status"] == "done" and restart["completed"] == args.questions
+
+    main.llm_client.shutdown()
+    main.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="chat-batch-") as workdir:
+        os.environ["GEMINI_API_KEY"] = ""
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "chats.db")
+        os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(workdir, "semantic_cache.npz")
+        os.environ["MODEL_CACHE_PATH"] = os.path.join(workdir, "models_cache.json")
+        os.environ["ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+        os.environ["RATE_LIMIT_CLIENT_PER_MINUTE"] = "0"
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
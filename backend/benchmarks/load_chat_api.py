@@ -0,0 +1,311 @@
+# Offline load test for the chat API with a fake Gemini model
+#
+#   cd backend && python -m benchmarks.load_chat_api
+#   cd backend && python -m benchmarks.load_chat_api --sessions 20000 --store memory
+#   cd backend && python -m benchmarks.load_chat_api --compare benchmarks/results/<old>.json
+#
+# Seeds a throwaway store with --sessions chats, then drives the app in
+# process (httpx against the ASGI app, no sockets) with these traffic mixes:
+#
+#   fixed_query  POST /chat with questions answered from FIXED_QUERIES
+#   llm_miss     POST /chat with unique questions that reach the fake model
+#   history      GET /chats/{chat_id}?limit=50 on seeded chats
+#   sidebar      GET /chats?limit=30, first page and cursor pages behind it
+#   mixed        all of the above, weighted like real traffic
+#
+# Each mix reports throughput, p50/p95/p99 latency and RSS growth. The run
+# is written to benchmarks/results/<time>-<commit>.json so runs on different
+# commits can be compared with --compare.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SCENARIOS = ["fixed_query", "llm_miss", "history", "sidebar", "mixed"]
+MIXED_WEIGHTS = {"fixed_query": 40, "llm_miss": 15, "history": 30, "sidebar": 15}
+
+FIXED_QUESTIONS = [
+    "What fertilizer should I use for my soil?",
+    "Will it rain this week?",
+    "How do I get rid of aphids?",
+    "When should I harvest my wheat?",
+    "How often should I use drip irrigation?",
+    "Is organic farming worth it?",
+]
+ANSWER = (
+    "Deworm goats every three to four months, rotate paddocks so larvae die off, "
+    "and check the inner eyelids for anaemia before dosing."
+)
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak, which is the best we can get
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def configure_environment(args, workdir):
+    # app.config reads these at import time, so set them first
+    os.environ["GEMINI_API_KEY"] = ""
+    os.environ["STORAGE_BACKEND"] = args.store
+    os.environ["SQLITE_PATH"] = os.path.join(workdir, "chats.db")
+    os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(workdir, "semantic_cache.npz")
+    os.environ["MODEL_CACHE_PATH"] = os.path.join(workdir, "models_cache.json")
+    os.environ["ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+    # All traffic comes from one address, so the per-client limits stay off
+    os.environ["RATE_LIMIT_CLIENT_PER_MINUTE"] = "0"
+    os.environ["RATE_LIMIT_CHAT_PER_MINUTE"] = "0"
+
+
+def seed_store(store, sessions, messages_per_session):
+    """Fill the store directly; much faster than going through the API"""
+    now = datetime.now()
+    chat_ids = []
+    for index in range(sessions):
+        chat_id = f"bench-{index:07d}"
+        created = now - timedelta(minutes=sessions - index)
+        store.create_session(chat_id, f"Benchmark chat {index}", created)
+        store.add_messages(chat_id, [
+            {
+                "sender": "user" if turn % 2 == 0 else "assistant",
+                "text": f"Seeded turn {turn} of chat {index}. " + (ANSWER if turn % 2 else "How do I deworm goats?"),
+                "timestamp": created + timedelta(seconds=turn),
+            }
+            for turn in range(messages_per_session)
+        ])
+        chat_ids.append(chat_id)
+    return chat_ids
+
+
+async def sidebar_cursors(client, pages):
+    """Walk the first pages of the sidebar once to collect real cursors"""
+    cursors = [None]
+    cursor = None
+    for _ in range(pages - 1):
+        params = {"limit": 30}
+        if cursor:
+            params["cursor"] = cursor
+        body = (await client.get("/chats", params=params)).json()
+        cursor = body.get("next_cursor")
+        if not cursor:
+            break
+        cursors.append(cursor)
+    return cursors
+
+
+def request_factories(chat_ids, cursors):
+    def fixed_query(client, index):
+        return client.post("/chat", json={"message": FIXED_QUESTIONS[index % len(FIXED_QUESTIONS)]})
+
+    def llm_miss(client, index):
+        # Mostly fresh tokens, so neither the exact nor the semantic cache matches
+        token = uuid.uuid4().hex
+        words = " ".join(token[i:i + 8] for i in range(0, 32, 8))
+        return client.post("/chat", json={"message": f"goats {words}"})
+
+    def history(client, index):
+        return client.get(f"/chats/{chat_ids[index * 7919 % len(chat_ids)]}", params={"limit": 50})
+
+    def sidebar(client, index):
+        params = {"limit": 30}
+        cursor = cursors[index % len(cursors)]
+        if cursor:
+            params["cursor"] = cursor
+        return client.get("/chats", params=params)
+
+    factories = {
+        "fixed_query": fixed_query,
+        "llm_miss": llm_miss,
+        "history": history,
+        "sidebar": sidebar,
+    }
+
+    names = list(MIXED_WEIGHTS)
+    mix = random.Random(42).choices(names, weights=[MIXED_WEIGHTS[n] for n in names], k=10000)
+
+    def mixed(client, index):
+        return factories[mix[index % len(mix)]](client, index)
+
+    factories["mixed"] = mixed
+    return factories
+
+
+async def run_scenario(client, factory, requests, concurrency):
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            response = await factory(client, index)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    ordered = sorted(latencies)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_ms": {
+            "mean": round(statistics.fmean(ordered) * 1000, 2),
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2),
+        },
+        "rss_before_mb": round(rss_before / 2 ** 20, 1),
+        "rss_after_mb": round(rss_after / 2 ** 20, 1),
+        "rss_growth_mb": round((rss_after - rss_before) / 2 ** 20, 1),
+    }
+
+
+def print_scenario(name, result):
+    latency = result["latency_ms"]
+    print(
+        f"{name:<12} {result['throughput_rps']:>8.1f} req/s  "
+        f"p50 {latency['p50']:>7.2f}  p95 {latency['p95']:>7.2f}  p99 {latency['p99']:>7.2f} ms  "
+        f"errors {result['errors']:<4} rss +{result['rss_growth_mb']} MB"
+    )
+
+
+def compare(previous_path, current):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nvs {previous['meta']['commit']} ({os.path.basename(previous_path)})")
+    for name, result in current["scenarios"].items():
+        before = previous["scenarios"].get(name)
+        if before is None:
+            continue
+        rps = (result["throughput_rps"] / before["throughput_rps"] - 1) * 100
+        p95 = (result["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1) * 100
+        print(f"{name:<12} throughput {rps:+6.1f}%   p95 {p95:+6.1f}%")
+
+
+async def main_async(args):
+    from app import main
+    from benchmarks.fake_model import FakeModel, install_fake_model
+
+    install_fake_model(main, FakeModel(
+        latency=args.llm_latency, text=ANSWER, tokens_per_second=args.tokens_per_second
+    ))
+
+    rss_start = rss_bytes()
+    start = time.perf_counter()
+    chat_ids = seed_store(main.store, args.sessions, args.messages_per_session)
+    seed_seconds = time.perf_counter() - start
+    print(f"seeded {args.sessions} sessions x {args.messages_per_session} messages in {seed_seconds:.1f}s")
+
+    import httpx
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "setup": {
+            "seed_seconds": round(seed_seconds, 2),
+            "rss_seeded_mb": round(rss_bytes() / 2 ** 20, 1),
+            "rss_seed_growth_mb": round((rss_bytes() - rss_start) / 2 ** 20, 1),
+        },
+        "scenarios": {},
+    }
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://bench") as client:
+        factories = request_factories(chat_ids, await sidebar_cursors(client, args.sidebar_pages))
+        for name in args.scenarios:
+            # Short warm-up so one-off costs (imports, first queries) are excluded
+            await run_scenario(client, factories[name], min(50, args.requests), args.concurrency)
+            result["scenarios"][name] = await run_scenario(
+                client, factories[name], args.requests, args.concurrency
+            )
+            print_scenario(name, result["scenarios"][name])
+
+    main.llm_client.shutdown()
+    main.store.close()
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--store", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--messages-per-session", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per traffic mix")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake model time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="fake model generation speed")
+    parser.add_argument("--sidebar-pages", type=int, default=10, help="how deep sidebar requests page")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="chat-bench-") as workdir:
+        configure_environment(args, workdir)
+        result = asyncio.run(main_async(args))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{result['meta']['commit']}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        compare(args.compare, result)
+
+
+if __name__ == "__main__":
+    main()
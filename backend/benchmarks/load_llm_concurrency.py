@@ -0,0 +1,48 @@
+# Load test: concurrent /chat requests against a sleeping fake model
+#
+#   cd backend && GEMINI_API_KEY= python -m benchmarks.load_llm_concurrency
+#
+# With the old blocking generate_content call the requests were served one at
+# a time (total ~= requests * latency). With the async client they overlap and
+# the total is bounded by LLM_MAX_CONCURRENCY instead.
+import asyncio
+import time
+
+import httpx
+
+from app import main
+from benchmarks.fake_model import FakeModel, install_fake_model
+
+REQUESTS = 16
+LATENCY = 0.5
+
+
+async def fire(client, index):
+    start = time.perf_counter()
+    # Avoid fixed-query keywords so every request reaches the model
+    response = await client.post("/chat", json={"message": f"question number {index} about goats"})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main_async():
+    fake = FakeModel(latency=LATENCY)
+    install_fake_model(main, fake)
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(fire(client, i) for i in range(REQUESTS)))
+        total = time.perf_counter() - start
+
+    serial = REQUESTS * LATENCY
+    print(f"requests           {REQUESTS}")
+    print(f"model latency      {LATENCY:.2f}s")
+    print(f"max concurrency    {main.llm_client.max_concurrency}")
+    print(f"upstream calls     {fake.calls}")
+    print(f"wall time          {total:.2f}s (serial would be {serial:.2f}s)")
+    print(f"slowest request    {max(latencies):.2f}s")
+    print(f"overlap factor     {serial / total:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
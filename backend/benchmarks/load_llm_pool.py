@@ -0,0 +1,96 @@
+# Resilience check for the model pool against fake backends
+#
+#   cd backend && python -m benchmarks.load_llm_pool
+#
+# 1. brownout: the primary tier fails every call. Its breaker opens after a
+#    few failures and later requests go straight to the secondary tier.
+# 2. tail:     5% of primary calls take 10x longer. Hedging after the p95
+#    latency cuts the p99.
+# 3. outage:   every tier fails; the caller gets AllBackendsFailed quickly
+#    and serves its fallback answer.
+import asyncio
+import statistics
+import time
+
+from app.llm import LLMClient
+from app.llm_pool import AllBackendsFailed, LLMPool
+from benchmarks.fake_model import FakeModel
+
+REQUESTS = 200
+LATENCY = 0.05
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(pool, requests=REQUESTS, concurrency=8):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await pool.generate("how do I deworm goats")
+            except AllBackendsFailed:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, failures, time.perf_counter() - start
+
+
+def report(name, pool, latencies, failures, wall):
+    print(f"[{name}]")
+    print(f"  p50 / p99        {statistics.median(latencies) * 1000:.0f} / {percentile(latencies, 0.99) * 1000:.0f} ms")
+    print(f"  failed requests  {failures}/{len(latencies)}")
+    print(f"  wall time        {wall:.2f}s")
+    stats = pool.stats()
+    print(f"  retries {stats['retries']}  hedges {stats['hedges']} (won {stats['hedge_wins']})")
+    for backend in stats["backends"]:
+        print(f"  {backend['name']:<10} state={backend['state']:<9} calls={backend['calls']:<4} "
+              f"errors={backend['errors']:<4} trips={backend['trips']}")
+
+
+def make_pool(client, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("backoff_max", 0.05)
+    return LLMPool(client, **kwargs)
+
+
+async def main_async():
+    client = LLMClient(max_concurrency=16, timeout=5.0)
+
+    primary = FakeModel(latency=LATENCY, error_rate=1.0, seed=1)
+    secondary = FakeModel(latency=LATENCY, seed=2)
+    pool = make_pool(client)
+    pool.set_backends([("primary", primary), ("secondary", secondary)])
+    report("brownout", pool, *await run(pool))
+    assert primary.calls < 20, "breaker should stop calls to the failing tier"
+
+    for hedge in (False, True):
+        primary = FakeModel(latency=LATENCY, slow_rate=0.05, slow_latency=LATENCY * 10, seed=3)
+        secondary = FakeModel(latency=LATENCY, slow_rate=0.05, slow_latency=LATENCY * 10, seed=4)
+        pool = make_pool(client, hedge=hedge, hedge_min_samples=20)
+        pool.set_backends([("primary", primary), ("secondary", secondary)])
+        report(f"tail, hedge={'on' if hedge else 'off'}", pool, *await run(pool))
+
+    pool = make_pool(client)
+    pool.set_backends([
+        ("primary", FakeModel(latency=LATENCY, error_rate=1.0)),
+        ("secondary", FakeModel(latency=LATENCY, error_rate=1.0)),
+    ])
+    latencies, failures, wall = await run(pool)
+    report("outage", pool, latencies, failures, wall)
+    assert failures == REQUESTS
+
+    client.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,228 @@
+# Multi-worker check: several local workers, requests round-robined across them
+#
+#   cd backend && python -m benchmarks.load_multi_worker
+#   cd backend && python -m benchmarks.load_multi_worker --workers 8 --chats 500
+#
+# Starts --workers uvicorn processes on their own ports, all sharing one
+# throwaway SQLite file and archive directory (the layout gunicorn.conf.py
+# runs behind a single port), then sends consecutive requests to
+# consecutive workers with no stickiness and checks that:
+#
+#   - chats created concurrently on every worker get distinct ids
+#   - a chat continued on a different worker each turn keeps one history,
+#     with contiguous message ids, as seen from every worker
+#   - a chat deleted on one worker is gone on all of them, and the others
+#     received the invalidation event
+#   - DELETE /cache on one worker reaches the others
+#   - sessions archived by one worker are listed and reopened by the others
+#
+# Exits non-zero on the first failed check.
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_workers(count, workdir, args):
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY="",
+        STORAGE_BACKEND="sqlite",
+        SQLITE_PATH=os.path.join(workdir, "chats.db"),
+        SEMANTIC_CACHE_PATH=os.path.join(workdir, "semantic_cache.npz"),
+        MODEL_CACHE_PATH=os.path.join(workdir, "models_cache.json"),
+        ARCHIVE_DIR=os.path.join(workdir, "archive"),
+        INVALIDATION_POLL_SECONDS=str(args.poll_interval),
+        # Every request comes from this one address
+        RATE_LIMIT_CLIENT_PER_MINUTE="0",
+        RATE_LIMIT_CHAT_PER_MINUTE="0",
+        # The store starts empty, so retention only acts on POST /retention/run
+        RETENTION_MAX_SESSIONS=str(args.chats // 2),
+        RETENTION_MAX_IDLE_DAYS="0",
+        # Every chat here was just used; archive them all the same
+        RETENTION_ACTIVE_SECONDS="0",
+    )
+    workers = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+        )
+        workers.append((f"http://127.0.0.1:{port}", process))
+    return workers
+
+
+async def wait_until_ready(client, urls, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    for url in urls:
+        while True:
+            try:
+                if (await client.get(f"{url}/")).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"worker at {url} did not come up")
+            await asyncio.sleep(0.2)
+
+
+class RoundRobin:
+    """Send each request to the next worker in turn"""
+
+    def __init__(self, client, urls):
+        self.client = client
+        self.urls = urls
+        self.next = 0
+
+    def url(self) -> str:
+        url = self.urls[self.next % len(self.urls)]
+        self.next += 1
+        return url
+
+    def request(self, method, path, **kwargs):
+        return self.client.request(method, self.url() + path, **kwargs)
+
+
+def check(condition, message):
+    print(f"{'ok' if condition else 'FAIL':<5} {message}")
+    if not condition:
+        sys.exit(1)
+
+
+async def run_checks(client, urls, args, workdir):
+    rr = RoundRobin(client, urls)
+
+    identities = {(await client.get(f"{url}/worker")).json()["worker"] for url in urls}
+    check(len(identities) == len(urls), f"{len(urls)} distinct workers answering")
+
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(
+        rr.request("POST", "/chat", json={"message": f"Question {i} about my maize"})
+        for i in range(args.chats)
+    ))
+    elapsed = time.perf_counter() - start
+    chat_ids = [response.json()["chat_id"] for response in responses]
+    check(all(response.status_code == 200 for response in responses), f"{args.chats} chats created round-robin")
+    check(len(set(chat_ids)) == len(chat_ids), "every new chat got a distinct id")
+    print(f"      {args.chats / elapsed:.0f} req/s creating chats over {len(urls)} workers")
+
+    listed = set()
+    cursor = None
+    while True:
+        params = {"limit": 200, **({"before": cursor} if cursor else {})}
+        page = (await rr.request("GET", "/chats", params=params)).json()
+        listed.update(session["chat_id"] for session in page["sessions"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    check(set(chat_ids) <= listed, "the sidebar on any worker lists chats made on every worker")
+
+    chat_id = chat_ids[0]
+    continued = []
+    for turn in range(args.turns):
+        response = await rr.request("POST", "/chat", json={"message": f"Follow-up {turn}", "chat_id": chat_id})
+        continued.append(response.json()["chat_id"])
+    check(continued == [chat_id] * args.turns, "follow-ups sent to other workers continue the same chat")
+    expected = 2 * (args.turns + 1)
+    histories = [(await client.get(f"{url}/chats/{chat_id}")).json() for url in urls]
+    check(
+        all([m["id"] for m in h["messages"]] == list(range(1, expected + 1)) for h in histories),
+        f"a chat continued on {args.turns} workers has {expected} contiguous messages on every worker",
+    )
+
+    await asyncio.gather(*(
+        rr.request("POST", "/chat", json={"message": f"Parallel {i}", "chat_id": chat_ids[1]})
+        for i in range(len(urls) * 5)
+    ))
+    ids = [m["id"] for m in (await rr.request("GET", f"/chats/{chat_ids[1]}")).json()["messages"]]
+    check(ids == list(range(1, len(ids) + 1)) and len(ids) == 2 + 2 * len(urls) * 5,
+          "concurrent turns of one chat on all workers never reuse a message id")
+
+    received = [(await client.get(f"{url}/worker")).json()["received"] for url in urls]
+    deleted = chat_ids[2]
+    await client.delete(f"{urls[0]}/chats/{deleted}")
+    statuses = [(await client.get(f"{url}/chats/{deleted}")).status_code for url in urls]
+    check(all(status == 404 for status in statuses), "a chat deleted on one worker is gone on all of them")
+
+    await client.delete(f"{urls[0]}/cache")
+    await asyncio.sleep(args.poll_interval * 3)
+    after = [(await client.get(f"{url}/worker")).json()["received"] for url in urls]
+    check(
+        all(now - before >= 2 for now, before in zip(after[1:], received[1:])),
+        "the other workers received the delete and cache-clear invalidations",
+    )
+
+    # RETENTION_MAX_SESSIONS is half of --chats, so this archives the coldest
+    report = (await client.post(f"{urls[0]}/retention/run")).json()
+    check(report.get("archived_over_cap", 0) > 0, f"worker 0 archived {report.get('archived_over_cap')} sessions")
+    archived = archived_chat_ids(os.path.join(workdir, "archive"))
+    seen = [(await client.get(f"{url}/retention/stats")).json()["archived_sessions"] for url in urls]
+    check(all(count == len(archived) for count in seen), "every worker sees the sessions worker 0 archived")
+
+    reopened = sorted(archived)[0]
+    response = await client.get(f"{urls[-1]}/chats/{reopened}")
+    check(response.status_code == 200 and response.json()["messages"], "another worker reopens an archived chat")
+    listings = [(await client.get(f"{url}/chats", params={"limit": 200})).json()["sessions"] for url in urls]
+    check(
+        all(sum(session["chat_id"] == reopened for session in sessions) <= 1 for sessions in listings),
+        "a reopened chat is listed once on every worker",
+    )
+    seen = [(await client.get(f"{url}/retention/stats")).json()["archived_sessions"] for url in urls]
+    check(all(count == len(archived) - 1 for count in seen), "every worker sees it left the archive")
+
+
+def archived_chat_ids(directory):
+    """Replay the shared archive index the same way the workers do"""
+    archived = set()
+    with open(os.path.join(directory, "index.jsonl")) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["op"] == "add":
+                archived.add(record["chat_id"])
+            else:
+                archived.discard(record["chat_id"])
+    return archived
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory(prefix="chat-workers-") as workdir:
+        workers = start_workers(args.workers, workdir, args)
+        try:
+            async with httpx.AsyncClient(timeout=30) as client:
+                await wait_until_ready(client, [url for url, _ in workers])
+                await run_checks(client, [url for url, _ in workers], args, workdir)
+        finally:
+            for _, process in workers:
+                process.terminate()
+            for _, process in workers:
+                process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Concurrency check: N identical /chat questions -> one upstream model call
+#
+#   cd backend && GEMINI_API_KEY= STORAGE_BACKEND=memory RATE_LIMIT_CLIENT_PER_MINUTE=0 python -m benchmarks.load_singleflight
+import asyncio
+import time
+
+import httpx
+
+from app import main
+from benchmarks.fake_model import FakeModel, install_fake_model
+
+REQUESTS = 50
+LATENCY = 0.5
+
+
+async def main_async():
+    fake = FakeModel(latency=LATENCY)
+    install_fake_model(main, fake)
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            # Same question, different spelling, each in its own new chat
+            client.post("/chat", json={"message": "How should I deworm my GOATS?" if i % 2 else "how should i deworm my goats"})
+            for i in range(REQUESTS)
+        ))
+        total = time.perf_counter() - start
+
+    chat_ids = {response.json()["chat_id"] for response in responses}
+    stats = main.llm_flights.stats()
+    print(f"requests           {REQUESTS}")
+    print(f"distinct chats     {len(chat_ids)}")
+    print(f"upstream calls     {fake.calls}")
+    print(f"coalesced          {stats['coalesced']}")
+    print(f"dedup ratio        {stats['dedup_ratio']:.2f}")
+    print(f"wall time          {total:.2f}s")
+    assert fake.calls == 1, f"expected exactly one upstream call, got {fake.calls}"
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,52 @@
+# Pick SEMANTIC_CACHE_THRESHOLD from labelled question pairs
+#
+#   cd backend && python -m benchmarks.tune_semantic_threshold
+#
+# tests/data/semantic_pairs.json holds paraphrases (should be served from the
+# cache) and pairs that only look alike (should not). For each threshold this
+# prints how many paraphrases are served and how many of the others are,
+# with SemanticCache's entity and action check and with bag-of-words cosine
+# alone. The default, 0.6, is the highest threshold that still serves the
+# question/paraphrase pairs whose wording differs most; raising it trades
+# served paraphrases (a model call each) for fewer false hits (a wrong answer
+# each).
+import json
+import os
+
+from app.semantic_cache import SemanticCache
+
+PAIRS_PATH = os.path.join(os.path.dirname(__file__), "..", "tests", "data", "semantic_pairs.json")
+THRESHOLDS = [0.4, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85]
+
+
+def similarities(pairs):
+    checked, cosine = [], []
+    for cached_question, question in pairs:
+        cache = SemanticCache(max_entries=4)
+        cache.add(cached_question, "answer")
+        found = cache.search(question)
+        checked.append(found[0] if found else -1.0)
+        vectorizer = cache.vectorizer
+        cosine.append(float(vectorizer.transform(cached_question) @ vectorizer.transform(question)))
+    return checked, cosine
+
+
+def main():
+    with open(PAIRS_PATH, encoding="utf-8") as f:
+        pairs = json.load(f)
+    same_checked, same_cosine = similarities(pairs["paraphrases"])
+    other_checked, other_cosine = similarities(pairs["different"])
+    same, other = len(same_checked), len(other_checked)
+
+    print(f"{len(pairs['paraphrases'])} paraphrases, {len(pairs['different'])} look-alikes\n")
+    print(f"{'threshold':>9}  {'served':>8} {'false hits':>10}   {'cosine only: served':>19} {'false hits':>10}")
+    for threshold in THRESHOLDS:
+        count = lambda scores: sum(score >= threshold for score in scores)
+        print(
+            f"{threshold:>9.2f}  {count(same_checked):>4}/{same:<3} {count(other_checked):>6}/{other:<3}   "
+            f"{count(same_cosine):>15}/{same:<3} {count(other_cosine):>6}/{other:<3}"
+        )
+
+
+if __name__ == "__main__":
+    main()
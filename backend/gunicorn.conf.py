@@ -0,0 +1,55 @@
+# Production worker profile
+#
+#   cd backend && gunicorn app.main:app -c gunicorn.conf.py
+#
+# Runs WEB_CONCURRENCY uvicorn workers behind one port. Workers share no
+# memory, so everything that must agree between them lives in the store:
+#
+#   STORAGE_BACKEND=sqlite  one host; all workers open the same SQLITE_PATH
+#                           (WAL mode, writers wait SQLITE_BUSY_TIMEOUT_SECONDS)
+#   STORAGE_BACKEND=mongo   several hosts; each worker keeps its own pool of
+#                           up to MONGODB_MAX_POOL_SIZE connections, so size
+#                           it as workers x pool <= what the server allows
+#   STORAGE_BACKEND=memory  single worker only; each worker would see its own chats
+#
+# Chat ids are ObjectIds, so any worker can create chats without coordination,
+# and requests need no sticky routing. Response caches and context summaries
+# stay per worker; deletions and DELETE /cache reach the other workers through
+# the store's event log within INVALIDATION_POLL_SECONDS. ARCHIVE_DIR must be
+# shared by every worker (local disk, or a shared volume across hosts).
+# Rate limits are per worker unless RATE_LIMIT_BACKEND=store, and each worker
+# admits up to ADMISSION_MAX_LLM_CALLS model calls of its own.
+# /metrics and /llm/stats describe the worker that answered the scrape.
+#
+# Without gunicorn, the same layout is:
+#
+#   uvicorn app.main:app --host 0.0.0.0 --port 8001 --workers 4
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8001")
+workers = int(os.getenv("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# A completion may take up to LLM_TIMEOUT_SECONDS (60s by default), and a
+# streamed answer keeps its request open for as long as it runs
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't build up; the jitter keeps
+# them from all restarting at once
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+
+# Each worker runs its own startup hooks (model resolution, retention,
+# invalidation polling), so the app is imported after forking
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    if os.getenv("STORAGE_BACKEND", "sqlite").lower() == "memory" and workers > 1:
+        server.log.warning("STORAGE_BACKEND=memory with %d workers: chats will not be shared", workers)
@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Settings are read when app.config is first imported, so point everything
+# at a throwaway directory before any test module imports the app. No real
+# model (backend/.env is not consulted for keys already set) and no rate
+# limits; tests that need limits install their own AdmissionController.
+WORKDIR = tempfile.mkdtemp(prefix="chat-tests-")
+os.environ.update({
+    "GEMINI_API_KEY": "",
+    "STORAGE_BACKEND": "sqlite",
+    "SQLITE_PATH": os.path.join(WORKDIR, "chats.db"),
+    "SEMANTIC_CACHE_PATH": os.path.join(WORKDIR, "semantic_cache.npz"),
+    "MODEL_CACHE_PATH": os.path.join(WORKDIR, "models_cache.json"),
+    "ARCHIVE_DIR": os.path.join(WORKDIR, "archive"),
+    "RATE_LIMIT_CLIENT_PER_MINUTE": "0",
+    "RATE_LIMIT_CHAT_PER_MINUTE": "0",
+    "RATE_LIMIT_TRUST_FORWARDED": "true",
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.admission import AdmissionController, LLMGate, LocalTokenBuckets, RateLimit
+from app.batch import BatchRunner
+from benchmarks.fake_model import FakeModel, install_fake_model
+
+pytestmark = pytest.mark.anyio
+
+LATENCY = 0.3
+# Answered from FIXED_QUERIES, without the model
+FIXED_QUESTION = "How do I get rid of aphids?"
+
+
+@pytest.fixture(scope="module")
+def main():
+    from app import main
+
+    yield main
+    main.batch_runner.shutdown()
+    main.llm_client.shutdown()
+
+
+@pytest.fixture
+def fake(main):
+    fake = FakeModel(latency=LATENCY)
+    install_fake_model(main, fake)
+    main.clear_response_caches()
+    return fake
+
+
+@pytest.fixture
+def limits(main, monkeypatch):
+    """Install admission control with the given limits for one test"""
+    def install(client=(0, 1), chat=(0, 1), llm_calls=None, queue=64):
+        if llm_calls is None:
+            llm_calls = main.settings.LLM_MAX_CONCURRENCY
+        assert llm_calls <= main.settings.LLM_MAX_CONCURRENCY
+        controller = AdmissionController(
+            LocalTokenBuckets(),
+            per_client=RateLimit("client", *client),
+            per_chat=RateLimit("chat", *chat),
+            llm_quota=RateLimit("llm_quota", 0, 1),
+            gate=LLMGate(limit=llm_calls, max_waiting=queue, timeout=10),
+        )
+        monkeypatch.setattr(main, "admission", controller)
+        return controller
+    return install
+
+
+@pytest.fixture
+async def client(main):
+    async with httpx.AsyncClient(app=main.app, base_url="http://test", timeout=None) as client:
+        yield client
+
+
+def from_client(number):
+    return {"X-Forwarded-For": f"10.0.{number // 256}.{number % 256}"}
+
+
+async def timed_post(client, path, payload, headers=None):
+    start = time.perf_counter()
+    response = await client.post(path, json=payload, headers=headers)
+    return response, time.perf_counter() - start
+
+
+async def test_identical_questions_share_one_model_call(client, fake):
+    responses = await asyncio.gather(*(
+        # Same question, different spelling, each in its own new chat
+        client.post("/chat", json={"message": "How should I deworm my GOATS?" if i % 2 else "how should i deworm my goats"})
+        for i in range(20)
+    ))
+    assert [response.status_code for response in responses] == [200] * 20
+    assert len({response.json()["chat_id"] for response in responses}) == 20
+    assert fake.calls == 1
+
+
+async def test_streamed_answer_is_stored(client, fake):
+    async with client.stream("POST", "/chat/stream", json={"message": "When should I top-dress my maize?"}) as response:
+        frames = [line async for line in response.aiter_lines() if line.startswith("data: ")]
+    events = [json.loads(frame[len("data: "):]) for frame in frames]
+    chat_id, answer = events[0]["chat_id"], events[-1]["response"]
+    assert answer == fake.text == "".join(event["delta"] for event in events[1:-1])
+
+    history = (await client.get(f"/chats/{chat_id}")).json()
+    assert [(m["sender"], m["text"]) for m in history["messages"]] == [
+        ("user", "When should I top-dress my maize?"), ("assistant", answer),
+    ]
+
+
+async def test_flooding_client_gets_429_with_retry_after(client, fake, limits):
+    limits(client=(60, 3))
+    responses = await asyncio.gather(*(
+        client.post("/chat", json={"message": FIXED_QUESTION}, headers=from_client(1)) for _ in range(10)
+    ))
+    statuses = [response.status_code for response in responses]
+    # The burst, plus at most one token refilled while the flood ran
+    assert statuses.count(200) in (3, 4) and statuses.count(429) == 10 - statuses.count(200)
+    assert all(int(r.headers["Retry-After"]) >= 1 for r in responses if r.status_code == 429)
+
+    other = await client.post("/chat", json={"message": FIXED_QUESTION}, headers=from_client(2))
+    assert other.status_code == 200
+
+
+async def test_one_chat_is_limited_whoever_asks(client, fake, limits):
+    limits(chat=(1, 2))
+    chat_id = (await client.post("/chat", json={"message": FIXED_QUESTION})).json()["chat_id"]
+    statuses = []
+    for turn in range(4):
+        response = await client.post(
+            "/chat", json={"message": FIXED_QUESTION, "chat_id": chat_id}, headers=from_client(100 + turn)
+        )
+        statuses.append(response.status_code)
+    assert statuses == [200, 200, 429, 429]
+
+
+async def test_overload_is_turned_away_at_once(client, fake, main, limits):
+    controller = limits(llm_calls=2, queue=2)
+    main.response_cache.set("Cached question about goat fodder", "Cut it young.")
+    sessions_before = main.store.count_sessions()
+
+    tasks = [
+        asyncio.create_task(timed_post(client, "/chat", {"message": f"Question {i} about goat fodder"}))
+        for i in range(7)
+    ]
+    await asyncio.sleep(LATENCY / 3)
+    assert (controller.gate.active, controller.gate.waiting) == (2, 2)
+
+    # The fast lane still works while every slot is taken and the queue is full
+    fixed, fixed_seconds = await timed_post(client, "/chat", {"message": FIXED_QUESTION})
+    cached, cached_seconds = await timed_post(client, "/chat", {"message": "Cached question about goat fodder"})
+    assert fixed.status_code == cached.status_code == 200
+    assert max(fixed_seconds, cached_seconds) < LATENCY / 2
+    # A stream is turned away before it starts
+    stream = await client.post("/chat/stream", json={"message": "Streamed question about goat fodder"})
+    assert stream.status_code == 503 and "Retry-After" in stream.headers
+
+    results = await asyncio.gather(*tasks)
+    rejected = [(response, seconds) for response, seconds in results if response.status_code == 503]
+    assert len(rejected) == 3
+    assert all(seconds < LATENCY / 2 and int(response.headers["Retry-After"]) >= 1 for response, seconds in rejected)
+    assert [response.status_code for response, _ in results].count(200) == 4
+    # Rejected questions leave no empty chats behind
+    assert main.store.count_sessions() - sessions_before == 4 + 2
+
+
+async def wait_for_job(client, job_id):
+    while True:
+        job = (await client.get(f"/chat/batch/{job_id}")).json()
+        if job["status"] != "running":
+            return job
+        await asyncio.sleep(0.02)
+
+
+async def test_batch_answers_each_question_once(client, fake):
+    fake.latency = 0.05
+    questions = [FIXED_QUESTION, "Best feed for dairy goats?", "Best spacing for beans?"] * 3
+    response = await client.post("/chat/batch", json={"messages": questions, "stream": False})
+    assert response.status_code == 202
+
+    job = await wait_for_job(client, response.json()["job_id"])
+    assert (job["status"], job["completed"]) == ("done", len(questions))
+    assert [result["index"] for result in job["results"]] == list(range(len(questions)))
+    assert {result["source"] for result in job["results"][::3]} == {"fixed_query"}
+    assert fake.calls == 2
+
+
+async def test_batch_stream_sends_every_answer(client, fake):
+    fake.latency = 0.05
+    questions = [f"Best spacing for {crop}?" for crop in ("maize", "beans", "cassava", "potatoes")]
+    async with client.stream("POST", "/chat/batch", json={"messages": questions}) as response:
+        lines = [json.loads(line) async for line in response.aiter_lines() if line]
+    assert lines[0]["type"] == lines[-1]["type"] == "job"
+    assert lines[-1]["status"] == "done"
+    assert sorted(line["index"] for line in lines[1:-1]) == list(range(len(questions)))
+
+
+async def test_batch_job_resumes_after_its_worker_dies(fake, main):
+    fake.latency = 0.05
+    main.batch_runner.concurrency = 2
+    questions = [f"How much {crop} seed per acre?" for crop in ("maize", "beans", "rice", "millet", "sorghum", "wheat")] * 2
+    job_id = (await main.batch_runner.submit(questions))["job_id"]
+    while main.store.get_job(job_id)["completed"] < 2:
+        await asyncio.sleep(0.01)
+    # The worker goes away mid-job: its tasks stop and it never checks in again
+    main.batch_runner.shutdown()
+    await asyncio.sleep(0)
+
+    successor = BatchRunner(
+        main.store,
+        answer=main.answer_batch_question,
+        answer_fixed=main.check_fixed_queries,
+        key=main.response_cache.key,
+        owner="another-worker",
+        concurrency=2,
+        stale_after=0.2,
+    )
+    await asyncio.sleep(0.3)
+    assert await successor.resume_stale() == 1
+    await asyncio.gather(*list(successor.tasks.values()))
+    job = main.store.get_job(job_id)
+    assert (job["status"], job["completed"], job["owner"]) == ("done", len(questions), "another-worker")
+
+
+async def test_deleted_chat_is_gone(client, fake, main):
+    chat_id = (await client.post("/chat", json={"message": FIXED_QUESTION})).json()["chat_id"]
+    assert (await client.delete(f"/chats/{chat_id}")).status_code == 200
+    assert (await client.get(f"/chats/{chat_id}")).status_code == 404
+    assert chat_id not in main.active_sessions
+    assert main.invalidation.published >= 1
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from app.batch import BatchRunner
+from app.database import MemoryChatStore
+
+pytestmark = pytest.mark.anyio
+
+
+class RecordingStore(MemoryChatStore):
+    """Memory store that logs job writes in the order they happen"""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def complete_job_items(self, job_id, results, now):
+        self.writes.append(("answers", sorted(index for index, _, _ in results)))
+        super().complete_job_items(job_id, results, now)
+
+    def update_job(self, job_id, **fields):
+        if "status" in fields:
+            self.writes.append(("status", fields["status"]))
+        return super().update_job(job_id, **fields)
+
+
+def make_runner(store, answer, **options):
+    return BatchRunner(
+        store,
+        answer=answer,
+        answer_fixed=lambda message: "Rotate your crops." if message == "fixed" else None,
+        key=str.lower,
+        owner="worker-a",
+        **options,
+    )
+
+
+async def answer_slowly(message):
+    if message == "broken":
+        raise RuntimeError("model exploded")
+    await asyncio.sleep(0.05 if message == "slow" else 0.01)
+    return f"answer to {message}", "model"
+
+
+async def wait_for(runner, job_id):
+    await asyncio.gather(*[task for key, task in runner.tasks.items() if key == job_id])
+
+
+async def test_failed_group_lets_the_others_finish_first():
+    store = RecordingStore()
+    runner = make_runner(store, answer_slowly)
+    job = await runner.submit(["fixed", "broken", "slow", "quick", "QUICK"])
+    await wait_for(runner, job["job_id"])
+
+    assert store.get_job(job["job_id"])["status"] == "failed"
+    # Nothing is written after the job is marked failed
+    assert store.writes[-1] == ("status", "failed")
+    assert sorted(index for kind, indexes in store.writes[:-1] for index in indexes) == [0, 2, 3, 4]
+    assert runner.deduplicated == 1
+
+
+async def test_readers_get_every_answer_and_leave_nothing_behind():
+    store = MemoryChatStore()
+    runner = make_runner(store, answer_slowly, concurrency=2)
+    job = await runner.submit(["fixed", "slow", "quick", "other"])
+
+    async def read_all():
+        return [item["index"] async for item in runner.results(job["job_id"], poll_interval=5)]
+
+    first, second = await asyncio.wait_for(asyncio.gather(read_all(), read_all()), 2)
+    assert sorted(first) == sorted(second) == [0, 1, 2, 3]
+    assert runner._progress == {}
+
+    # A reader that stops early cleans up too
+    job = await runner.submit(["slow", "other"])
+    reader = runner.results(job["job_id"])
+    await reader.__anext__()
+    assert len(runner._progress[job["job_id"]]) == 1
+    await reader.aclose()
+    assert runner._progress == {}
+    await wait_for(runner, job["job_id"])
+
+
+async def test_finished_jobs_are_purged():
+    store = MemoryChatStore()
+    runner = make_runner(store, answer_slowly, keep_finished=0)
+    done = await runner.submit(["quick"])
+    await wait_for(runner, done["job_id"])
+    running = await runner.submit(["slow"])
+
+    assert await runner.purge_finished(batch_size=1) == 1
+    assert store.get_job(done["job_id"]) is None and store.job_items(done["job_id"]) == []
+    assert store.get_job(running["job_id"])["status"] == "running"
+    assert runner.stats()["purged"] == 1
+    await wait_for(runner, running["job_id"])
@@ -0,0 +1,74 @@
+from app.cache import InMemoryCacheBackend, ResponseCache, normalize_message
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(max_entries=3, ttl=60.0, stem=False):
+    clock = Clock()
+    return ResponseCache(InMemoryCacheBackend(max_entries=max_entries, ttl=ttl, clock=clock), stem=stem), clock
+
+
+def test_spelling_variants_share_a_key():
+    cache, _ = make_cache(stem=True)
+    cache.set("How should I deworm my GOATS?", "Every three months.")
+    assert cache.get("how should i deworm my goat") == "Every three months."
+    assert normalize_message("  Aphids,   on my  tomatoes!! ") == "aphids on my tomatoes"
+
+
+def test_entries_expire_after_their_ttl():
+    cache, clock = make_cache(ttl=60)
+    cache.set("When to plant beans?", "After the first rains.")
+    clock.now += 60
+    assert cache.get("When to plant beans?") == "After the first rains."
+    clock.now += 0.001
+    assert cache.get("When to plant beans?") is None
+    assert len(cache.backend) == 0
+    # Setting it again starts a fresh TTL
+    cache.set("When to plant beans?", "After the first rains.")
+    clock.now += 30
+    assert cache.get("When to plant beans?") is not None
+
+
+def test_no_ttl_never_expires():
+    cache, clock = make_cache(ttl=None)
+    cache.set("Best maize spacing?", "75 by 25 cm.")
+    clock.now += 10 ** 9
+    assert cache.get("Best maize spacing?") == "75 by 25 cm."
+
+
+def test_least_recently_used_is_evicted_first():
+    cache, _ = make_cache(max_entries=3)
+    for question in ("one", "two", "three"):
+        cache.set(question, question.upper())
+    # A read makes "one" the most recently used, so "two" goes next
+    assert cache.get("one") == "ONE"
+    cache.set("four", "FOUR")
+    assert cache.get("two") is None
+    assert [cache.get(question) for question in ("one", "three", "four")] == ["ONE", "THREE", "FOUR"]
+    # Overwriting refreshes an entry too
+    cache.set("one", "ONE again")
+    cache.set("five", "FIVE")
+    assert cache.get("three") is None and cache.get("one") == "ONE again"
+
+
+def test_counters():
+    cache, clock = make_cache(max_entries=2, ttl=10)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.set("c", "C")  # evicts "a"
+    assert cache.get("a") is None
+    assert cache.get("b") == "B"
+    clock.now += 11
+    assert cache.get("c") is None  # expired, and counted as an eviction
+    stats = cache.stats()
+    assert {key: stats[key] for key in ("entries", "hits", "misses", "evictions")} == {
+        "entries": 1, "hits": 1, "misses": 2, "evictions": 2,
+    }
+    assert stats["hit_ratio"] == 1 / 3
+    assert stats["backend"] == "InMemoryCacheBackend"
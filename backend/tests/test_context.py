@@ -0,0 +1,106 @@
+from app.context import ContextBuilder, estimate_tokens, extractive_summary
+
+PROMPT = "Farmer asks: what should I plant next?"
+
+
+def history(count, first_id=1):
+    # Every message is 40 characters, 10 estimated tokens
+    return [
+        {
+            "id": message_id,
+            "sender": "user" if message_id % 2 else "assistant",
+            "text": f"{'Question' if message_id % 2 else 'Answer'} number {message_id:03d}.".ljust(40, "x"),
+        }
+        for message_id in range(first_id, first_id + count)
+    ]
+
+
+def roles(built):
+    return [content["role"] for content in built.contents]
+
+
+def verbatim_texts(built):
+    # Skip the summary exchange, if any, and the prompt
+    start = 2 if built.contents[0]["parts"][0].startswith("Summary") else 0
+    return [part for content in built.contents[start:] for part in content["parts"]][:-1]
+
+
+def test_short_history_goes_out_verbatim():
+    messages = history(4)
+    built = ContextBuilder(token_budget=200).build("chat-1", messages, PROMPT)
+    assert roles(built) == ["user", "model", "user", "model", "user"]
+    assert verbatim_texts(built) == [message["text"] for message in messages]
+    assert (built.verbatim_messages, built.summarized_messages) == (4, 0)
+    assert built.prompt_tokens == 40 + estimate_tokens(PROMPT)
+    assert not built.standalone
+
+
+def test_new_chat_is_standalone():
+    built = ContextBuilder().build(None, [], PROMPT)
+    assert built.contents == [{"role": "user", "parts": [PROMPT]}]
+    assert built.standalone
+
+
+def test_older_turns_are_summarized_within_the_budget():
+    builder = ContextBuilder(token_budget=100, summary_token_budget=30)
+    messages = history(20)
+    built = builder.build("chat-1", messages, PROMPT)
+
+    summary = builder._summaries["chat-1"]
+    assert built.summarized_messages + built.verbatim_messages == 20
+    assert summary.covered_until == 20 - built.verbatim_messages
+    # Everything the builder counts stays inside the budget
+    used = estimate_tokens(PROMPT) + estimate_tokens("\n".join(summary.lines))
+    used += sum(estimate_tokens(text) for text in verbatim_texts(built))
+    assert used <= 100
+    # The newest turns, starting with a question, alternating
+    assert verbatim_texts(built) == [message["text"] for message in messages[-built.verbatim_messages:]]
+    assert roles(built)[2] == "user"
+    assert all(a != b for a, b in zip(roles(built), roles(built)[1:]))
+
+
+def test_summary_keeps_to_its_own_budget():
+    builder = ContextBuilder(token_budget=60, summary_token_budget=30)
+    builder.build("chat-1", history(30), PROMPT)
+    summary = builder._summaries["chat-1"]
+    assert summary.lines and estimate_tokens("\n".join(summary.lines)) <= 30
+    # The oldest lines go first
+    assert summary.lines[-1] == extractive_summary([history(1, summary.covered_until)[0]])[0]
+
+
+def test_summary_is_only_extended_with_turns_that_fell_out():
+    seen = []
+
+    def summarizer(messages):
+        seen.append([message["id"] for message in messages])
+        return extractive_summary(messages)
+
+    builder = ContextBuilder(token_budget=100, summary_token_budget=40, summarizer=summarizer)
+    messages = history(20)
+    builder.build("chat-1", messages, PROMPT)
+    covered = builder._summaries["chat-1"].covered_until
+    assert [i for ids in seen for i in ids] == list(range(1, covered + 1))
+    calls = len(seen)
+
+    messages += history(4, first_id=21)
+    built = builder.build("chat-1", messages, PROMPT)
+    # Only newly dropped turns are summarized; summarized turns never come back verbatim
+    assert seen[calls][0] == covered + 1
+    assert [i for ids in seen for i in ids] == list(range(1, builder._summaries["chat-1"].covered_until + 1))
+    assert verbatim_texts(built) == [message["text"] for message in messages[-built.verbatim_messages:]]
+
+    builder.forget("chat-1")
+    assert builder.build("chat-1", history(2), PROMPT).summarized_messages == 0
+
+
+def test_unanswered_question_shares_the_prompt_turn():
+    # A stream cancelled before its first chunk leaves an empty answer behind
+    messages = history(2) + [{"id": 3, "sender": "user", "text": "Is it too late for maize?"},
+                             {"id": 4, "sender": "assistant", "text": ""}]
+    built = ContextBuilder(token_budget=200).build("chat-1", messages, PROMPT)
+    assert roles(built) == ["user", "model", "user"]
+    assert built.contents[-1]["parts"] == ["Is it too late for maize?", PROMPT]
+    assert built.prompt_tokens == sum(estimate_tokens(m["text"]) for m in messages if m["text"]) + estimate_tokens(PROMPT)
+
+    built = ContextBuilder(token_budget=200).build("chat-2", messages[2:], PROMPT)
+    assert len(built.contents) == 1 and not built.standalone
@@ -0,0 +1,75 @@
+import pytest
+
+from app.fixed_queries import FIXED_QUERIES
+from app.intents import IntentMatcher
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return IntentMatcher(FIXED_QUERIES)
+
+
+def categories(matcher, message):
+    return [intent.category for intent in matcher.match(message)]
+
+
+@pytest.mark.parametrize("message", [
+    "This is about something else",
+    "Which path leads to the market?",
+    "Show me the graph",
+])
+def test_short_patterns_only_match_whole_words(matcher, message):
+    # "hi" in "this"/"which", "ph" in "graph"
+    assert categories(matcher, message) == []
+
+
+def test_inflections_match(matcher):
+    assert categories(matcher, "My crops need watering") == ["crops", "irrigation"]
+    assert categories(matcher, "Hi there") == ["greeting"]
+
+
+@pytest.mark.parametrize("message, category", [
+    ("Which drought-resistant maize should I sow?", "irrigation"),
+    ("Any help with weather-related crop losses?", "weather"),
+    ("Is my produce chemical-free?", "organic"),
+    ("Is my produce chemical free?", "organic"),
+    ("Pesticide-free tomatoes", "organic"),
+])
+def test_hyphens_separate_words(matcher, message, category):
+    assert matcher.best(message).category == category
+
+
+def test_phrase_hits_are_whole_phrases(matcher):
+    found = {intent.category: intent.hits for intent in matcher.match("Good morning! I grow chemical-free beans")}
+    assert found == {"greeting": ["good morning"], "organic": ["chemical free"]}
+
+
+def test_higher_score_wins(matcher):
+    # Two soil words beat one weather word mentioned first
+    assert categories(matcher, "Rain washed the compost and manure away") == ["soil", "weather"]
+
+
+def test_ties_go_to_the_first_mention(matcher):
+    assert categories(matcher, "soil and weather") == ["soil", "weather"]
+    assert categories(matcher, "weather and soil") == ["weather", "soil"]
+
+
+def test_ties_at_one_position_go_to_the_category_name():
+    matcher = IntentMatcher({
+        "zebra": {"patterns": ["maize"], "response": "z"},
+        "apple": {"patterns": ["maize seed"], "response": "a"},
+        "mango": {"patterns": ["maize"], "response": "m"},
+    })
+    # The longest phrase wins the position; a shared word goes to the first category to claim it
+    assert categories(matcher, "maize seed") == ["apple"]
+    assert matcher.response_for("maize") == "z"
+    same_start = IntentMatcher({
+        "zebra": {"patterns": [r"mai[z]e"], "response": "z"},
+        "apple": {"patterns": [r"maize?"], "response": "a"},
+    })
+    assert categories(same_start, "maize") == ["apple", "zebra"]
+
+
+def test_weighted_categories_lose_ties(matcher):
+    # Greetings weigh half, so a greeting never outranks a farming topic
+    assert categories(matcher, "Hello, how is the weather?") == ["weather", "greeting"]
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import pytest
+from google.api_core.exceptions import InvalidArgument, ServiceUnavailable
+
+from app.llm import LLMClient
+from app.llm_pool import CLOSED, HALF_OPEN, OPEN, AllBackendsFailed, CircuitBreaker, LLMPool
+from benchmarks.fake_model import FakeResponse
+
+pytestmark = pytest.mark.anyio
+
+
+class ScriptedModel:
+    """Async model that works through ``outcomes`` one call at a time.
+
+    An exception is raised, a number is how long the call takes; once the
+    script runs out every call answers at once. Answers are the model's name.
+    """
+
+    def __init__(self, name, *outcomes):
+        self.name = name
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else 0
+        if isinstance(outcome, Exception):
+            raise outcome
+        await asyncio.sleep(outcome)
+        return FakeResponse(self.name)
+
+
+@pytest.fixture
+def client():
+    client = LLMClient(max_concurrency=8, timeout=5)
+    yield client
+    client.shutdown()
+
+
+@pytest.fixture
+def pool(client):
+    def build(*models, **options):
+        options = {"max_retries": 2, "backoff_base": 0, "failure_threshold": 3, **options}
+        pool = LLMPool(client, **options)
+        pool.set_backends([(model.name, model) for model in models])
+        return pool
+    return build
+
+
+def overloaded():
+    return ServiceUnavailable("The model is overloaded")
+
+
+async def answer(pool):
+    return (await pool.generate("How deep should I plant beans?")).text
+
+
+def test_breaker_opens_and_closes_again():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    now[0] = 10
+    # One probe at a time once the timeout is up
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.trips == 2 and not breaker.allow()
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+async def test_retryable_errors_are_retried_on_the_same_tier(pool):
+    primary = ScriptedModel("primary", overloaded(), overloaded())
+    secondary = ScriptedModel("secondary")
+    llm_pool = pool(primary, secondary)
+    assert await answer(llm_pool) == "primary"
+    assert (primary.calls, secondary.calls, llm_pool.retries) == (3, 0, 2)
+    assert llm_pool.backends[0].breaker.failures == 0
+
+
+async def test_other_errors_go_straight_to_the_next_tier(pool):
+    primary = ScriptedModel("primary", InvalidArgument("Request too large"), ValueError("Response was blocked"))
+    secondary = ScriptedModel("secondary")
+    llm_pool = pool(primary, secondary, failure_threshold=1)
+    assert await answer(llm_pool) == "secondary"
+    assert await answer(llm_pool) == "secondary"
+    assert (primary.calls, llm_pool.retries) == (2, 0)
+    # A bad request says nothing about the tier's health
+    assert llm_pool.backends[0].breaker.state == CLOSED
+    assert await answer(llm_pool) == "primary"
+
+
+async def test_falls_through_the_tiers(pool):
+    tiers = [ScriptedModel("pro", *[overloaded()] * 3), ScriptedModel("flash", *[overloaded()] * 3), ScriptedModel("lite")]
+    llm_pool = pool(*tiers)
+    assert await answer(llm_pool) == "lite"
+    assert [model.calls for model in tiers] == [3, 3, 1]
+
+
+async def test_open_breaker_is_skipped_until_it_resets(pool):
+    primary = ScriptedModel("primary", *[overloaded()] * 3)
+    secondary = ScriptedModel("secondary")
+    llm_pool = pool(primary, secondary, max_retries=5, reset_timeout=60)
+    # The breaker opens after three failures, before the retries run out
+    assert await answer(llm_pool) == "secondary"
+    assert primary.calls == 3 and llm_pool.backends[0].breaker.state == OPEN
+    assert await answer(llm_pool) == "secondary"
+    assert primary.calls == 3
+
+    secondary.outcomes = [overloaded()] * 3
+    with pytest.raises(AllBackendsFailed) as failed:
+        await answer(llm_pool)
+    assert failed.value.errors[0] == "primary: circuit open"
+    assert llm_pool.exhausted == 1
+
+
+async def test_hedge_fires_after_the_recent_p95(pool):
+    primary = ScriptedModel("primary", *[0.01] * 5)
+    secondary = ScriptedModel("secondary")
+    llm_pool = pool(primary, secondary, hedge=True, hedge_min_samples=5)
+    for _ in range(5):
+        assert await answer(llm_pool) == "primary"
+    assert llm_pool.hedges == 0
+
+    primary.outcomes = [2.0]
+    start = time.perf_counter()
+    assert await answer(llm_pool) == "secondary"
+    assert time.perf_counter() - start < 0.5
+    assert (llm_pool.hedges, llm_pool.hedge_wins, secondary.calls) == (1, 1, 1)
+
+
+async def test_no_hedge_before_enough_samples(pool):
+    primary = ScriptedModel("primary", 0.01, 0.2)
+    secondary = ScriptedModel("secondary")
+    llm_pool = pool(primary, secondary, hedge=True, hedge_min_samples=5)
+    assert await answer(llm_pool) == "primary"
+    assert await answer(llm_pool) == "primary"
+    assert (llm_pool.hedges, secondary.calls) == (0, 0)
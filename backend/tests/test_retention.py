@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import MemoryChatStore
+from app.retention import RetentionManager, RetentionPolicy, SessionArchive
+
+START = datetime(2026, 3, 1, 6, 30)
+
+
+def messages(first: int, last: int) -> list:
+    return [
+        {"sender": "user" if i % 2 else "assistant", "text": f"turn {i}", "timestamp": START + timedelta(minutes=i)}
+        for i in range(first, last + 1)
+    ]
+
+
+@pytest.fixture
+def retention(tmp_path):
+    store = MemoryChatStore()
+    manager = RetentionManager(store, SessionArchive(str(tmp_path)), RetentionPolicy(max_messages_per_session=10))
+    store.create_session("chat-1", "Long chat", START)
+    # Capped at 10, trimmed back to 9 twice
+    for turn in range(1, 26, 2):
+        ids = store.add_messages("chat-1", messages(turn, turn + 1))
+        manager.after_append("chat-1", ids[-1])
+    return manager
+
+
+def ids(found):
+    return [message["id"] for message in found]
+
+
+def test_trimmed_messages_stay_in_history(retention):
+    live = ids(retention.store.get_messages("chat-1"))
+    assert live[-1] == 26 and len(live) < 26
+    assert retention.trimmed_messages == live[0] - 1
+
+    assert ids(retention.get_messages("chat-1")) == list(range(1, 27))
+    assert ids(retention.get_messages("chat-1", limit=5)) == list(range(22, 27))
+    # Windows reaching past the oldest live id continue into the archive
+    assert ids(retention.get_messages("chat-1", limit=5, before=live[0] + 2)) == list(range(live[0] - 3, live[0] + 2))
+    assert ids(retention.get_messages("chat-1", limit=4, before=5)) == [1, 2, 3, 4]
+    assert ids(retention.get_messages("chat-1", before=3)) == [1, 2]
+    assert ids(retention.get_messages("chat-1", limit=3, after=2)) == [3, 4, 5]
+    assert ids(retention.get_messages("chat-1", limit=3, after=live[0] - 2)) == [live[0] - 1, live[0], live[0] + 1]
+    assert retention.get_messages("chat-1", after=1)[0] == {
+        "id": 2, "sender": "assistant", "text": "turn 2", "timestamp": START + timedelta(minutes=2),
+    }
+
+
+def test_trimmed_messages_survive_a_restart(retention, tmp_path):
+    reopened = SessionArchive(str(tmp_path))
+    assert ids(reopened.read_trimmed("chat-1")) == list(range(1, retention.store.get_messages("chat-1")[0]["id"]))
+    assert ids(reopened.read_trimmed("chat-1", before=6, limit=2)) == [4, 5]
+
+
+def test_forget_drops_trimmed_messages(retention, tmp_path):
+    assert retention.forget("chat-1")
+    assert not retention.archive.has_trimmed("chat-1")
+    assert not SessionArchive(str(tmp_path)).has_trimmed("chat-1")
+    assert not retention.forget("chat-1")
+
+
+@pytest.mark.anyio
+async def test_enforce_archives_over_cap(tmp_path):
+    store = MemoryChatStore()
+    manager = RetentionManager(store, SessionArchive(str(tmp_path)), RetentionPolicy(max_sessions=2), batch_size=2)
+    for index in range(5):
+        store.create_session(f"chat-{index}", f"Chat {index}", START + timedelta(minutes=index))
+        store.add_messages(f"chat-{index}", messages(1, 2))
+    report = await manager.enforce()
+    assert report["archived_over_cap"] == 3
+    assert [s["chat_id"] for s in store.list_sessions()] == ["chat-4", "chat-3"]
+    assert [s["chat_id"] for s in manager.list_sessions()] == [f"chat-{index}" for index in range(4, -1, -1)]
+    assert manager.rehydrate("chat-0")["message_count"] == 2
+
+
+def test_failed_archive_write_keeps_the_messages(tmp_path, monkeypatch):
+    store = MemoryChatStore()
+    manager = RetentionManager(store, SessionArchive(str(tmp_path)), RetentionPolicy(max_messages_per_session=10))
+    store.create_session("chat-1", "Long chat", START)
+    store.add_messages("chat-1", messages(1, 10))
+
+    def full_disk(chat_id, dropped):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(manager.archive, "add_trimmed", full_disk)
+    manager.after_append("chat-1", store.add_messages("chat-1", messages(11, 12))[-1])
+    assert ids(store.get_messages("chat-1")) == list(range(1, 13))
+
+    monkeypatch.undo()
+    manager.after_append("chat-1", store.add_messages("chat-1", messages(13, 14))[-1])
+    assert ids(manager.get_messages("chat-1")) == list(range(1, 15))
+    assert manager.trimmed_messages == 14 - len(store.get_messages("chat-1"))
+
+
+@pytest.mark.anyio
+async def test_enforce_leaves_recently_updated_sessions(tmp_path):
+    store = MemoryChatStore()
+    policy = RetentionPolicy(max_sessions=1, active_seconds=60)
+    manager = RetentionManager(store, SessionArchive(str(tmp_path)), policy)
+    store.create_session("chat-old", "Old", START)
+    store.create_session("chat-busy", "Busy", START - timedelta(minutes=1))
+    # Another worker is answering in chat-busy right now
+    store.update_session("chat-busy", updated_at=datetime.now())
+    store.create_session("chat-new", "New", datetime.now())
+    report = await manager.enforce()
+    assert report["archived_over_cap"] == 1
+    assert sorted(s["chat_id"] for s in store.list_sessions()) == ["chat-busy", "chat-new"]
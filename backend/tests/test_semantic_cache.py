@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from app.semantic_cache import HashingVectorizer, SemanticCache, key_terms
+
+PAIRS_PATH = os.path.join(os.path.dirname(__file__), "data", "semantic_pairs.json")
+
+
+def load_pairs():
+    with open(PAIRS_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def served(cached_question, question, threshold=None):
+    cache = SemanticCache(max_entries=8) if threshold is None else SemanticCache(max_entries=8, threshold=threshold)
+    cache.add(cached_question, "cached answer")
+    return cache.get(question) is not None
+
+
+def test_paraphrase_is_served():
+    assert served("how do I stop aphids on tomatoes", "aphids attacking my tomato plants")
+
+
+@pytest.mark.parametrize("cached_question, question", [
+    ("how much fertilizer for maize per acre", "how much fertilizer for rice per acre"),
+    ("treat blight on potatoes", "treat blight on tomatoes"),
+    ("when to plant beans after the rains", "when to harvest beans after the rains"),
+])
+def test_question_about_something_else_is_not_served(cached_question, question):
+    assert not served(cached_question, question)
+
+
+def test_key_terms():
+    assert key_terms("Corn stalk borer") == key_terms("borers in my maize")
+    # "plants" is a noun here, not the action of planting
+    assert key_terms("aphids attacking my tomato plants") == (frozenset({"aphid", "tomato"}), frozenset())
+    assert key_terms("when to plant beans")[1] == {"plant"}
+
+
+def test_labelled_pairs():
+    # The default threshold is tuned on this set; see benchmarks/tune_semantic_threshold.py
+    pairs = load_pairs()
+    hits = [served(a, b) for a, b in pairs["paraphrases"]]
+    false_hits = [served(a, b) for a, b in pairs["different"]]
+    assert sum(hits) / len(hits) >= 0.9
+    assert sum(false_hits) / len(false_hits) <= 0.1
+
+
+def test_key_terms_survive_save_and_load(tmp_path):
+    path = str(tmp_path / "semantic_cache.npz")
+    cache = SemanticCache(max_entries=8)
+    cache.add("how much fertilizer for maize per acre", "maize answer")
+    cache.save(path)
+
+    reloaded = SemanticCache(max_entries=8, vectorizer=HashingVectorizer())
+    reloaded.load(path)
+    assert reloaded.get("how much fertilizer for rice per acre") is None
+    assert reloaded.get("fertilizer for maize, how much per acre") == "maize answer"
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.serialization import EncodedBody, HistoryCache, ResponseEncoder, accepts_gzip, dumps
+
+
+def stdlib(content) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+@pytest.mark.parametrize("content", [
+    {"when": datetime(2026, 3, 1, 6, 30)},
+    {"when": datetime(2026, 3, 1, 6, 30, 5, 120)},
+    {"when": datetime(2026, 3, 1, 6, 30, tzinfo=timezone.utc)},
+    {"when": datetime(2026, 3, 1, 6, 30, 5, 999999, tzinfo=timezone(timedelta(hours=5, minutes=30)))},
+    {"text": "Jembe la mkono, mbolea ya samadi — 15-30°C, pH 6.0–7.0 🌱"},
+    {"text": "किसान भाई, गेहूं की बुवाई नवंबर में करें"},
+    {"text": "Quotes \" and \\ back\\slashes, <b>tags</b> & ampersands"},
+    {"text": "Control \n\t\r\x00\x1f\x7f characters and \u2028\u2029 line separators"},
+    {"empty": "", "none": None, "flags": [True, False], "count": 0, "big": 2 ** 53 + 1, "negative": -7},
+    [],
+    {},
+])
+def test_matches_the_default_response(content):
+    assert dumps(content) == stdlib(content)
+
+
+def test_matches_the_default_response_for_a_history_page():
+    start = datetime(2026, 3, 1, 6, 30, 0, 250000)
+    messages = [
+        {
+            "id": index,
+            "sender": "user" if index % 2 else "assistant",
+            "text": f"Turn {index}: mbolea ya samadi 🌽 ok",
+            "timestamp": start + timedelta(seconds=index, microseconds=index),
+        }
+        for index in range(1, 51)
+    ]
+    payload = {
+        "chat_id": "6650f3c2a1b2c3d4e5f60718",
+        "title": "Mahindi — maize spacing",
+        "created_at": start,
+        "updated_at": messages[-1]["timestamp"],
+        "messages": messages,
+        "nested": {"pages": [{"before": 1, "sessions": [{"chat_id": "a", "updated_at": start}]}]},
+        "next_before": None,
+    }
+    assert dumps(payload) == stdlib(payload)
+
+
+@pytest.mark.parametrize("header, accepted", [
+    ("gzip, deflate, br", True),
+    ("br;q=1.0, gzip;q=0.8", True),
+    ("gzip;q=0", False),
+    ("*", True),
+    ("identity", False),
+    (None, False),
+])
+def test_accepts_gzip(header, accepted):
+    assert accepts_gzip(header) is accepted
+
+
+def test_history_cache_evicts_oldest_and_invalidates_by_chat():
+    cache = HistoryCache(max_bytes=400)
+    body = EncodedBody(b"x" * 100)
+    cache.put("chat-1", "etag-1", body)
+    cache.put("chat-2", "etag-1", body)
+    cache.put("chat-1", "etag-2", body)
+    cache.put("chat-3", "etag-1", body)
+    cache.put("chat-4", "etag-1", body)
+    assert cache.get("chat-1", "etag-1") is None and cache.bytes == 400
+    cache.invalidate("chat-1")
+    assert cache.get("chat-1", "etag-2") is None and len(cache) == 3
+    # Bodies over a quarter of the cache are never kept
+    cache.put("chat-5", "etag-1", EncodedBody(b"x" * 101))
+    assert cache.get("chat-5", "etag-1") is None
+
+
+def test_large_bodies_go_out_gzipped_to_clients_that_accept_it():
+    encoder = ResponseEncoder(gzip_min_bytes=64)
+    encoded = encoder.encode(dumps({"text": "mbolea " * 40}))
+    assert encoder.response(encoded, "gzip").headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in encoder.response(encoded, None).headers
+    small = encoder.encode(dumps({"text": "ok"}))
+    assert small.gzipped is None and "Vary" not in encoder.response(small, "gzip").headers
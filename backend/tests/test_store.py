@@ -0,0 +1,376 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.admission import AdmissionController, LLMGate, RateLimit, Rejected, StoreTokenBuckets
+from app.database import MemoryChatStore, MongoChatStore, SQLiteChatStore, import_legacy_json
+from app.invalidation import InvalidationBus
+
+START = datetime(2026, 3, 1, 6, 30)
+
+
+def at(minutes: float) -> datetime:
+    return START + timedelta(minutes=minutes)
+
+
+def message(sender: str, text: str, minutes: float = 0) -> dict:
+    return {"sender": sender, "text": text, "timestamp": at(minutes)}
+
+
+@pytest.fixture(params=["memory", "sqlite", "mongomock"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        store = MemoryChatStore(full_text=True)
+    elif request.param == "sqlite":
+        store = SQLiteChatStore(str(tmp_path / "chats.db"))
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        monkeypatch.setattr("pymongo.MongoClient", mongomock.MongoClient)
+        store = MongoChatStore("mongodb://localhost")
+    yield store
+    store.close()
+
+
+def skip_on(store, *kinds, reason):
+    if type(store).__name__ in kinds:
+        pytest.skip(reason)
+
+
+def test_sessions(store):
+    session = store.create_session("chat-1", "Aphids", at(0))
+    assert session == {
+        "chat_id": "chat-1", "title": "Aphids", "created_at": at(0), "updated_at": at(0), "message_count": 0,
+    }
+    assert store.get_session("chat-1") == session
+    assert store.get_session("missing") is None
+
+    assert store.update_session("chat-1", title="Aphids on maize", updated_at=at(5))
+    assert not store.update_session("missing", title="Nothing")
+    assert store.get_session("chat-1")["title"] == "Aphids on maize"
+    assert store.get_session("chat-1")["updated_at"] == at(5)
+
+    store.create_session("chat-2", "Blight", at(1))
+    assert store.count_sessions() == 2
+    assert [s["chat_id"] for s in store.list_sessions()] == ["chat-1", "chat-2"]
+    assert [s["chat_id"] for s in store.coldest_sessions(1)] == ["chat-2"]
+
+
+def test_add_messages_returns_consecutive_ids(store):
+    store.create_session("chat-1", "Aphids", at(0))
+    assert store.add_messages("chat-1", [message("user", "aphids?", 1), message("assistant", "neem", 2)]) == [1, 2]
+    assert store.add_messages("chat-1", [message("user", "how much?", 3)]) == [3]
+
+    session = store.get_session("chat-1")
+    assert session["message_count"] == 3
+    assert session["updated_at"] == at(3)
+
+    store.update_message_text("chat-1", 2, "neem oil, 5 ml per litre")
+    assert [m["text"] for m in store.get_messages("chat-1")] == ["aphids?", "neem oil, 5 ml per litre", "how much?"]
+    assert store.get_messages("chat-1")[0] == {"id": 1, "sender": "user", "text": "aphids?", "timestamp": at(1)}
+
+
+def test_message_windows(store):
+    store.create_session("chat-1", "Long chat", at(0))
+    store.add_messages("chat-1", [message("user", f"turn {i}", i) for i in range(1, 11)])
+
+    def ids(**window):
+        return [m["id"] for m in store.get_messages("chat-1", **window)]
+
+    assert ids() == list(range(1, 11))
+    assert ids(limit=3) == [8, 9, 10]
+    assert ids(limit=3, before=8) == [5, 6, 7]
+    assert ids(before=3) == [1, 2]
+    assert ids(limit=2, after=7) == [8, 9]
+    assert ids(after=10) == []
+    assert store.get_messages("missing") == []
+
+
+def test_list_sessions_pages_with_cursor(store):
+    # Two sessions share an updated_at; the chat_id breaks the tie
+    for index, minutes in enumerate([1, 2, 3, 3, 4, 5, 6]):
+        store.create_session(f"chat-{index}", f"Chat {index}", at(minutes))
+    everything = store.list_sessions()
+    assert [s["chat_id"] for s in everything] == [f"chat-{i}" for i in (6, 5, 4, 3, 2, 1, 0)]
+
+    pages, before = [], None
+    while True:
+        page = store.list_sessions(limit=2, before=before)
+        if not page:
+            break
+        pages.append([s["chat_id"] for s in page])
+        before = (page[-1]["updated_at"], page[-1]["chat_id"])
+    assert pages == [["chat-6", "chat-5"], ["chat-4", "chat-3"], ["chat-2", "chat-1"], ["chat-0"]]
+
+
+def test_delete_session(store):
+    store.create_session("chat-1", "Aphids", at(0))
+    store.add_messages("chat-1", [message("user", "aphids on maize", 1)])
+    store.create_session("chat-2", "Blight", at(0))
+
+    assert store.delete_session("chat-1")
+    assert not store.delete_session("chat-1")
+    assert store.get_session("chat-1") is None
+    assert store.get_messages("chat-1") == []
+    assert [s["chat_id"] for s in store.list_sessions()] == ["chat-2"]
+    assert store.count_sessions() == 1
+
+
+def test_add_messages_to_missing_session(store):
+    store.create_session("chat-1", "Aphids", at(0))
+    store.delete_session("chat-1")
+    with pytest.raises(KeyError):
+        store.add_messages("chat-1", [message("user", "aphids on maize", 1)])
+    with pytest.raises(KeyError):
+        store.add_messages("chat-2", [message("user", "aphids on beans", 1)])
+    assert store.get_messages("chat-1") == []
+    assert store.count_sessions() == 0
+    if not isinstance(store, MongoChatStore):  # mongomock has no $text search
+        assert store.search_messages("aphids") == []
+
+
+def test_memory_store_keeps_one_copy_of_shared_texts():
+    canned = "Spray neem oil in the evening."
+    store = MemoryChatStore(shared_texts=[canned])
+    store.create_session("chat-1", "Aphids", at(0))
+    store.add_messages("chat-1", [message("assistant", "".join(list(canned)), 1), message("user", "thanks", 2)])
+    store.add_messages("chat-1", [message("assistant", "", 3)])
+    store.update_message_text("chat-1", 3, "Spray neem oil" + " in the evening.")
+    texts = store.messages["chat-1"].texts
+    assert texts[0] is canned and texts[2] is canned
+    assert [m["text"] for m in store.get_messages("chat-1")] == [canned, "thanks", canned]
+
+
+def test_trim_and_import(store):
+    store.create_session("chat-1", "Long chat", at(0))
+    store.add_messages("chat-1", [message("user", f"turn {i}", i) for i in range(1, 6)])
+    dropped = store.trim_messages("chat-1", 2)
+    assert [m["id"] for m in dropped] == [1, 2, 3]
+    assert [m["id"] for m in store.get_messages("chat-1")] == [4, 5]
+    assert store.get_session("chat-1")["message_count"] == 2
+
+    # Imported sessions keep their ids, and new messages carry on after them
+    session = {"chat_id": "chat-2", "title": "Archived", "created_at": at(0), "updated_at": at(9)}
+    store.import_session(session, [dict(message("user", "old", 8), id=7), dict(message("assistant", "reply", 9), id=8)])
+    assert [m["id"] for m in store.get_messages("chat-2")] == [7, 8]
+    assert store.add_messages("chat-2", [message("user", "new", 10)]) == [9]
+
+
+def test_legacy_import_runs_once(store, tmp_path):
+    chats = {
+        "chat-1": [
+            {"sender": "user", "text": "aphids", "timestamp": at(1).isoformat()},
+            {"sender": "assistant", "text": "neem oil", "timestamp": at(2).isoformat()},
+        ],
+    }
+    sessions = {
+        chat_id: {"title": "Aphids", "created_at": at(0).isoformat(), "updated_at": at(2).isoformat()}
+        for chat_id in ("chat-1", "chat-2")
+    }
+    (tmp_path / "sessions.json").write_text(json.dumps(sessions))
+    (tmp_path / "chats.json").write_text(json.dumps(chats))
+
+    assert import_legacy_json(store, str(tmp_path)) == 2
+    assert [m["text"] for m in store.get_messages("chat-1")] == ["aphids", "neem oil"]
+    assert store.get_session("chat-1")["updated_at"] == at(2)
+    # Chats deleted after the import stay deleted
+    store.delete_session("chat-1")
+    store.delete_session("chat-2")
+    assert import_legacy_json(store, str(tmp_path)) == 0
+    assert store.count_sessions() == 0
+
+
+def test_search(store):
+    skip_on(store, "MongoChatStore", reason="mongomock has no $text search")
+    store.create_session("chat-1", "Maize", at(0))
+    store.add_messages("chat-1", [
+        message("user", "Aphids are all over my maize", 1),
+        message("assistant", "Spray neem oil on the maize leaves", 2),
+    ])
+    store.create_session("chat-2", "Beans", at(0))
+    store.add_messages("chat-2", [message("user", "Aphids on my beans too", 3)])
+
+    assert len(store.search_messages("maize")) == 2
+    # Every word must appear
+    hits = store.search_messages("aphids maize")
+    assert [(hit["chat_id"], hit["message_id"]) for hit in hits] == [("chat-1", 1)]
+    assert {hit["chat_id"] for hit in store.search_messages("aphids", chat_id="chat-2")} == {"chat-2"}
+    assert store.search_messages("cassava") == []
+
+    hit = hits[0]
+    assert hit["sender"] == "user" and hit["timestamp"] == at(1)
+    assert [hit["snippet"][start:end].lower() for start, end in hit["highlights"]] == ["aphids", "maize"]
+
+    def found(hits):
+        return [(hit["chat_id"], hit["message_id"]) for hit in hits]
+
+    everything = found(store.search_messages("aphids"))
+    assert len(everything) == 2
+    pages = store.search_messages("aphids", limit=1) + store.search_messages("aphids", limit=1, offset=1)
+    assert found(pages) == everything
+
+
+def test_take_tokens(store):
+    # Burst of 2, one token a second
+    assert store.take_tokens("client:a", 1.0, 2.0, 1.0, 100.0) == (True, 1.0)
+    assert store.take_tokens("client:a", 1.0, 2.0, 1.0, 100.0) == (True, 0.0)
+    assert store.take_tokens("client:a", 1.0, 2.0, 1.0, 100.0)[0] is False
+    assert store.take_tokens("client:b", 1.0, 2.0, 1.0, 100.0)[0] is True
+    allowed, tokens = store.take_tokens("client:a", 1.0, 2.0, 1.0, 101.5)
+    assert allowed and tokens == pytest.approx(0.5)
+
+
+def test_jobs(store):
+    job = store.create_job("job-1", ["aphids?", "blight?", "rust?"], "worker-a", at(0))
+    assert (job["status"], job["total"], job["completed"], job["owner"]) == ("running", 3, 0, "worker-a")
+    assert [item["index"] for item in store.job_items("job-1", pending=True)] == [0, 1, 2]
+
+    store.complete_job_items("job-1", [(2, "fungicide", "model")], at(1))
+    store.complete_job_items("job-1", [(0, "neem", "cache")], at(2))
+    assert store.get_job("job-1")["completed"] == 2
+    assert [item["index"] for item in store.job_items("job-1", pending=True)] == [1]
+    # Answers in the order they landed
+    answered = store.job_items("job-1", after_seq=0)
+    assert [(item["index"], item["response"], item["source"]) for item in answered] == [
+        (2, "fungicide", "model"), (0, "neem", "cache"),
+    ]
+    assert [item["index"] for item in store.job_items("job-1", after_seq=answered[0]["seq"])] == [0]
+
+    # A job whose owner stopped checking in is claimed by one worker only
+    assert [job["job_id"] for job in store.stale_jobs(at(5))] == ["job-1"]
+    assert store.claim_job("job-1", "worker-b", at(6), at(5))
+    assert not store.claim_job("job-1", "worker-c", at(6), at(5))
+    assert store.get_job("job-1")["owner"] == "worker-b"
+
+    assert store.update_job("job-1", status="done", updated_at=at(7))
+    assert store.stale_jobs(at(10)) == []
+    assert store.get_job("missing") is None
+
+
+def test_purge_jobs(store):
+    for number, status in enumerate(["done", "failed", "running", "done"]):
+        job_id = f"job-{number}"
+        store.create_job(job_id, ["aphids?", "blight?"], "worker-a", at(0))
+        store.update_job(job_id, status=status, updated_at=at(number))
+    # Finished before minute 3: jobs 0 and 1; job 2 is still running
+    assert store.purge_jobs(at(3), limit=1) == 1
+    assert store.purge_jobs(at(3)) == 1
+    assert store.purge_jobs(at(3)) == 0
+    assert [store.get_job(f"job-{number}") is None for number in range(4)] == [True, True, False, False]
+    assert store.job_items("job-0") == [] and len(store.job_items("job-3")) == 2
+
+
+def test_events(store):
+    skip_on(store, "MemoryChatStore", reason="a process-local store has nobody to tell")
+    _, cursor = store.read_events()
+    store.publish_event("chat_deleted", "chat-1", "worker-a")
+    store.publish_event("cache_cleared", "", "worker-b")
+    events, _ = store.read_events(cursor)
+    assert [(e["kind"], e["key"], e["origin"]) for e in events] == [
+        ("chat_deleted", "chat-1", "worker-a"), ("cache_cleared", "", "worker-b"),
+    ]
+
+
+def test_size(store):
+    skip_on(store, "MongoChatStore", reason="mongomock has no dbStats")
+    store.create_session("chat-1", "Aphids", at(0))
+    store.add_messages("chat-1", [message("user", "aphids?", 1), message("assistant", "neem", 2)])
+    size = store.size()
+    assert (size["sessions"], size["messages"]) == (1, 2)
+    assert size["bytes"] > 0
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.fixture(params=["memory", "sqlite", "sqlite, two connections"])
+def shared_stores(request, tmp_path):
+    """Several handles on one store, as threads or workers see it"""
+    if request.param == "memory":
+        stores = [MemoryChatStore()] * 2
+    elif request.param == "sqlite":
+        stores = [SQLiteChatStore(str(tmp_path / "chats.db"))] * 2
+    else:
+        stores = [SQLiteChatStore(str(tmp_path / "chats.db")) for _ in range(2)]
+    yield stores
+    for store in set(stores):
+        store.close()
+
+
+def test_concurrent_appends_get_distinct_ids(shared_stores):
+    shared_stores[0].create_session("chat-1", "Busy chat", at(0))
+    ids = []
+
+    def append(index):
+        store = shared_stores[index % 2]
+        for turn in range(20):
+            ids.extend(store.add_messages("chat-1", [message("user", f"{index}.{turn}"), message("assistant", "ok")]))
+
+    run_threads(8, append)
+    assert sorted(ids) == list(range(1, 321))
+    assert [m["id"] for m in shared_stores[1].get_messages("chat-1")] == list(range(1, 321))
+    assert shared_stores[1].get_session("chat-1")["message_count"] == 320
+
+
+def test_concurrent_token_takes_share_one_bucket(shared_stores):
+    allowed = []
+
+    def take(index):
+        store = shared_stores[index % 2]
+        for _ in range(25):
+            if store.take_tokens("client:flood", 0.001, 20.0, 1.0, 100.0)[0]:
+                allowed.append(index)
+
+    run_threads(8, take)
+    assert len(allowed) == 20
+
+
+@pytest.mark.anyio
+async def test_store_backed_limits_are_shared_by_workers(tmp_path):
+    stores = [SQLiteChatStore(str(tmp_path / "chats.db")) for _ in range(2)]
+    workers = [
+        AdmissionController(
+            StoreTokenBuckets(store),
+            per_client=RateLimit("client", 60, 5),
+            per_chat=RateLimit("chat", 0, 0),
+            llm_quota=RateLimit("llm_quota", 0, 0),
+            gate=LLMGate(),
+        )
+        for store in stores
+    ]
+    allowed = 0
+    for attempt in range(20):
+        try:
+            await workers[attempt % 2].check("10.9.9.9")
+            allowed += 1
+        except Rejected as rejection:
+            assert rejection.status_code == 429 and rejection.retry_after >= 1
+    assert allowed == 5
+    for store in stores:
+        store.close()
+
+
+@pytest.mark.anyio
+async def test_invalidations_reach_other_workers(tmp_path):
+    stores = [SQLiteChatStore(str(tmp_path / "chats.db")) for _ in range(2)]
+    buses = [InvalidationBus(store) for store in stores]
+    seen = [[], []]
+    for bus, worker_seen in zip(buses, seen):
+        bus.subscribe("chat_deleted", worker_seen.append)
+        bus.poll()
+
+    await buses[0].publish("chat_deleted", "chat-1")
+    # Handlers run at once on the publishing worker, and on the others when they poll
+    assert seen == [["chat-1"], []]
+    assert buses[1].poll() == 1
+    assert buses[0].poll() == 0
+    assert buses[1].poll() == 0
+    assert seen == [["chat-1"], ["chat-1"]]
+    for store in stores:
+        store.close()
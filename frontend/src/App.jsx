@@ -26,7 +26,7 @@ function App() {
 
   const loadChats = async () => {
     try {
-      const response = await fetch("http://localhost:8001/chats");
+      const response = await fetch("http://localhost:8001/chats?limit=30");
       const data = await response.json();
       setChats(data.sessions);
     } catch (error) {
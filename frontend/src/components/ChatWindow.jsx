@@ -3,13 +3,16 @@ import { Send, Bot, User, Loader, MessageSquare } from "lucide-react";
 import axios from "axios";
 
 const API_BASE_URL = "http://localhost:8001";
+const HISTORY_PAGE_SIZE = 50;
 
 export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentChatId, chats, setChats, loadChats }) {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState("");
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const [error, setError] = useState("");
   const [chatTitle, setChatTitle] = useState("Farming Assistant");
+  const [hasMoreHistory, setHasMoreHistory] = useState(false);
   const messagesEndRef = useRef(null);
 
   // Load chat history when component mounts or chatId changes
@@ -25,6 +28,7 @@ export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentCha
         }
       ]);
       setChatTitle("Farming Assistant");
+      setHasMoreHistory(false);
     }
   }, [currentChatId]);
 
@@ -40,18 +44,14 @@ export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentCha
     try {
       setIsLoading(true);
       setError("");
-      const response = await axios.get(`${API_BASE_URL}/chats/${chatId}`);
+      // Only the most recent messages; older ones load on demand
+      const response = await axios.get(`${API_BASE_URL}/chats/${chatId}`, {
+        params: { limit: HISTORY_PAGE_SIZE }
+      });
       const chatData = response.data;
       
-      // Convert backend format to frontend format
-      const formattedMessages = chatData.messages.map((msg, index) => ({
-        id: index + 1,
-        sender: msg.sender === "user" ? "user" : "bot",
-        text: msg.text,
-        timestamp: msg.timestamp
-      }));
-      
-      setMessages(formattedMessages);
+      setMessages(chatData.messages.map(formatMessage));
+      setHasMoreHistory(chatData.has_more);
       setChatTitle(chatData.title || "Farming Assistant");
     } catch (error) {
       console.error("Error loading chat history:", error);
@@ -64,13 +64,36 @@ export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentCha
         }
       ]);
       setChatTitle("Farming Assistant");
+      setHasMoreHistory(false);
     } finally {
       setIsLoading(false);
     }
   };
 
+  // Convert backend format to frontend format
+  const formatMessage = (msg) => ({
+    id: msg.id,
+    sender: msg.sender === "user" ? "user" : "bot",
+    text: msg.text,
+    timestamp: msg.timestamp
+  });
+
+  const loadEarlierMessages = async () => {
+    if (!currentChatId || messages.length === 0) return;
+
+    try {
+      const response = await axios.get(`${API_BASE_URL}/chats/${currentChatId}`, {
+        params: { limit: HISTORY_PAGE_SIZE, before: messages[0].id }
+      });
+      setMessages(prev => [...response.data.messages.map(formatMessage), ...prev]);
+      setHasMoreHistory(response.data.has_more);
+    } catch (error) {
+      console.error("Error loading earlier messages:", error);
+    }
+  };
+
   const sendMessage = async () => {
-    if (!input.trim() || isLoading) return;
+    if (!input.trim() || isLoading || isStreaming) return;
     
     // Add user message to UI immediately
     const userMessage = { 
@@ -84,26 +107,67 @@ export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentCha
     setIsLoading(true);
     setError("");
     
+    const messageText = input;
+    const aiMessageId = Date.now() + 1;
+
     try {
-      // Send message to backend
-      const response = await axios.post(`${API_BASE_URL}/chat`, {
-        message: input,
-        chat_id: currentChatId
+      // Stream the answer from the backend as Server-Sent Events
+      const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ message: messageText, chat_id: currentChatId })
       });
-      
-      // Add AI response to UI
-      const aiMessage = { 
-        id: Date.now() + 1, 
-        sender: "bot", 
-        text: response.data.response,
+      if (!response.ok || !response.body) {
+        throw new Error(`Request failed with status ${response.status}`);
+      }
+
+      // Add an empty AI message and grow it as chunks arrive
+      setMessages(prev => [...prev, {
+        id: aiMessageId,
+        sender: "bot",
+        text: "",
         timestamp: new Date().toISOString()
+      }]);
+      setIsLoading(false);
+      setIsStreaming(true);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let meta = null;
+
+      const handleEvent = (rawEvent) => {
+        let eventName = "message";
+        let data = "";
+        for (const line of rawEvent.split("\n")) {
+          if (line.startsWith("event:")) eventName = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        if (!data) return;
+        const payload = JSON.parse(data);
+
+        if (eventName === "meta") {
+          meta = payload;
+        } else if (eventName === "message") {
+          setMessages(prev => prev.map(msg =>
+            msg.id === aiMessageId ? { ...msg, text: msg.text + payload.delta } : msg
+          ));
+        }
       };
-      setMessages(prev => [...prev, aiMessage]);
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        events.forEach(handleEvent);
+      }
       
       // Set chat ID and title if this is a new chat
-      if (!currentChatId) {
-        setCurrentChatId(response.data.chat_id);
-        setChatTitle(response.data.chat_title);
+      if (!currentChatId && meta) {
+        setCurrentChatId(meta.chat_id);
+        setChatTitle(meta.chat_title);
       }
       
       // Refresh the chat list in sidebar
@@ -124,6 +188,7 @@ export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentCha
       setError("Connection error. Please check if the server is running.");
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -137,6 +202,7 @@ export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentCha
       }
     ]);
     setChatTitle("Farming Assistant");
+    setHasMoreHistory(false);
     setError("");
   };
 
@@ -172,6 +238,16 @@ export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentCha
 
       {/* Messages */}
       <div className="flex-1 overflow-y-auto p-4 space-y-4">
+        {hasMoreHistory && (
+          <div className="flex justify-center">
+            <button
+              onClick={loadEarlierMessages}
+              className="px-3 py-1 text-xs text-blue-600 dark:text-blue-400 hover:underline"
+            >
+              Load earlier messages
+            </button>
+          </div>
+        )}
         {messages.map(msg => (
           <div
             key={msg.id}
@@ -228,12 +304,12 @@ export default function ChatWindow({ isSidebarOpen, currentChatId, setCurrentCha
             onChange={e => setInput(e.target.value)}
             placeholder="Ask about farming, crops, or agriculture..."
             className="flex-1 p-3 rounded-l-lg border border-gray-300 dark:border-gray-600 bg-gray-50 dark:bg-gray-800 text-gray-900 dark:text-gray-100 focus:outline-none focus:ring-2 focus:ring-blue-500"
-            onKeyDown={(e) => e.key === "Enter" && !isLoading && sendMessage()}
-            disabled={isLoading}
+            onKeyDown={(e) => e.key === "Enter" && !isLoading && !isStreaming && sendMessage()}
+            disabled={isLoading || isStreaming}
           />
           <button
             onClick={sendMessage}
-            disabled={!input.trim() || isLoading}
+            disabled={!input.trim() || isLoading || isStreaming}
             className="p-3 bg-blue-500 text-white rounded-r-lg hover:bg-blue-600 disabled:opacity-50 disabled:cursor-not-allowed transition-colors flex items-center justify-center"
           >
             {isLoading ? (
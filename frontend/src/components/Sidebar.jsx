@@ -3,12 +3,15 @@ import { ArrowLeft, Plus, MoreHorizontal, MessageSquare, Trash2, Edit3, Sun, Moo
 import axios from "axios";
 
 const API_BASE_URL = "http://localhost:8001";
+const PAGE_SIZE = 30;
 
 export default function Sidebar({ isOpen, toggleSidebar, theme, toggleTheme, currentChatId, setCurrentChatId }) {
   const [chats, setChats] = useState([]);
   const [menuOpenId, setMenuOpenId] = useState(null);
   const [editingId, setEditingId] = useState(null);
   const [editingTitle, setEditingTitle] = useState("");
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const menuRef = useRef();
 
   useEffect(() => {
@@ -24,13 +27,44 @@ export default function Sidebar({ isOpen, toggleSidebar, theme, toggleTheme, cur
 
   const loadChats = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/chats`);
+      const response = await axios.get(`${API_BASE_URL}/chats`, {
+        params: { limit: PAGE_SIZE }
+      });
       setChats(response.data.sessions);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error("Error loading chats:", error);
     }
   };
 
+  const loadMoreChats = async () => {
+    if (!nextCursor || isLoadingMore) return;
+
+    setIsLoadingMore(true);
+    try {
+      const response = await axios.get(`${API_BASE_URL}/chats`, {
+        params: { limit: PAGE_SIZE, before: nextCursor }
+      });
+      setChats(prev => {
+        const known = new Set(prev.map(c => c.chat_id));
+        return [...prev, ...response.data.sessions.filter(c => !known.has(c.chat_id))];
+      });
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error("Error loading more chats:", error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
+  // Fetch the next page once the list is scrolled close to the bottom
+  const handleScroll = (event) => {
+    const { scrollTop, clientHeight, scrollHeight } = event.currentTarget;
+    if (scrollTop + clientHeight >= scrollHeight - 80) {
+      loadMoreChats();
+    }
+  };
+
   const addNewChat = () => {
     setCurrentChatId(null);
     setMenuOpenId(null);
@@ -118,7 +152,7 @@ export default function Sidebar({ isOpen, toggleSidebar, theme, toggleTheme, cur
         </button>
       </div>
 
-      <div className="flex-1 overflow-y-auto p-2 space-y-1">
+      <div className="flex-1 overflow-y-auto p-2 space-y-1" onScroll={handleScroll}>
         <div className="px-3 py-2 text-xs font-semibold text-gray-500 dark:text-gray-400 uppercase tracking-wider">
           {isOpen ? "Chat History" : ""}
         </div>
@@ -204,6 +238,9 @@ export default function Sidebar({ isOpen, toggleSidebar, theme, toggleTheme, cur
             )}
           </div>
         ))}
+        {isLoadingMore && isOpen && (
+          <div className="px-3 py-2 text-xs text-gray-500 dark:text-gray-400">Loading more chats...</div>
+        )}
       </div>
 
       <div className="p-3 border-t border-gray-200 dark:border-gray-700">